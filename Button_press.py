@@ -1,29 +1,23 @@
 import RPi.GPIO as GPIO
 import time
+from External_buttons import ButtonWatcher
 
 #Pins
 stop = 16
 go = 1
 pause = 14
 GPIO.setmode(GPIO.BCM)
-GPIO.setup(stop, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-GPIO.setup(go, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-GPIO.setup(pause, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+
+# Presses are reported from edge interrupts, once per press
+buttons = ButtonWatcher(GPIO)
+buttons.on_press(stop, lambda: print("Stop button pressed"))
+buttons.on_press(go, lambda: print("Go button pressed"))
+buttons.on_press(pause, lambda: print("Pause button pressed"))
 
 try:
     while True:
-        stop_state = GPIO.input(stop)
-        go_state = GPIO.input(go)
-        pause_state = GPIO.input(pause)
-        
-        if stop_state == GPIO.LOW:
-            print("Stop button pressed")
-        if go_state == GPIO.LOW:
-            print("Go button pressed")
-        if pause_state == GPIO.LOW:
-            print("Pause button pressed")
-        
-        time.sleep(0.01)
+        time.sleep(1)  # nothing to poll; callbacks run on the GPIO event thread
 except KeyboardInterrupt:
+    buttons.close()
     GPIO.cleanup()
     print("Program terminated.")
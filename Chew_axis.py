@@ -0,0 +1,206 @@
+#Closed-loop chew motor moves: position feedback, trapezoidal profile, PID at a fixed control rate
+import math
+
+CONTROL_RATE = 200          # Hz: feedback read and PWM update rate
+POSITION_TOLERANCE = 3      # counts: a move is done once within this of its target
+SETTLE_TIME = 0.1           # s allowed after the profile ends to get within tolerance
+DEADBAND_PWM = 10           # % duty below which the motor does not turn (added to every drive)
+MIN_CORRECTION = 0.5        # % duty: smaller controller outputs leave the motor off
+
+
+# -------------------------------------------------------------------
+# MOTION PROFILE + PID
+# -------------------------------------------------------------------
+class TrapezoidProfile:
+    """
+    Position setpoint over time for a move of distance (counts, signed):
+    accelerate at accel, cruise at v_max, decelerate to rest. Moves too
+    short to reach v_max become triangular. Precomputed once per move.
+    """
+    def __init__(self, distance, v_max, accel):
+        self.sign = 1 if distance >= 0 else -1
+        d = abs(distance)
+        self.accel = accel
+        t_acc = v_max / accel
+        if accel * t_acc * t_acc > d:   # triangular: never reaches v_max
+            t_acc = math.sqrt(d / accel)
+            v_max = accel * t_acc
+        self.v_peak = v_max
+        self.t_acc = t_acc
+        self.t_cruise = (d - accel * t_acc * t_acc) / v_max if v_max > 0 else 0.0
+        self.distance = d
+        self.duration = 2 * t_acc + self.t_cruise
+
+    def at(self, t):
+        """(position, velocity) t seconds into the move, both signed."""
+        a, ta, tc = self.accel, self.t_acc, self.t_cruise
+        if t <= 0:
+            return 0.0, 0.0
+        if t < ta:
+            pos, vel = 0.5 * a * t * t, a * t
+        elif t < ta + tc:
+            pos, vel = 0.5 * a * ta * ta + self.v_peak * (t - ta), self.v_peak
+        elif t < self.duration:
+            left = self.duration - t
+            pos, vel = self.distance - 0.5 * a * left * left, a * left
+        else:
+            pos, vel = self.distance, 0.0
+        return self.sign * pos, self.sign * vel
+
+
+class PID:
+    """Textbook PID on position error (counts) -> PWM duty (%), with a clamped integral."""
+    def __init__(self, kp, ki, kd, integral_limit=15.0):
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.integral_limit = integral_limit
+        self.reset()
+
+    def reset(self):
+        self._integral = 0.0
+        self._last_error = None
+
+    def update(self, error, dt):
+        self._integral += error * dt
+        limit = self.integral_limit / self.ki if self.ki else 0.0
+        self._integral = min(max(self._integral, -limit), limit)
+        derivative = 0.0 if self._last_error is None else (error - self._last_error) / dt
+        self._last_error = error
+        return self.kp * error + self.ki * self._integral + self.kd * derivative
+
+
+# -------------------------------------------------------------------
+# FEEDBACK
+# -------------------------------------------------------------------
+class EncoderFeedback:
+    """
+    Axis position from a quadrature encoder (Quadrature_encoder.QuadratureEncoder,
+    wrap=None, or anything with a .count). Counts grow towards the chew
+    (down) direction; the position when the axis is attached is taken as up.
+    """
+    has_position = True
+
+    def __init__(self, encoder, invert=False):
+        self.encoder = encoder
+        self.sign = -1 if invert else 1
+        self.zero = encoder.count
+
+    def position(self):
+        return self.sign * (self.encoder.count - self.zero)
+
+
+class LimitSwitchFeedback:
+    """End-stop switches (wired to ground, pulled up) at the up and down ends of travel."""
+    has_position = False
+
+    def __init__(self, gpio, up_pin, down_pin):
+        self.gpio = gpio
+        self.pins = {'up': up_pin, 'down': down_pin}
+        for pin in self.pins.values():
+            gpio.setup(pin, gpio.IN, pull_up_down=gpio.PUD_UP)
+
+    def at(self, end):
+        return self.gpio.input(self.pins[end]) == self.gpio.LOW
+
+
+# -------------------------------------------------------------------
+# CHEW AXIS
+# -------------------------------------------------------------------
+class ChewAxis:
+    """
+    Drives the chew motor to position instead of for a fixed time. With an
+    encoder, each move follows a precomputed trapezoidal profile from the
+    current position to 'up' (0) or 'down' (travel counts): a PID on the
+    tracking error plus velocity feedforward sets the H-bridge duty, capped
+    at the recipe's PWM, once per control period on an absolute tick
+    timeline. The move ends when the axis is within POSITION_TOLERANCE of
+    the target after the profile, so it stops on position, not on time.
+    With limit switches, the motor runs at the recipe PWM until the end
+    stop closes.
+
+    Either way the recipe's move duration stays a hard timeout. motor is
+    Station.motor (in1 drives down, in2 drives up).
+    """
+    def __init__(self, motor, feedback, clock, travel=400, v_max=1600.0, accel=16000.0,
+                 kp=2.5, ki=20.0, kd=0.0, counts_per_s_full=3000.0, control_rate=CONTROL_RATE):
+        self.motor = motor
+        self.feedback = feedback
+        self.clock = clock
+        self.travel = travel
+        self.v_max = v_max
+        self.accel = accel
+        self.pid = PID(kp, ki, kd)
+        self.kv = (100.0 - DEADBAND_PWM) / counts_per_s_full   # duty per count/s
+        self.period = 1.0 / control_rate
+        self.faults = 0   # moves that hit their timeout before reaching position
+
+    def target(self, direction):
+        return self.travel if direction == 'down' else 0
+
+    def move_time(self):
+        """Expected length of a full up or down move (profile plus settle), or None without an encoder."""
+        if not self.feedback.has_position:
+            return None
+        return TrapezoidProfile(self.travel, self.v_max, self.accel).duration + SETTLE_TIME
+
+    def _drive(self, duty):
+        # positive duty moves down (towards larger counts)
+        if duty > 0:
+            self.motor(duty, 0)
+        elif duty < 0:
+            self.motor(0, -duty)
+        else:
+            self.motor(0, 0)
+
+    async def move(self, direction, max_pwm, timeout, sleep_until):
+        """
+        Move to the up/down position; sleep_until is the caller's awaitable
+        absolute-time sleep (Controller.sleep_until). Returns True if the
+        position was reached, False on timeout. The motor is left off.
+        """
+        try:
+            if self.feedback.has_position:
+                reached = await self._profiled_move(self.target(direction), max_pwm, timeout, sleep_until)
+            else:
+                reached = await self._switch_move(direction, max_pwm, timeout, sleep_until)
+        finally:
+            self.motor(0, 0)
+        if not reached:
+            self.faults += 1
+            print(f"Chew axis: {direction} move did not reach position within {timeout:.2f} s")
+        return reached
+
+    async def _profiled_move(self, target, max_pwm, timeout, sleep_until):
+        start = self.feedback.position()
+        profile = TrapezoidProfile(target - start, self.v_max, self.accel)
+        self.pid.reset()
+        t0 = tick = self.clock.monotonic()
+        deadline = t0 + min(timeout, profile.duration + SETTLE_TIME)
+        while True:
+            now = self.clock.monotonic()
+            position = self.feedback.position()
+            if now - t0 >= profile.duration and abs(target - position) <= POSITION_TOLERANCE:
+                return True
+            if now >= deadline:
+                return False
+            setpoint, velocity = profile.at(now - t0)
+            duty = self.pid.update(start + setpoint - position, self.period) + self.kv * velocity
+            if abs(duty) > MIN_CORRECTION:
+                duty += math.copysign(DEADBAND_PWM, duty)   # so small corrections still move the axis
+            else:
+                duty = 0
+            self._drive(min(max(duty, -max_pwm), max_pwm))
+            tick += self.period
+            await sleep_until(tick)
+
+    async def _switch_move(self, direction, max_pwm, timeout, sleep_until):
+        deadline = self.clock.monotonic() + timeout
+        tick = self.clock.monotonic()
+        self._drive(max_pwm if direction == 'down' else -max_pwm)
+        while not self.feedback.at(direction):
+            if self.clock.monotonic() >= deadline:
+                return False
+            tick += self.period
+            await sleep_until(tick)
+        return True
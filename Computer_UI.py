@@ -21,41 +21,12 @@ def normalize_scaling(root):
         pass
 
 # -------------------------------------------------------------------
-# MOCK GPIO MODULE FOR DESKTOP TESTING
+# SIMULATED GPIO FOR DESKTOP TESTING
 # -------------------------------------------------------------------
-# Comment out (or remove) this mock block when you run on the Raspberry Pi.
-class MockPWM:
-    def __init__(self, pin, freq):
-        self._d = 0
-    def start(self, v):
-        self._d = v
-    def ChangeDutyCycle(self, v):
-        self._d = v
-    def stop(self):
-        pass
-
-class MockGPIO:
-    BCM = 'BCM'
-    OUT = 'OUT'
-    IN = 'IN'
-    LOW = 0
-    HIGH = 1
-    PUD_UP = 'PUD_UP'
-
-    def setmode(self, mode):
-        pass
-    def setup(self, pin, mode, pull_up_down=None):
-        pass
-    def output(self, pin, value):
-        pass
-    def input(self, pin):
-        return self.HIGH
-    def cleanup(self):
-        pass
-    def PWM(self, pin, freq):
-        return MockPWM(pin, freq)
+# Records pin/PWM changes in GPIO.trace instead of touching hardware.
+from Sim_rig import SimulatedGPIO
 
-GPIO = MockGPIO()
+GPIO = SimulatedGPIO()
 # -------------------------------------------------------------------
 
 
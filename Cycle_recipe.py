@@ -0,0 +1,218 @@
+#Declarative wear-cycle recipes, compiled to a flat timeline before a run
+import json
+import os
+from collections import namedtuple
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11: JSON recipes only
+    tomllib = None
+
+ACTIONS = ("wait", "pump", "motor")
+FILL = "fill"   # duration keyword: share whatever is left of the fluid cycle
+
+# One precompiled actuator command; args holds the action-specific settings.
+# start is its offset in the cycle, deps the commands (indices) it waits for,
+# resources what it needs to itself; detached commands may run into the next
+# cycle (pipelined cycles only, see compile_recipe)
+Command = namedtuple("Command", "name action duration args start deps resources detached")
+CompiledCycle = namedtuple("CompiledCycle", "commands fill_time min_cycle main_end pipelined")
+
+_OPERATORS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    ">=": lambda a, b: a >= b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    "<": lambda a, b: a < b,
+}
+
+
+def load_recipe(path):
+    """Read a recipe from a .json or .toml file."""
+    if path.endswith(".toml"):
+        if tomllib is None:
+            raise ValueError("TOML recipes need Python 3.11+ (tomllib)")
+        with open(path, "rb") as f:
+            recipe = tomllib.load(f)
+    else:
+        with open(path) as f:
+            recipe = json.load(f)
+    if not recipe.get("phases"):
+        raise ValueError(f"{os.path.basename(path)}: recipe has no phases")
+    return recipe
+
+
+def _value(value, params, key, phase):
+    """'$NAME' refers to a parameter (slider value or calibration constant); anything else is literal."""
+    if isinstance(value, str) and value.startswith("$"):
+        name = value[1:]
+        if name not in params:
+            raise ValueError(f"phase '{phase.get('name')}': unknown parameter '{name}' for {key}")
+        return params[name]
+    return value
+
+
+def _condition(expr, params, phase):
+    """Evaluate a 'when' condition of the form '<param> <op> <number>', e.g. 'chews == 0'."""
+    parts = expr.split()
+    if len(parts) != 3 or parts[1] not in _OPERATORS:
+        raise ValueError(f"phase '{phase.get('name')}': bad condition '{expr}'")
+    left = _value("$" + parts[0].lstrip("$"), params, "when", phase)
+    return _OPERATORS[parts[1]](left, float(parts[2]))
+
+
+def _expand(phases, params, out, dose_time=None, pump_resources=()):
+    for phase in phases:
+        if "when" in phase and not _condition(phase["when"], params, phase):
+            continue
+        if "phases" in phase:
+            repeat = int(_value(phase.get("repeat", 1), params, "repeat", phase))
+            for _ in range(max(repeat, 0)):
+                _expand(phase["phases"], params, out, dose_time, pump_resources)
+            continue
+        action = phase.get("action")
+        if action not in ACTIONS:
+            raise ValueError(f"phase '{phase.get('name')}': unknown action '{action}'")
+        args = {k: _value(v, params, k, phase) for k, v in phase.items()
+                if k not in ("name", "action", "duration", "when", "min", "uses", "detach")}
+        duration = phase.get("duration", 0)
+        if action == "pump" and "volume" in args and "duration" not in phase:
+            # a dose (mL) lasts however long that pump takes to deliver it
+            if dose_time is None:
+                raise ValueError(f"phase '{phase.get('name')}': volume doses need the pumps' calibration")
+            duration = dose_time(args.get("pump"), float(args["volume"]))
+        elif duration != FILL:
+            duration = float(_value(duration, params, "duration", phase))
+        out.append((phase.get("name", action), action, duration, args,
+                    float(_value(phase.get("min", 0), params, "min", phase)),
+                    _resources(action, args, phase, pump_resources), bool(phase.get("detach", False))))
+    return out
+
+
+def _resources(action, args, phase, pump_resources=()):
+    # the actuator a command drives, plus anything it declares it shares ("uses")
+    names = set(phase.get("uses", ()))
+    if action == "pump":
+        names.add(f"pump{args.get('pump')}")
+        names.update(pump_resources)
+    elif action == "motor":
+        names.add("motor")
+    return frozenset(names)
+
+
+# -------------------------------------------------------------------
+# DEPENDENCY GRAPH (pipelined cycles)
+# -------------------------------------------------------------------
+def _dependencies(phases, pipelined):
+    """
+    What each command waits for. Sequentially that is the previous command.
+    Pipelined, a detached command does not hold up the ones after it, which
+    follow its predecessor instead, and a command also waits for the last
+    earlier one that used any of its resources.
+    """
+    deps = []
+    follows = None   # the command the next one follows in sequence
+    holders = {}     # resource -> last command using it
+    for i, (_, _, _, _, _, resources, detach) in enumerate(phases):
+        waits = {follows} if follows is not None else set()
+        if pipelined:
+            waits.update(holders[r] for r in resources if r in holders)
+        deps.append(tuple(sorted(waits)))
+        for r in resources:
+            holders[r] = i
+        if not (pipelined and detach):
+            follows = i
+    return deps
+
+
+def _schedule(durations, deps):
+    # earliest start of every command (deps always point backwards)
+    starts = []
+    for i, waits in enumerate(deps):
+        starts.append(max((starts[j] + durations[j] for j in waits), default=0.0))
+    return starts
+
+
+def _cycle_length(durations, deps, resources, detached):
+    """
+    Shortest period for this cycle: its main sequence must end before the
+    next cycle starts, and each resource must be free again (after its last
+    use in this cycle) by the time the next cycle first needs it.
+    """
+    starts = _schedule(durations, deps)
+    ends = [s + d for s, d in zip(starts, durations)]
+    length = max((e for e, d in zip(ends, detached) if not d), default=0.0)
+    first, last = {}, {}
+    for i, names in enumerate(resources):
+        for r in names:
+            first.setdefault(r, starts[i])
+            last[r] = max(last.get(r, 0.0), ends[i])
+    for r in first:
+        length = max(length, last[r] - first[r])
+    return length
+
+
+def conflicts(cycle, period):
+    """
+    Resource conflicts in a compiled cycle repeated every period seconds, as
+    (resource, first command, second command) name triples: two commands,
+    in the same cycle or in consecutive ones, that would use one resource at
+    the same time on the nominal timeline. Empty when the cycle is safe.
+    """
+    found = []
+    spans = [(cmd.start + shift, cmd.start + cmd.duration + shift, cmd)
+             for shift in (0.0, period) for cmd in cycle.commands]
+    for i, (a_start, a_end, a) in enumerate(spans):
+        for b_start, b_end, b in spans[i + 1:]:
+            shared = a.resources & b.resources
+            if shared and a_start < b_end - 1e-9 and b_start < a_end - 1e-9:
+                found += [(r, a.name, b.name) for r in sorted(shared)]
+    return found
+
+
+def compile_recipe(recipe, params, pipelined=False, dose_time=None, pump_resources=()):
+    """
+    Expand repeats/conditions and resolve every value against params into
+    a flat list of Commands. 'fill' phases split the time the fixed phases
+    leave over in params['fluid_cycle']; min_cycle is the shortest fluid
+    cycle that still gives each fill phase its 'min'.
+
+    pipelined=True plans the cycle as a dependency graph instead of a
+    sequence: phases marked "detach" (e.g. the drain pump) run on while the
+    next phases, and the next cycle, start; "uses" names extra resources a
+    phase shares (e.g. the fluid both pumps move), which serialise those
+    phases across cycles too. min_cycle then counts the overlap.
+    pump_resources are held by every pump phase whatever the recipe says,
+    e.g. the pigpio wave engine, which only plays one pump at a time.
+
+    A pump phase may give a "volume" (mL) instead of a duration; it then
+    lasts dose_time(pump, volume) seconds (e.g. StepperDriver.dose_time).
+    """
+    phases = _expand(recipe["phases"], params, [], dose_time, pump_resources)
+    deps = _dependencies(phases, pipelined)
+    resources = [p[5] for p in phases]
+    detached = [pipelined and p[6] for p in phases]
+
+    def length(fill, minimums=False):
+        durations = [(minimum if minimums else fill) if duration == FILL else duration
+                     for _, _, duration, _, minimum, _, _ in phases]
+        return _cycle_length(durations, deps, resources, detached)
+
+    fill_time = 0.0
+    if any(duration == FILL for _, _, duration, _, _, _, _ in phases):
+        # the longest even fill share that still fits the fluid cycle
+        cycle = params.get("fluid_cycle", 0)
+        lo, hi = 0.0, max(cycle, 0.0)
+        if length(0.0) < cycle:
+            for _ in range(60):
+                mid = (lo + hi) / 2
+                lo, hi = (mid, hi) if length(mid) <= cycle else (lo, mid)
+        fill_time = round(lo, 3)
+
+    durations = [fill_time if duration == FILL else duration for _, _, duration, _, _, _, _ in phases]
+    starts = _schedule(durations, deps)
+    commands = [Command(name, action, durations[i], args, starts[i], deps[i], resources[i], detached[i])
+                for i, (name, action, _, args, _, _, _) in enumerate(phases)]
+    main_end = max((starts[i] + durations[i] for i in range(len(phases)) if not detached[i]), default=0.0)
+    return CompiledCycle(commands, fill_time, length(0.0, minimums=True), main_end, pipelined)
@@ -0,0 +1,42 @@
+#Edge-triggered handling for the external STOP / GO / PAUSE buttons
+import threading
+
+BOUNCE_MS = 100  # ignore further edges on a pin for this long after a press
+
+
+class ButtonWatcher:
+    """
+    Registers a falling-edge interrupt (GPIO.add_event_detect) per button
+    instead of polling. Buttons are wired to ground with pull-ups, so a
+    press is HIGH -> LOW. The callback fires once per press, not
+    repeatedly while the button is held, and runs on RPi.GPIO's event
+    thread, so it should only flip state and return. The edge alone
+    counts as the press (bouncetime drops the contact bounce after it):
+    a short, clean press can be released before the callback runs, so
+    the line's level by then says nothing.
+    """
+    def __init__(self, gpio, bouncetime=BOUNCE_MS):
+        self.gpio = gpio
+        self.bouncetime = bouncetime
+        self._callbacks = {}
+        self._lock = threading.Lock()
+
+    def on_press(self, pin, callback):
+        self.gpio.setup(pin, self.gpio.IN, pull_up_down=self.gpio.PUD_UP)
+        with self._lock:
+            self._callbacks[pin] = callback
+        self.gpio.add_event_detect(pin, self.gpio.FALLING, callback=self._dispatch,
+                                   bouncetime=self.bouncetime)
+
+    def _dispatch(self, channel):
+        with self._lock:
+            callback = self._callbacks.get(channel)
+        if callback is not None:
+            callback()
+
+    def close(self):
+        with self._lock:
+            pins = list(self._callbacks)
+            self._callbacks.clear()
+        for pin in pins:
+            self.gpio.remove_event_detect(pin)
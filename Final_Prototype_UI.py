@@ -1,10 +1,30 @@
 #Final Product Code
+import time
+STARTED = time.perf_counter()   # startup benchmark: import -> first frame -> hardware ready
 import tkinter as tk
 from tkinter import ttk
-import threading
-import time
+from tkinter import messagebox
+import asyncio
 import sys
-import RPi.GPIO as GPIO
+import os
+import signal
+import threading
+import traceback
+from Run_timing import REAL_CLOCK, VirtualClock
+from Rig_controller import Controller
+from Sim_rig import SimulatedChewAxis, SimulatedGPIO
+from Rig_config import (CALIBRATION_DEFAULTS, HOLD_PWM, MOTOR_IN1, MOTOR_IN2, PINS, PUMP_STEP_RATE,
+                        SETTINGS_PATH, make_station, open_gpio)
+from Chew_axis import ChewAxis, EncoderFeedback, LimitSwitchFeedback
+from Quadrature_encoder import QuadratureEncoder
+from External_buttons import ButtonWatcher
+from View_model import ViewModel
+from Cycle_recipe import load_recipe, compile_recipe, conflicts
+from Ui_events import UiEventQueue, StateChanged, ToggleChanged, MotorChanged, ProgressChanged, HardwareChanged
+import Run_telemetry as telemetry
+from Run_profiler import LatencyProfile, StartupTimeline
+from Rig_settings import SettingsStore
+from Run_journal import RunJournal
 
 # -------------------------------------------------------------------
 # DPI / PREVIEW CONFIGURATION (for desktop preview of 800x480 Pi display)
@@ -22,41 +42,16 @@ def normalize_scaling(root):
         pass
 
 # -------------------------------------------------------------------
-# MOCK GPIO MODULE FOR DESKTOP TESTING
+# HARDWARE / CLOCK SELECTION
 # -------------------------------------------------------------------
-# Comment out (or remove) this mock block when you run on the Raspberry Pi.
-# class MockPWM:
-#     def __init__(self, pin, freq):
-#         self._d = 0
-#     def start(self, v):
-#         self._d = v
-#     def ChangeDutyCycle(self, v):
-#         self._d = v
-#     def stop(self):
-#         pass
-
-# class MockGPIO:
-#     BCM = 'BCM'
-#     OUT = 'OUT'
-#     IN = 'IN'
-#     LOW = 0
-#     HIGH = 1
-#     PUD_UP = 'PUD_UP'
-
-#     def setmode(self, mode):
-#         pass
-#     def setup(self, pin, mode, pull_up_down=None):
-#         pass
-#     def output(self, pin, value):
-#         pass
-#     def input(self, pin):
-#         return self.HIGH
-#     def cleanup(self):
-#         pass
-#     def PWM(self, pin, freq):
-#         return MockPWM(pin, freq)
-
-# GPIO = MockGPIO()
+# WEAR_RIG_SIM=1 runs against the simulated rig (desktop preview, no Pi);
+# WEAR_RIG_SIM=fast also swaps in a virtual clock so runs fast-forward
+# (headless only, see Sim_rig.run_headless). RPi.GPIO itself is only
+# imported by init_hardware(), after the window is up.
+SIMULATE = os.environ.get("WEAR_RIG_SIM", "")
+# WEAR_RIG_GPIO picks RPi.GPIO or libgpiod (Rig_config.open_gpio)
+CLOCK = VirtualClock() if SIMULATE == "fast" else REAL_CLOCK
+GPIO = SimulatedGPIO(CLOCK) if SIMULATE else None
 # -------------------------------------------------------------------
 
 
@@ -67,6 +62,8 @@ MOTOR_UP_DURATION = 0.5
 MIN_CYCLE_RATE = int(INITIAL_WAIT + MOTOR_DOWN_DURATION + MOTOR_UP_DURATION + 1)
 
 # --- States ---
+STATE_STARTING = "starting"       # window up, hardware still initializing
+STATE_OFFLINE = "offline"         # hardware init failed
 STATE_SETUP = "setup"
 STATE_RUNNING = "running"
 STATE_PAUSED = "paused"
@@ -76,53 +73,83 @@ STATE_REPLACE_SAMPLE = "replace"  # new: Replace sample (motor up)
 
 SCALE = 1.2
 
-# Pump & motor variables
-PUMP_RUN_TIME = 2.0
-MOTOR_SPEED_UP = 80
-MOTOR_SPEED_DOWN = 80
+# Pump & motor constants (doses, step rates, ramps, factory calibration) and
+# the pin table are in Rig_config.py, shared with Pump_calibration.py
 DEVICE_SWITCH_DELAY = 0.1
-HOLD_PWM = 20
-
-# --- GPIO pins (external buttons) ---
-STOP_PIN = 16
-GO_PIN = 1
-PAUSE_PIN = 14
-GPIO.setmode(GPIO.BCM)
-GPIO.setup(STOP_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-GPIO.setup(GO_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-GPIO.setup(PAUSE_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-
-# --- Pump 1 GPIO pins ---
-ENA = 18
-ENB = 15
-IN1 = 17
-IN2 = 27
-IN3 = 22
-IN4 = 23
-for pin in [ENA, ENB, IN1, IN2, IN3, IN4]:
-    GPIO.setup(pin, GPIO.OUT)
-    GPIO.output(pin, 0)
-
-# --- Pump 2 GPIO pins ---
-P2_ENA = 8
-P2_ENB = 11
-P2_IN1 = 25
-P2_IN2 = 24
-P2_IN3 = 9
-P2_IN4 = 10
-for pin in [P2_ENA, P2_ENB, P2_IN1, P2_IN2, P2_IN3, P2_IN4]:
-    GPIO.setup(pin, GPIO.OUT)
-    GPIO.output(pin, 0)
-
-# --- Motor GPIO pins using PWM ---
-MOTOR_IN1 = 12
-MOTOR_IN2 = 13
-GPIO.setup(MOTOR_IN1, GPIO.OUT)
-GPIO.setup(MOTOR_IN2, GPIO.OUT)
-pwm_in1 = GPIO.PWM(MOTOR_IN1, 1000)
-pwm_in2 = GPIO.PWM(MOTOR_IN2, 1000)
-pwm_in1.start(0)
-pwm_in2.start(0)
+
+# WEAR_RIG_PIPELINE=1 runs cycles as a dependency graph: phases marked "detach"
+# in the recipe (the drain pump) overlap the next cycle's start, resources
+# permitting, so the minimum fluid cycle drops (see Cycle_recipe.compile_recipe)
+PIPELINED = bool(os.environ.get("WEAR_RIG_PIPELINE"))
+
+# Wear cycle recipe: phases, durations and PWM levels (pass another recipe file as argv[1])
+RECIPE_PATH = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "recipes", "default_wear.json")
+
+# Phase-boundary telemetry, one binary log per run (read with Run_telemetry.py)
+RUN_LOG_DIR = os.environ.get("WEAR_RIG_LOG_DIR", os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "run_logs"))
+
+# Last slider values, presets and calibration (Rig_config.SETTINGS_PATH);
+# fast-forward simulations keep them in memory only
+SETTINGS = SettingsStore(None if SIMULATE == "fast" else SETTINGS_PATH,
+                         calibration_defaults=CALIBRATION_DEFAULTS)
+
+# Progress checkpoint of the run in progress, so a crash or power cut can
+# resume from the last completed cycle (override with WEAR_RIG_JOURNAL)
+JOURNAL_PATH = os.environ.get("WEAR_RIG_JOURNAL", os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "run_journal.jsonl"))
+
+# WEAR_RIG_PROFILE=1 collects phase overshoot, step jitter and STOP latency;
+# the report prints on exit, or on demand with `kill -USR1 <pid>`
+PROFILE = LatencyProfile() if os.environ.get("WEAR_RIG_PROFILE") else None
+
+# Startup milestones, printed once the hardware is ready; WEAR_RIG_STARTUP_BENCH=1
+# quits right after that, so repeated cold starts can be timed from a shell loop
+STARTUP = StartupTimeline(STARTED)
+STARTUP_BENCH = bool(os.environ.get("WEAR_RIG_STARTUP_BENCH"))
+
+# --- Optional chew-axis feedback for closed-loop moves (Chew_axis.py): an
+# encoder (CLK, DT) or (up, down) limit switches; None keeps timed moves.
+# WEAR_RIG_SIM_CHEW=1 gives a simulated rig an encoder-fitted axis ---
+CHEW_ENCODER_PINS = None
+CHEW_LIMIT_PINS = None
+CHEW_TRAVEL = 400   # encoder counts from the up (rest) position to full chew depth
+
+STATION = None   # created by init_hardware()
+_HARDWARE_LOCK = threading.Lock()
+
+
+def init_hardware():
+    """
+    Open the GPIO (RPi.GPIO, or libgpiod) and bring up this rig's Station
+    (pin setup, PWM start, pigpio connection). This is the slow part of a cold start on a Pi, so
+    DeviceUI runs it on a background thread once its window is drawn.
+    Safe to call more than once; returns the Station.
+    """
+    global GPIO, STATION
+    with _HARDWARE_LOCK:
+        if STATION is None:
+            if GPIO is None:
+                GPIO = open_gpio()
+            station = make_station(GPIO, CLOCK)
+            if hasattr(station.backend, "profile"):   # pigpio/simulated backends time steps themselves
+                station.backend.profile = PROFILE
+            station.chew_axis = _make_chew_axis(station)
+            STATION = station
+        return STATION
+
+
+def _make_chew_axis(station):
+    if SIMULATE and os.environ.get("WEAR_RIG_SIM_CHEW"):
+        feedback = EncoderFeedback(SimulatedChewAxis(GPIO, MOTOR_IN1, MOTOR_IN2))
+    elif CHEW_ENCODER_PINS is not None:
+        feedback = EncoderFeedback(QuadratureEncoder(GPIO, *CHEW_ENCODER_PINS, transitions_per_count=1))
+    elif CHEW_LIMIT_PINS is not None:
+        feedback = LimitSwitchFeedback(GPIO, *CHEW_LIMIT_PINS)
+    else:
+        return None
+    return ChewAxis(station.motor, feedback, CLOCK, travel=CHEW_TRAVEL)
 
 #Defining Colors
 b_color = '#c6c6c6'
@@ -130,49 +157,137 @@ f_color = '#007AFF'
 n_color = '#754100'
 
 class DeviceUI:
-    def __init__(self, root):
+    def __init__(self, root, recipe_path=None, station=None, settings=None, journal=None):
+        # root=None runs headless (no widgets), e.g. for simulated runs
         self.root = root
-
-        # DPI normalization so desktop preview matches Pi physical size
-        normalize_scaling(self.root)
-
-        # Force exact Pi geometry (no resizing)
-        self.root.title("Device UI")
-        self.root.geometry(f"{TARGET_WIDTH}x{TARGET_HEIGHT}+0+0")
-        self.root.minsize(TARGET_WIDTH, TARGET_HEIGHT)
-        self.root.maxsize(TARGET_WIDTH, TARGET_HEIGHT)
-        self.root.configure(bg=b_color)
-
-        # Core parameters
-        self.total_seconds = 60
-        self.chews = 2
-        self.fluid_cycle = 10.0
+        self.station = None   # attached by _attach_station() once the hardware is up
+        self.settings = settings if settings is not None else SETTINGS
+        # fast-forward simulations never journal (nor find the rig's journal)
+        self.journal = journal if journal is not None else RunJournal(
+            None if SIMULATE == "fast" else JOURNAL_PATH)
+
+        if self.root is not None:
+            # DPI normalization so desktop preview matches Pi physical size
+            normalize_scaling(self.root)
+
+            # Force exact Pi geometry (no resizing)
+            self.root.title("Device UI")
+            self.root.geometry(f"{TARGET_WIDTH}x{TARGET_HEIGHT}+0+0")
+            self.root.minsize(TARGET_WIDTH, TARGET_HEIGHT)
+            self.root.maxsize(TARGET_WIDTH, TARGET_HEIGHT)
+            self.root.configure(bg=b_color)
+
+        # Core parameters, restored from the last session
+        sliders = self.settings.sliders
+        self.total_seconds = int(sliders['total_seconds'])
+        self.chews = int(sliders['chews'])
+        self.fluid_cycle = sliders['fluid_cycle']
+        self.calibration = self.settings.calibration
 
         self.cycle_rate = float(MIN_CYCLE_RATE)
         self.elapsed = 0.0
         self.cycle_count = 0
-        self.state = STATE_SETUP
+        self.state = STATE_STARTING
         self.motor_active = False
+        self.hardware_ready = threading.Event()
+        self.interrupted_run = None
+
+        # Cycle recipe, compiled into a flat command timeline when a run starts
+        self.recipe = load_recipe(recipe_path or RECIPE_PATH)
+        self._cycle = None
+        self.fluid_cycle = max(self.fluid_cycle, self._calculate_min_fluid_cycle())
+        self._actions = {
+            'wait': self._do_wait,
+            'pump': self._do_pump,
+            'motor': self._do_motor,
+        }
 
-        # Flags and threading
-        self._run_flag = threading.Event()
-        self._pause_flag = threading.Event()
-        self._run_thread = None
-
-        # Locks / debounce
-        self._replace_lock = threading.Lock()   # prevents rapid toggles during motor move
-        self._buttons_lock = threading.Lock()   # serializes pump state updates
-
-        style = ttk.Style()
-        style.configure("TScale", sliderlength=int(30 * SCALE))
-
-        # Build UI
-        self._build_ui()
-        self._update_ui_from_values()
-        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
+        # Every timed action (run, fills, replace moves) is a task on one
+        # asyncio loop; Tk and the buttons hand requests over with controller.call()
+        self.controller = Controller(CLOCK)
+        self._scheduler = None   # the station's monotonic, drift-free cycle timeline
+        self._buttons = None
+        self._resume = None   # asyncio.Event the run waits on while paused
+        self._holders = {}    # resource -> task using it last (pipelined runs)
+        self._detached = []   # detached tasks still running on from the last cycle
+        self._telemetry = None   # TelemetryLog of the current run
+        self._stop_requested_at = None   # CLOCK.perf_counter() of the last stop (profiling)
+
+        # Special-state toggles (plain ints so the controller loop never reads Tk variables)
+        self._toggles = {'startup': 0, 'drain': 0, 'replace': 0}
+
+        # Widget updates: the controller loop posts events, the Tk thread applies them
+        self._view = ViewModel()
+        self._clock_after_id = None
+        self._events = UiEventQueue(self.root, {
+            StateChanged: self._on_state_changed,
+            ToggleChanged: lambda event: self._update_toggle_visuals(),
+            MotorChanged: self._on_motor_changed,
+            ProgressChanged: self._on_progress_changed,
+            HardwareChanged: self._on_hardware_changed,
+        })
+
+        if self.root is not None:
+            style = ttk.Style()
+            style.configure("TScale", sliderlength=int(30 * SCALE))
+
+            # Build UI
+            self._build_ui()
+            self._render_all()
+            self._events.start()
+            self.root.protocol("WM_DELETE_WINDOW", self._on_close)
+
+        # Show the window first, then bring the hardware up in the background;
+        # until then the state is STARTING and every action is refused. A
+        # headless UI (or one handed a Station) has nothing to show first.
+        if station is not None or self.root is None:
+            self._attach_station(station if station is not None else init_hardware())
+        else:
+            self.root.update()
+            STARTUP.mark("first frame")
+            threading.Thread(target=self._init_hardware, name="hardware-init", daemon=True).start()
 
-        # Start external buttons monitor
-        threading.Thread(target=self._external_buttons_loop, daemon=True).start()
+    # -------------------------
+    # Hardware bring-up (background thread, then the controller loop)
+    # -------------------------
+    def _init_hardware(self):
+        try:
+            station = init_hardware()
+        except Exception as e:
+            traceback.print_exc()
+            self.controller.call(self._hardware_failed, e)
+            return
+        self.controller.call(self._attach_station, station)
+
+    def _hardware_failed(self, error):
+        self._set_state(STATE_OFFLINE)
+        self._events.post(HardwareChanged(False, str(error)))
+
+    def _attach_station(self, station):
+        self.station = station
+        self._scheduler = station.scheduler
+        for number, pump in station.pumps.items():
+            pump.steps_per_ml = self.calibration[f'PUMP{number}_STEPS_PER_ML']
+
+        # External buttons are edge-triggered; no polling thread
+        self._buttons = ButtonWatcher(station.gpio)
+        self._buttons.on_press(station.pins.stop, self._on_stop_button)
+        self._buttons.on_press(station.pins.go, self.start)
+        self._buttons.on_press(station.pins.pause, self.pause)
+
+        # A run cut short by a crash or power loss left a journal: outputs go
+        # to a known-safe state first, then the operator may resume it
+        self.interrupted_run = self.journal.pending()
+        if self.interrupted_run is not None:
+            station.safe()
+            print(f"Interrupted run found: {self._describe_interrupted()}")
+
+        self._set_state(STATE_SETUP)
+        self.hardware_ready.set()
+        STARTUP.mark("hardware ready")
+        if self.root is not None:
+            print(STARTUP.report())
+        self._events.post(HardwareChanged(True, None))
 
     # -------------------------
     # UI build and layout
@@ -223,15 +338,11 @@ class DeviceUI:
         toggles_frame.pack(side="top", pady=(8, 2))
 
         # We'll create vertical stacks: Label above square button, three columns
-        self.startup_var = tk.IntVar(value=0)
-        self.drain_var = tk.IntVar(value=0)
-        self.replace_var = tk.IntVar(value=0)
-
         btn_font = ("Arial", 14, "bold")
         label_font = ("Arial", 12)
 
         # Helper to create a labeled square toggle
-        def create_labeled_toggle(parent, text, var, command):
+        def create_labeled_toggle(parent, text, command):
             frame = tk.Frame(parent, bg=b_color)
             lbl = tk.Label(frame, text=text, bg=b_color, font=label_font, fg = f_color)
             lbl.pack(side="top", pady=(0,4))
@@ -243,11 +354,11 @@ class DeviceUI:
             return frame, btn
 
         # create toggles
-        startup_frame, self.startup_btn = create_labeled_toggle(toggles_frame, "Start Up", self.startup_var,
+        startup_frame, self.startup_btn = create_labeled_toggle(toggles_frame, "Start Up",
                                                                lambda: self._toggle_startup())
-        drain_frame, self.drain_btn = create_labeled_toggle(toggles_frame, "Drain", self.drain_var,
+        drain_frame, self.drain_btn = create_labeled_toggle(toggles_frame, "Drain",
                                                             lambda: self._toggle_drain())
-        replace_frame, self.replace_btn = create_labeled_toggle(toggles_frame, "Replace Sample", self.replace_var,
+        replace_frame, self.replace_btn = create_labeled_toggle(toggles_frame, "Replace Sample",
                                                                 lambda: self._toggle_replace())
 
         # Lay out three toggles horizontally, centered
@@ -341,38 +452,43 @@ class DeviceUI:
     # -------------------------
     # calculations
     # -------------------------
-    def _calculate_min_fluid_cycle(self):
-        MIN_HOLD = 0.5
-
-        if self.chews <= 0:
-            return INITIAL_WAIT + PUMP_RUN_TIME + PUMP_RUN_TIME
-        chew_block = self.chews * (
-            MOTOR_DOWN_DURATION + MOTOR_UP_DURATION + MIN_HOLD * 2
-        )
+    def _recipe_params(self):
+        # values a recipe can refer to as "$NAME"; a closed-loop chew axis
+        # replaces the timed move lengths with its (shorter) profiled move time
+        axis = self.station.chew_axis if self.station is not None else None
+        move_time = axis.move_time() if axis is not None else None
+        params = {
+            'chews': self.chews,
+            'fluid_cycle': self.fluid_cycle,
+            'INITIAL_WAIT': INITIAL_WAIT,
+            'MOTOR_DOWN_DURATION': move_time or MOTOR_DOWN_DURATION,
+            'MOTOR_UP_DURATION': move_time or MOTOR_UP_DURATION,
+            **self.calibration,   # PUMP_DOSE_ML, PUMP*_STEPS_PER_ML, MOTOR_SPEED_DOWN/UP, HOLD_PWM
+        }
+        return params
 
-        return INITIAL_WAIT + PUMP_RUN_TIME + chew_block + PUMP_RUN_TIME
+    def _dose_time(self, pump, ml):
+        # until the hardware is up (and its ramps known), a dose is timed at the start rate
+        if self.station is not None:
+            return self.station.pumps[pump].dose_time(ml)
+        return round(ml * self.calibration[f'PUMP{pump}_STEPS_PER_ML']) / PUMP_STEP_RATE
 
+    def _compile_cycle(self):
+        # pumps on a backend with one wave engine (pigpio) never overlap, recipe or not
+        backend = self.station.backend if self.station is not None else None
+        serial = getattr(backend, "serial_playback", False)
+        return compile_recipe(self.recipe, self._recipe_params(), pipelined=PIPELINED,
+                              dose_time=self._dose_time, pump_resources=("waves",) if serial else ())
 
+    def _calculate_min_fluid_cycle(self):
+        # fixed phases plus each hold's minimum (0.5 s in the default recipe)
+        return self._compile_cycle().min_cycle
 
     def _calculate_hold_time(self):
         if self.chews <= 0:
             return 0
-
-        # Base time cost for a cycle (excluding hold time)
-        base = (
-            INITIAL_WAIT +
-            PUMP_RUN_TIME +
-            (self.chews * (MOTOR_DOWN_DURATION + MOTOR_UP_DURATION)) +
-            PUMP_RUN_TIME
-        )
-
-        available = self.fluid_cycle - base
-
-        # Each chew has 2 holds → total holds = chews * 2
-        if available <= 0:
-            return 0
-
-        return round(available / (2 * self.chews), 3)
+        # fluid cycle left after the fixed phases, split across every hold
+        return self._compile_cycle().fill_time
 
 
 
@@ -380,16 +496,17 @@ class DeviceUI:
     # slider callbacks
     # -------------------------
     def _on_timer_scale(self, v):
-        if self.state != STATE_SETUP:
+        if self.state not in (STATE_SETUP, STATE_STARTING):
             return
         minutes = int(float(v))
         self.total_seconds = minutes * 60
         h = self.total_seconds // 3600
         m = (self.total_seconds % 3600) // 60
         self.timer_value_label.config(text=f"Timer {h:02}:{m:02}")
+        self._remember_sliders()
 
     def _on_chews_scale(self, v):
-        if self.state != STATE_SETUP:
+        if self.state not in (STATE_SETUP, STATE_STARTING):
             return
 
         # Prevent callback firing before fluid_scale exists
@@ -410,524 +527,614 @@ class DeviceUI:
             self.hold_time_label.config(
                 text=f"Hold time per chew: {self._calculate_hold_time():.2f}s"
             )
+        self._remember_sliders()
 
     def _on_fluid_scale(self, v):
-        if self.state != STATE_SETUP:
+        if self.state not in (STATE_SETUP, STATE_STARTING):
             return
-        self.fluid_cycle = int(float(v))
-        self.fluid_value_label.config(text=f"Fluid Cycle: {self.fluid_cycle}s")
+        # keep the float (a restored or resumed period like 7.25 s), never below the minimum
+        self.fluid_cycle = max(float(v), self._calculate_min_fluid_cycle())
+        self.fluid_value_label.config(text=f"Fluid Cycle: {self.fluid_cycle:.1f}s")
         # update hold time display if that label exists
         self.hold_time_label.config(text=f"Hold time per chew: {self._calculate_hold_time():.2f}s") if hasattr(self, "hold_time_label") else None
+        self._remember_sliders()
 
     # -------------------------
-    # update UI periodic
+    # persisted settings: slider values survive a restart; presets are
+    # named slider sets (Tk thread, SETUP only, like the sliders themselves)
     # -------------------------
-    def _update_ui_from_values(self):
-        # update elapsed time here, not only in _run_loop
-        if self.state == STATE_RUNNING:
-            now = time.time()
-            self.elapsed = (now - self.base_start_time) - self.start_time_offset
+    def _remember_sliders(self):
+        self.settings.set_sliders(total_seconds=self.total_seconds, chews=self.chews,
+                                  fluid_cycle=self.fluid_cycle)
 
+    def save_preset(self, name):
+        self._remember_sliders()
+        self.settings.save_preset(name)
 
-        secs = int(self.elapsed)
+    def apply_preset(self, name):
+        if self.state != STATE_SETUP:
+            return
+        self._apply_sliders(self.settings.preset(name))
+
+    def _apply_sliders(self, values):
+        self.total_seconds = int(values['total_seconds'])
+        self.chews = int(values['chews'])
+        self.fluid_cycle = max(values['fluid_cycle'], self._calculate_min_fluid_cycle())
+        if self.root is not None:
+            # move the sliders too, and run their callbacks for the labels and fluid minimum
+            for scale, callback, value in ((self.timer_scale, self._on_timer_scale, self.total_seconds // 60),
+                                           (self.chews_scale, self._on_chews_scale, self.chews),
+                                           (self.fluid_scale, self._on_fluid_scale, self.fluid_cycle)):
+                scale.set(value)
+                callback(value)
+        self._remember_sliders()
+
+    # -------------------------
+    # crash resume: the journal's run settings go back on the sliders and
+    # the run restarts after its last completed cycle (Tk thread)
+    # -------------------------
+    def _describe_interrupted(self):
+        state = self.interrupted_run
+        left = max(state['run']['total_seconds'] - state['cycle'] * state['run']['fluid_cycle'], 0)
+        return (f"{state['cycle']} cycles done, {int(left) // 3600:02}:{int(left) % 3600 // 60:02}:"
+                f"{int(left) % 60:02} left")
+
+    def _offer_resume(self):
+        if self.interrupted_run is None:
+            return
+        if messagebox.askyesno("Resume run?", "The last run was interrupted ("
+                               f"{self._describe_interrupted()}).\nResume it?", parent=self.root):
+            self.resume_interrupted()
+        else:
+            self.discard_interrupted()
+
+    def resume_interrupted(self):
+        state, self.interrupted_run = self.interrupted_run, None
+        if state is None or self.state != STATE_SETUP:
+            return None
+        self._apply_sliders(state['run'])
+        return self.controller.call(self._start, state['cycle'])
+
+    def discard_interrupted(self):
+        self.interrupted_run = None
+        self.journal.finish()
+
+    # -------------------------
+    # State changes (controller loop only): mutate, then post an event
+    # -------------------------
+    def _set_state(self, state):
+        self.state = state
+        self._events.post(StateChanged(state))
+
+    def _set_toggle(self, name, value):
+        self._toggles[name] = value
+        self._events.post(ToggleChanged(name, value))
+
+    def _set_motor_active(self, active):
+        self.motor_active = active
+        self._events.post(MotorChanged(active))
+
+    def _post_progress(self):
+        self._events.post(ProgressChanged(self.elapsed, self.cycle_count))
+
+    # -------------------------
+    # UI event handlers (Tk thread only)
+    # -------------------------
+    def _render_all(self):
+        self._on_state_changed(StateChanged(self.state))
+        self._on_motor_changed(MotorChanged(self.motor_active))
+        self._on_progress_changed(ProgressChanged(self.elapsed, self.cycle_count))
+
+    def _on_state_changed(self, event):
+        self._view.render(self.state_label, text=f"State: {event.state.upper()}")
+        self._update_toggle_visuals()
+        # the running clock is the only thing that still needs a timer
+        if event.state == STATE_RUNNING and self._clock_after_id is None:
+            self._tick_clock()
+
+    def _on_hardware_changed(self, event):
+        if not event.ready:
+            self._view.render(self.state_label, text="State: NO HARDWARE", fg="red")
+            return
+        if STARTUP_BENCH:
+            self._on_close()
+            return
+        # a closed-loop chew axis shortens the moves, so more fits in a fluid cycle
+        new_min = self._calculate_min_fluid_cycle()
+        self.fluid_scale.config(from_=new_min)
+        if self.interrupted_run is not None:
+            self._offer_resume()
+
+    def _on_motor_changed(self, event):
+        self._view.render(self.motor_label, text="● Motor Active" if event.active else "○ Idle",
+                          fg="green" if event.active else "gray")
+
+    def _on_progress_changed(self, event):
+        secs = int(event.elapsed)
         h = secs // 3600
         m = (secs % 3600) // 60
         s = secs % 60
-        self.time_display.config(text=f"{h:02}:{m:02}:{s:02}")
-        self.count_display.config(text=str(self.cycle_count))
-        self.state_label.config(text=f"State: {self.state.upper()}")
-        self.motor_label.config(text="● Motor Active" if self.motor_active else "○ Idle",
-                                fg="green" if self.motor_active else "gray")
-        # Update toggle visuals in case external event changed them
-        self._update_toggle_visuals()
-        self.root.after(200, self._update_ui_from_values)
+        self._view.render(self.time_display, text=f"{h:02}:{m:02}:{s:02}")
+        self._view.render(self.count_display, text=str(event.cycle_count))
+
+    def _tick_clock(self):
+        # Redraw the timer on each whole second while running; stops itself otherwise
+        if self.state != STATE_RUNNING:
+            self._clock_after_id = None
+            return
+        self.elapsed = self._scheduler.elapsed()
+        self._on_progress_changed(ProgressChanged(self.elapsed, self.cycle_count))
+        delay_ms = int((1.0 - (self.elapsed % 1.0)) * 1000) + 1
+        self._clock_after_id = self.root.after(delay_ms, self._tick_clock)
 
     # -------------------------
     # Toggle visuals helper
     # -------------------------
     def _update_toggle_visuals(self):
-        # Startup toggle
-        self._set_button_checked(self.startup_btn, bool(self.startup_var.get()))
-        self._set_button_checked(self.drain_btn, bool(self.drain_var.get()))
-        self._set_button_checked(self.replace_btn, bool(self.replace_var.get()))
+        self._set_button_checked(self.startup_btn, bool(self._toggles['startup']))
+        self._set_button_checked(self.drain_btn, bool(self._toggles['drain']))
+        self._set_button_checked(self.replace_btn, bool(self._toggles['replace']))
 
         # Buttons are only usable in SETUP state
         disabled = (self.state != STATE_SETUP)
         for btn in self._all_toggle_buttons.values():
-            btn.config(state="normal" if not disabled else "disabled")
+            self._view.render(btn, state="normal" if not disabled else "disabled")
 
     def _set_button_checked(self, btn, checked):
         if checked:
-            btn.config(text="✓", relief="sunken", bg="#d0ffd0")
+            self._view.render(btn, text="✓", relief="sunken", bg="#d0ffd0")
         else:
-            btn.config(text="", relief="raised", bg=b_color)
+            self._view.render(btn, text="", relief="raised", bg=b_color)
 
     # -------------------------
-    # Toggle handlers (user pressed the large square toggles)
-    # All toggles only active in SETUP state
+    # Tk / button bridge: these run on the caller's thread and only hand
+    # the request to the controller loop, where all state changes happen
     # -------------------------
+    def start(self):
+        return self.controller.call(self._start)
+
+    def pause(self):
+        return self.controller.call(self._pause)
+
+    def stop(self, reset=False):
+        self._trip()
+        return self.controller.call(self._stop, reset)
+
     def _toggle_startup(self):
-        # only allow toggle when in setup mode
-        if self.state != STATE_SETUP:
-            return
-        with self._buttons_lock:
-            new = 0 if self.startup_var.get() else 1
-            # ensure mutually exclusive with other special states
-            if new:
-                # entering startup: unset others
-                self.drain_var.set(0)
-                self.replace_var.set(0)
-                self._enter_startup_state()
-            else:
-                self._leave_special_state()
-            self.startup_var.set(new)
-            self._update_toggle_visuals()
+        self.controller.call(self._toggle, 'startup')
 
     def _toggle_drain(self):
-        if self.state != STATE_SETUP:
-            return
-        with self._buttons_lock:
-            new = 0 if self.drain_var.get() else 1
-            if new:
-                self.startup_var.set(0)
-                self.replace_var.set(0)
-                self._enter_drain_state()
-            else:
-                self._leave_special_state()
-            self.drain_var.set(new)
-            self._update_toggle_visuals()
+        self.controller.call(self._toggle, 'drain')
 
     def _toggle_replace(self):
+        self.controller.call(self._toggle, 'replace')
+
+    def _on_stop_button(self):
+        self._trip()
+        self.controller.call(self._external_stop)
+
+    def _trip(self):
+        # Outputs go safe on the caller's thread, before the loop gets the
+        # request: cancel tokens stop stepper threads/waves, then motor PWM,
+        # enables and coils are all driven low
+        pressed_at = CLOCK.perf_counter()
+        self.controller.trip()
+        if self.station is None:
+            return   # hardware not up yet: nothing is driven
+        self.station.safe()
+        if PROFILE is not None:
+            PROFILE.add("stop_to_outputs_off", CLOCK.perf_counter() - pressed_at)
+        self._stop_requested_at = pressed_at
+
+    # -------------------------
+    # Toggle handlers (user pressed the large square toggles)
+    # All toggles only active in SETUP state; they are mutually exclusive
+    # -------------------------
+    def _toggle(self, name):
         if self.state != STATE_SETUP:
             return
-        # prevent rapid toggles while motor is moving
-        if self._replace_lock.locked():
+        # prevent rapid replace toggles while the motor is moving
+        if name == 'replace' and self.controller.busy('motor'):
             return
-        with self._buttons_lock:
-            new = 0 if self.replace_var.get() else 1
-            if new:
-                # entering replace sample
-                self.startup_var.set(0)
-                self.drain_var.set(0)
-                self._enter_replace_state()
-            else:
-                # user unchecked: move motor down then leave special state
-                self._leave_replace_state_triggered_by_uncheck()
-            self.replace_var.set(new)
-            self._update_toggle_visuals()
-
-    # -------------------------
-    # Enter / leave special states
-    # -------------------------
-    def _enter_startup_state(self):
-        # set state and start pump1 continuously
-        self.state = STATE_STARTUP
-        # Pump1 ON
-        GPIO.output(ENA, 1)
-        GPIO.output(ENB, 1)
-        # Pump stepping outputs (if used) left unchanged; on real hardware the motor driver would step
-        # Ensure motor holding PWM is cleared
-        threading.Thread(target=self._startup_pump1_loop, daemon=True).start()
-
-    def _startup_pump1_loop(self):
-        sequence = [[1,0,1,0], [0,1,1,0], [0,1,0,1], [1,0,0,1]]
-        step_index = 0
-        step_delay = 0.001
-
-        while self.state == STATE_STARTUP:
-            step = sequence[step_index]
-            GPIO.output(IN1, step[0])
-            GPIO.output(IN2, step[1])
-            GPIO.output(IN3, step[2])
-            GPIO.output(IN4, step[3])
-            step_index = (step_index + 1) % len(sequence)
-            time.sleep(step_delay)
-
-    # When leaving startup, shut down coils
-        for pin in [IN1, IN2, IN3, IN4]:
-            GPIO.output(pin, 0)
-
-    def _enter_drain_state(self):
-        self.state = STATE_DRAIN
-        GPIO.output(P2_ENA, 1)
-        GPIO.output(P2_ENB, 1)
-        threading.Thread(target=self._drain_pump2_loop, daemon=True).start()
-    def _drain_pump2_loop(self):
-        sequence = [[1,0,1,0], [0,1,1,0], [0,1,0,1], [1,0,0,1]]
-        step_index = 0
-        step_delay = 0.001
-        while self.state == STATE_DRAIN:
-            step = sequence[step_index]
-            GPIO.output(P2_IN1, step[0])
-            GPIO.output(P2_IN2, step[1])
-            GPIO.output(P2_IN3, step[2])
-            GPIO.output(P2_IN4, step[3])
-            step_index = (step_index + 1) % len(sequence)
-            time.sleep(step_delay)
-        for pin in [P2_IN1, P2_IN2, P2_IN3, P2_IN4]:
-            GPIO.output(pin, 0)
-
-    def _enter_replace_state(self):
-        def worker():
-            acquired = self._replace_lock.acquire(False)
-            if not acquired:
-                return
-            try:
-                self.state = STATE_REPLACE_SAMPLE
-                self.motor_active = True
-                pwm_in1.ChangeDutyCycle(0)
-                pwm_in2.ChangeDutyCycle(MOTOR_SPEED_UP)
-
-                t_end = time.time() + 1.0
-                while time.time() < t_end:
-                    # if external button changed state, abort early
-                    if self.state != STATE_REPLACE_SAMPLE:
-                        break
-                    time.sleep(0.05)
-
-                # Stop upward movement
-                pwm_in1.ChangeDutyCycle(0)
-                pwm_in2.ChangeDutyCycle(0)
-
-                # Apply HOLD torque only if Replace is still active
-                if self.replace_var.get() and self.state == STATE_REPLACE_SAMPLE:
-                    pwm_in2.ChangeDutyCycle(HOLD_PWM)
-
-                self.motor_active = False
-            finally:
-                if self._replace_lock.locked():
-                    self._replace_lock.release()
-
-        threading.Thread(target=worker, daemon=True).start()
-
-
-
-    
+        new = 0 if self._toggles[name] else 1
+        if new:
+            for other in self._toggles:
+                if other != name:
+                    self._set_toggle(other, 0)
+            self._enter_special_state(name)
+        elif name == 'replace':
+            # user unchecked: move motor down then leave special state
+            self.controller.spawn('motor', self._replace_down())
+        else:
+            self._leave_special_state()
+        self._set_toggle(name, new)
+
+    # -------------------------
+    # Enter / leave special states (each is one cancellable actuator task)
+    # -------------------------
+    def _enter_special_state(self, name):
+        if name == 'startup':
+            # pump1 enabled and stepping until startup is left; coils released on exit
+            self._set_state(STATE_STARTUP)
+            self.controller.spawn('pump1', self.controller.run_blocking(self.station.pump1.run_continuous))
+        elif name == 'drain':
+            self._set_state(STATE_DRAIN)
+            self.controller.spawn('pump2', self.controller.run_blocking(self.station.pump2.run_continuous))
+        elif name == 'replace':
+            self.controller.spawn('motor', self._replace_up())
+
+    async def _replace_up(self):
+        # lift the sample for 1 s, then hold it up while Replace stays checked
+        self._set_state(STATE_REPLACE_SAMPLE)
+        self._set_motor_active(True)
+        try:
+            self.station.motor(0, self.calibration['MOTOR_SPEED_UP'])
+            await self.controller.sleep(1.0)
+            self.station.motor(0, 0)
+            if self._toggles['replace'] and self.state == STATE_REPLACE_SAMPLE:
+                self.station.motor(0, self.calibration['HOLD_PWM'])
+        except asyncio.CancelledError:
+            self.station.motor(0, 0)
+            raise
+        finally:
+            self._set_motor_active(False)
+
+    async def _replace_down(self):
+        # move the sample back down for 1 s, then return to SETUP
+        self._set_motor_active(True)
+        try:
+            self.station.motor(self.calibration['MOTOR_SPEED_DOWN'], 0)
+            await self.controller.sleep(1.0)
+        finally:
+            self.station.motor(0, 0)
+            self._set_motor_active(False)
+            self._set_state(STATE_SETUP)
+
     def _leave_special_state(self):
-        # Called when a special toggle is unchecked or external button pressed
         # Turn off pumps and return to SETUP
-        GPIO.output(ENA, 0)
-        GPIO.output(ENB, 0)
-        GPIO.output(P2_ENA, 0)
-        GPIO.output(P2_ENB, 0)
-        # Reset replace_var if it was active; if motor was in hold, we want to drop it to neutral
-        if self.replace_var.get():
-            # start motor down move to resting position (non-rapid)
-            self._leave_replace_state_triggered_by_uncheck()
-            self.replace_var.set(0)
-        self.state = STATE_SETUP
-        # Ensure PWMs are cleared
-        pwm_in1.ChangeDutyCycle(0)
-        pwm_in2.ChangeDutyCycle(0)
-
-    def _leave_replace_state_triggered_by_uncheck(self):
-        # Move motor down for 1 seconds when replace checkbox is unchecked.
-        # Non-interruptible movement; use lock to ignore rapid clicks and other motor requests during movement.
-        def worker_down():
-            # try to get lock and hold it through movement
-            got = self._replace_lock.acquire(False)
-            if not got:
-                # if currently moving up, wait briefly then attempt to acquire to do move-down
-                # but do not block UI indefinitely
-                waited = 0.0
-                while not self._replace_lock.acquire(False) and waited < 1.0:
-                    time.sleep(0.05)
-                    waited += 0.05
-                if not self._replace_lock.locked():
-                    # couldn't acquire in reasonable time; abort move-down to avoid deadlock
-                    return
-            try:
-                self.motor_active = True
-                pwm_in1.ChangeDutyCycle(MOTOR_SPEED_DOWN)
-                pwm_in2.ChangeDutyCycle(0)
-                t_end = time.time() + 1.0
-                while time.time() < t_end:
-                    time.sleep(0.05)
-                pwm_in1.ChangeDutyCycle(0)
-                pwm_in2.ChangeDutyCycle(0)
-                self.motor_active = False
-            finally:
-                if self._replace_lock.locked():
-                    self._replace_lock.release()
-                # After returning to resting, ensure state goes back to SETUP
-                self.state = STATE_SETUP
-
-        t = threading.Thread(target=worker_down, daemon=True)
-        t.start()
-
-    # -------------------------
-    # External buttons loop (monitors STOP/GO/PAUSE physical buttons)
-    # If any external button pressed, special states exit and system returns to SETUP
-    # -------------------------
-    def _external_buttons_loop(self):
-        while True:
-            try:
-                if GPIO.input(STOP_PIN) == GPIO.LOW:
-                    self._external_button_pressed()
-                    self.stop(True)
-                if GPIO.input(GO_PIN) == GPIO.LOW:
-                    # on GO we start main run loop if allowed
-                    #self._external_button_pressed()
-                    self.start()
-                if GPIO.input(PAUSE_PIN) == GPIO.LOW:
-                    #self._external_button_pressed()
-                    self.pause()
-            except Exception:
-                # ignore mocked GPIO exceptions on desktop
-                pass
-            time.sleep(0.05)
-
-    def _external_button_pressed(self):
-        # Always clear holding torque immediately
-        pwm_in1.ChangeDutyCycle(0)
-        pwm_in2.ChangeDutyCycle(0)
-
-        with self._buttons_lock:
-            # Tell any worker loops that we are no longer in special states
-            self.state = STATE_SETUP
-
-            self.startup_var.set(0)
-            self.drain_var.set(0)
-
-            if self.replace_var.get():
-                self.replace_var.set(0)
-                self._leave_replace_state_triggered_by_uncheck()
-
-            GPIO.output(ENA, 0)
-            GPIO.output(ENB, 0)
-            GPIO.output(P2_ENA, 0)
-            GPIO.output(P2_ENB, 0)
-
-            self._update_toggle_visuals()
-
-
-    # -------------------------
-    # Run control methods (unchanged but respect special states)
-    # -------------------------
-    #self.start_time_offset = 0
-    def pause(self):
+        self.controller.cancel('pump1')
+        self.controller.cancel('pump2')
+        self.station.pumps_off()
+        if self._toggles['replace']:
+            self.controller.spawn('motor', self._replace_down())
+            self._set_toggle('replace', 0)
+        self._set_state(STATE_SETUP)
+        self.station.motor(0, 0)
+
+    # -------------------------
+    # External STOP button: exits any special state or run and returns to
+    # SETUP (a lifted sample is lowered again). GO and PAUSE map to start/pause.
+    # -------------------------
+    def _external_stop(self):
+        replace = self._toggles['replace']
+        self._set_toggle('startup', 0)
+        self._set_toggle('drain', 0)
+        self._set_toggle('replace', 0)
+        self._stop(True)
+        if replace:
+            self.controller.spawn('motor', self._replace_down())
+
+    # -------------------------
+    # Run control (controller loop)
+    # -------------------------
+    def _pause(self):
         if self.state != STATE_RUNNING:
             return
-        self.pause_start = time.time()
-        self.state = STATE_PAUSED
-        self._pause_flag.set()
+        # the run halts at the end of the current cycle; pause time is
+        # excluded from elapsed by the scheduler from that point on
+        self._set_state(STATE_PAUSED)
 
-    def start(self):
+    def _start(self, resume_cycle=0):
         if self.state == STATE_PAUSED:
-            paused_duration = time.time() - self.pause_start
-            self.start_time_offset += paused_duration
-            self.state = STATE_RUNNING
-            self._pause_flag.clear()
+            self._set_state(STATE_RUNNING)
+            if self._resume is not None:
+                self._resume.set()
             return
-        if self.state == STATE_SETUP:
-            self.elapsed = 0
-            self.cycle_count = 0
-            self.start_time_offset = 0
-            self.pause_start = None
-        if self.state in [STATE_STARTUP, STATE_DRAIN, STATE_REPLACE_SAMPLE]:
+        if self.state != STATE_SETUP:
+            return   # special states (startup/drain/replace) must be left first
+        self.interrupted_run = None   # a new run replaces the journal
+        self.cycle_count = resume_cycle
+        self._cycle = self._compile_cycle()
+        self._holders = {}
+        for resource, first, second in conflicts(self._cycle, self.fluid_cycle):
+            # the run still waits for the resource at run time; this flags a plan that will
+            print(f"Resource conflict: {first} and {second} both need {resource}")
+        self._scheduler.start(self.fluid_cycle, cycles=resume_cycle)
+        self.elapsed = self._scheduler.elapsed()
+        self.journal.begin({'total_seconds': self.total_seconds, 'chews': self.chews,
+                            'fluid_cycle': self.fluid_cycle}, resume_cycle, self.elapsed)
+        self._open_telemetry()
+        self._post_progress()
+        self._set_state(STATE_RUNNING)
+        self.controller.spawn('run', self._run())
+
+    def _stop(self, reset=False):
+        if self.station is None:
             return
-
-        self.state = STATE_RUNNING
-        self._run_flag.set()
-        self._pause_flag.clear()
-        if not (self._run_thread and self._run_thread.is_alive()):
-            self._run_thread = threading.Thread(target=self._run_loop, daemon=True)
-            self._run_thread.start()
-
-
-    def stop(self, reset=False):
-        self._run_flag.clear()
-        self._pause_flag.clear()
-        self.state = STATE_SETUP
-        # Stop motor hold PWM when going to setup
-        pwm_in1.ChangeDutyCycle(0)
-        pwm_in2.ChangeDutyCycle(0)
-        # turn off any pumps
-        GPIO.output(ENA, 0)
-        GPIO.output(ENB, 0)
-        GPIO.output(P2_ENA, 0)
-        GPIO.output(P2_ENB, 0)
+        self._log(telemetry.STOP)
+        self.controller.cancel_all()
+        self._set_state(STATE_SETUP)
+        # Stop motor hold PWM and pumps when going to setup
+        self.station.safe()
         if reset:
             self.elapsed = 0
             self.cycle_count = 0
+            self._post_progress()
 
     # -------------------------
-    # Motor helper (used by main run loop). Replace-sample movement uses specialized methods above.
+    # Motor helper (used by the run). Replace-sample moves own the 'motor' slot.
     # -------------------------
-    def _spin_motor(self, direction, speed, duration, hold=False):
-        # Respect replace lock: if replace sample is doing a dedicated move, don't interfere
-        if self._replace_lock.locked():
+    async def _spin_motor(self, direction, speed, duration, hold=False, hold_pwm=HOLD_PWM):
+        # a replace-sample move owns the motor: don't interfere
+        if self.controller.busy('motor'):
             return
-        self.motor_active = True
-        end_time = time.time() + duration
-
-        if direction == 'down':
-            pwm_in1.ChangeDutyCycle(speed)
-            pwm_in2.ChangeDutyCycle(0)
-            while time.time() < end_time and self._run_flag.is_set():
-                time.sleep(0.05)
-            pwm_in1.ChangeDutyCycle(0)
-            pwm_in2.ChangeDutyCycle(0)
-
-        elif direction == 'up':
-            pwm_in1.ChangeDutyCycle(0)
-            pwm_in2.ChangeDutyCycle(speed)
-            while time.time() < end_time and self._run_flag.is_set():
-                time.sleep(0.05)
-            # Maintain holding torque if requested
-            if hold and self.state in [STATE_RUNNING, STATE_PAUSED]:
-                pwm_in1.ChangeDutyCycle(0)
-                pwm_in2.ChangeDutyCycle(HOLD_PWM)
-            else:
-                pwm_in1.ChangeDutyCycle(0)
-                pwm_in2.ChangeDutyCycle(0)
+        await self.controller.spawn('motor', self._motor_move(direction, speed, duration, hold, hold_pwm))
+
+    async def _motor_move(self, direction, speed, duration, hold, hold_pwm):
+        self._set_motor_active(True)
+        axis = self.station.chew_axis
+        try:
+            if direction == 'down':
+                if axis is not None:
+                    await self._axis_move(axis, 'down', speed, duration)
+                else:
+                    self.station.motor(speed, 0)
+                    await self._timed_move('motor_down', duration)
+                self.station.motor(0, 0)
 
-        self.motor_active = False
+            elif direction == 'up':
+                if axis is not None:
+                    await self._axis_move(axis, 'up', speed, duration)
+                else:
+                    self.station.motor(0, speed)
+                    await self._timed_move('motor_up', duration)
+                # Maintain holding torque if requested
+                if hold and self.state in [STATE_RUNNING, STATE_PAUSED]:
+                    self.station.motor(0, hold_pwm)
+                else:
+                    self.station.motor(0, 0)
+        except asyncio.CancelledError:
+            self.station.motor(0, 0)
+            raise
+        finally:
+            self._set_motor_active(False)
+
+    async def _axis_move(self, axis, direction, pwm, timeout):
+        # closed loop: ends on position, the recipe duration is only the timeout
+        started = CLOCK.perf_counter()
+        await axis.move(direction, pwm, timeout, self.controller.sleep_until)
+        if PROFILE is not None:
+            PROFILE.add('axis_' + direction, CLOCK.perf_counter() - started)
+
+    async def _timed_move(self, name, duration):
+        # wait out a motor move; when profiling, record how long PWM actually stayed on past duration
+        started = CLOCK.perf_counter()
+        await self.controller.sleep(duration)
+        if PROFILE is not None:
+            PROFILE.add(name, CLOCK.perf_counter() - started - duration)
 
-    def _wait_or_pause(self, duration):
-        end_time = time.time() + duration
-        while time.time() < end_time and self._run_flag.is_set():
-            if self._pause_flag.is_set():
-                time.sleep(0.05)
-                continue
-        time.sleep(0.01)  # finer granularity
     # -------------------------
-    # Main run loop (unchanged behavior)
+    # Recipe actions (one per command "action"); deadline is the end of the
+    # command on the scheduler's timeline
     # -------------------------
-    def _run_loop(self):
-        self.base_start_time = time.time()
-        self.start_time_offset = 0
-        #start_time = time.time() - self.elapsed
+    async def _do_wait(self, cmd, deadline):
+        self._log(telemetry.HOLD_START, cmd.duration)
+        await self.controller.sleep_until(deadline)
+        self._log(telemetry.HOLD_END)
+
+    async def _do_pump(self, cmd, deadline):
+        pump = cmd.args['pump']
+        driver = self.station.pumps[pump]
+        self._log(telemetry.PUMP_ON, pump)
+        if 'volume' in cmd.args:
+            job = self.controller.run_blocking(driver.dose, cmd.args['volume'])
+        else:
+            job = self.controller.run_blocking(driver.run_for, cmd.duration)
+        await self.controller.spawn(f'pump{pump}', job)
+        self._log(telemetry.PUMP_OFF, pump)
+
+    async def _do_motor(self, cmd, deadline):
+        hold_pwm = cmd.args.get('hold_pwm', 0)
+        self._log(telemetry.CHEW_DOWN if cmd.args['direction'] == 'down' else telemetry.CHEW_UP,
+                  cmd.args['pwm'])
+        await self._spin_motor(cmd.args['direction'], cmd.args['pwm'], cmd.duration,
+                               hold=hold_pwm > 0, hold_pwm=hold_pwm)
+        self._log(telemetry.MOTOR_OFF, hold_pwm)
 
-        next_cycle_time = self.base_start_time
-        sequence = [[1,0,1,0],[0,1,1,0],[0,1,0,1],[1,0,0,1]]
-        rev_sequence = [[1,0,0,1],[0,1,0,1],[0,1,1,0],[1,0,1,0]]
-        step_delay = 0.001
+    # -------------------------
+    # Run telemetry (records are buffered; a background thread writes them)
+    # -------------------------
+    def _open_telemetry(self):
+        self._close_telemetry()
+        path = os.path.join(RUN_LOG_DIR, time.strftime("run_%Y%m%d_%H%M%S.wlog"))
+        try:
+            self._telemetry = telemetry.TelemetryLog(path, clock=CLOCK.monotonic)
+        except OSError as e:
+            print(f"Telemetry disabled: {e}")
+            return
+        self._log(telemetry.RUN_START, self.fluid_cycle)
+
+    def _close_telemetry(self):
+        log, self._telemetry = self._telemetry, None
+        if log is not None:
+            log.close()
+            print(f"Run log: {log.path}")
+
+    def _log(self, event, arg=0.0):
+        log = self._telemetry
+        if log is not None:
+            log.record(event, self.cycle_count, arg)
+
+    async def _pause_run(self):
+        # the run is parked until resume (start) or stop; pause time is excluded from elapsed
+        self._log(telemetry.PAUSE)
+        self._scheduler.pause()
+        self._resume = asyncio.Event()
+        try:
+            await self._resume.wait()
+        finally:
+            self._resume = None
+            self._scheduler.resume()
+        self._log(telemetry.RESUME)
 
-        while self._run_flag.is_set():
-            
+    # -------------------------
+    # Main run: replays the precompiled recipe timeline once per fluid cycle
+    # -------------------------
+    async def _run(self):
+        try:
+            await self._run_cycles()
+        except asyncio.CancelledError:
+            # stopped: _stop() already set SETUP; only make the outputs safe here
+            for task in self._detached:
+                task.cancel()
+            self.station.motor(0, 0)
+            self.station.pumps_off()
+            if PROFILE is not None and self._stop_requested_at is not None:
+                PROFILE.add("stop_to_loop_exit", CLOCK.perf_counter() - self._stop_requested_at)
+            self._finish_run()
+            raise
+        # ran to the end of the timer: stop safely
+        self._set_state(STATE_SETUP)
+        self._post_progress()
+        self.station.motor(0, 0)
+        self._finish_run()
+
+    def _finish_run(self):
+        print(f"Run finished: {self._scheduler.report(self.total_seconds)}")
+        self._log(telemetry.RUN_END)
+        self._close_telemetry()
+        self.journal.finish()
+
+    async def _run_cycles(self):
+        sched = self._scheduler
+        timeline = [(cmd, self._actions[cmd.action]) for cmd in self._cycle.commands]
 
-            now = time.time()
-            self.elapsed = (now - self.base_start_time) - self.start_time_offset
+        while True:
+            self.elapsed = sched.elapsed()
 
             # Stop if elapsed time exceeds total_seconds
             if self.elapsed >= self.total_seconds:
                 break
 
-            # Handle pause
-            if self._pause_flag.is_set():
-                time.sleep(0.05)
+            # Handle pause: park until resume or stop (pause time not counted)
+            if self.state == STATE_PAUSED:
+                await self._pause_run()
                 continue
 
-            if now >= next_cycle_time:
-                # --- INITIAL_WAIT ---
-
-                # wait_end = now + INITIAL_WAIT
-                # while time.time() < wait_end and self._run_flag.is_set():
-                #     time.sleep(0.05)
-                self._wait_or_pause(INITIAL_WAIT)
-
-                # --- Pump 1 ---
-                GPIO.output(ENA, 1)
-                GPIO.output(ENB, 1)
-                pump_end = time.time() + PUMP_RUN_TIME
-                step_index = 0
-                while time.time() < pump_end and self._run_flag.is_set():
-                    step = sequence[step_index]
-                    GPIO.output(IN1, step[0])
-                    GPIO.output(IN2, step[1])
-                    GPIO.output(IN3, step[2])
-                    GPIO.output(IN4, step[3])
-                    step_index = (step_index + 1) % len(sequence)
-                    time.sleep(step_delay)
-                GPIO.output(ENA, 0)
-                GPIO.output(ENB, 0)
-                for pin in [IN1, IN2, IN3, IN4]:
-                    GPIO.output(pin, 0)
-                
-                if self.chews == 0:
-                    time_used = INITIAL_WAIT + PUMP_RUN_TIME + PUMP_RUN_TIME
-                    idle_time = self.fluid_cycle - time_used
-
-                    if idle_time > 0:
-                        self._wait_or_pause(idle_time)
-                # Skip chewing loop
-
-                # --- Chewing sequence (motor down/up) ---
-                else:
-                    for chew in range(self.chews):
-                        self._spin_motor('down', MOTOR_SPEED_DOWN, MOTOR_DOWN_DURATION)
-                        hold_time = self._calculate_hold_time()
-                        hold_end = time.time() + hold_time
-                        while time.time() < hold_end and self._run_flag.is_set():
-                            time.sleep(0.05)
-
-                        self._spin_motor('up', MOTOR_SPEED_UP, MOTOR_UP_DURATION, hold=True)
-                        hold_end = time.time() + hold_time
-                        while time.time() < hold_end and self._run_flag.is_set():
-                            time.sleep(0.05)
-
-                # --- Pump 2 ---
-                GPIO.output(P2_ENA, 1)
-                GPIO.output(P2_ENB, 1)
-                pump_end = time.time() + PUMP_RUN_TIME
-                step_index = 0
-                while time.time() < pump_end and self._run_flag.is_set():
-                    step = sequence[step_index]
-                    GPIO.output(P2_IN1, step[0])
-                    GPIO.output(P2_IN2, step[1])
-                    GPIO.output(P2_IN3, step[2])
-                    GPIO.output(P2_IN4, step[3])
-                    step_index = (step_index + 1) % len(sequence)
-                    time.sleep(step_delay)
-                GPIO.output(P2_ENA, 0)
-                GPIO.output(P2_ENB, 0)
-                for pin in [P2_IN1, P2_IN2, P2_IN3, P2_IN4]:
-                    GPIO.output(pin, 0)
-
-                # --- Increment cycle count ---
-                self.cycle_count += 1
-
-                # --- Prepare for next cycle ---
-                next_cycle_time += self.fluid_cycle
-
-                # >>> NEW: STOP HERE IF PAUSED BEFORE NEXT CYCLE <<<
-
-                while self._pause_flag.is_set() and self._run_flag.is_set():
-
-                    # Ensure the motor is NOT holding during pause
-                    pwm_in1.ChangeDutyCycle(0)
-                    pwm_in2.ChangeDutyCycle(0)
-
-                    # Ensure pumps fully off
-                    GPIO.output(ENA, 0)
-                    GPIO.output(ENB, 0)
-                    GPIO.output(P2_ENA, 0)
-                    GPIO.output(P2_ENB, 0)
-                    time.sleep(0.05)
-
-
-            time.sleep(0.05)
-
-        # After finishing loop, stop safely
-        self._run_flag.clear()
-        self.state = STATE_SETUP
-        pwm_in1.ChangeDutyCycle(0)
-        pwm_in2.ChangeDutyCycle(0)
+            # Sleep until the next cycle is due (or the run time runs out)
+            due = sched.next_cycle_due()
+            if CLOCK.monotonic() < due:
+                await self.controller.sleep_until(min(due, sched.time_at(self.total_seconds)))
+                continue
+
+            # Every command is laid on the cycle's ideal timeline; waits and
+            # holds end on absolute deadlines so overruns come out of them
+            sched.begin_cycle()
+            self._log(telemetry.CYCLE_START)
+            if self._cycle.pipelined:
+                await self._run_graph(sched)
+            else:
+                for cmd, action in timeline:
+                    await action(cmd, sched.advance(cmd.duration))
+                    overrun = sched.end_phase(cmd.name)
+                    if PROFILE is not None:
+                        PROFILE.add("phase:" + cmd.name, overrun)
+                sched.end_cycle()
+
+            # --- Increment cycle count ---
+            self._log(telemetry.CYCLE_END)
+            self.cycle_count += 1
+            self.journal.checkpoint(self.cycle_count, sched.elapsed())
+            self._post_progress()
+
+            # Stop here if paused before the next cycle
+            if self.state == STATE_PAUSED:
+                # the pause starts now, not once a detached drain has finished
+                sched.pause()
+                await self._finish_detached()
+                # Ensure the motor is NOT holding and pumps are fully off during pause
+                self.station.motor(0, 0)
+                self.station.pumps_off()
+                await self._pause_run()
+        await self._finish_detached()
+
+    async def _run_graph(self, sched):
+        """
+        One pipelined cycle: each command is a task that starts when the
+        commands it depends on are done. Resources are handed over in
+        command order, across cycles too: a command first waits for the
+        last task that claimed any of its resources (e.g. last cycle's drain
+        pump, if it runs late), so no two tasks ever drive one actuator.
+        Returns when the main sequence is done; detached commands run on.
+        """
+        due = sched.next_cycle_due()
+        tasks = []
+        for cmd in self._cycle.commands:
+            holders = [self._holders[r] for r in cmd.resources if r in self._holders]
+            task = asyncio.ensure_future(self._run_task(
+                cmd, [tasks[i] for i in cmd.deps], holders, due + cmd.start + cmd.duration, sched))
+            for r in cmd.resources:
+                self._holders[r] = task
+            tasks.append(task)
+        self._detached = [t for t in self._detached if not t.done()] + [
+            t for t, cmd in zip(tasks, self._cycle.commands) if cmd.detached]
+        main = [t for t, cmd in zip(tasks, self._cycle.commands) if not cmd.detached]
+        try:
+            await asyncio.gather(*main)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        sched.end_cycle(due + self._cycle.main_end)
+
+    async def _run_task(self, cmd, deps, holders, deadline, sched):
+        for task in deps:
+            await task
+        waiting = [task for task in holders if not task.done()]
+        if waiting:
+            started = CLOCK.perf_counter()
+            await asyncio.wait(waiting)
+            if PROFILE is not None:
+                PROFILE.add("resource_wait", CLOCK.perf_counter() - started)
+        await self._actions[cmd.action](cmd, deadline)
+        overrun = sched.end_task(cmd.name, deadline)
+        if PROFILE is not None:
+            PROFILE.add("phase:" + cmd.name, overrun)
+
+    async def _finish_detached(self):
+        # let last cycle's detached commands (the drain) run to completion
+        detached, self._detached = self._detached, []
+        if detached:
+            await asyncio.wait(detached)
 
     # -------------------------
     # Close handler
     # -------------------------
     def _on_close(self):
-        self._run_flag.clear()
-        self._pause_flag.clear()
-        pwm_in1.stop()
-        pwm_in2.stop()
-        GPIO.cleanup()
-        self.root.destroy()
-
+        self._events.stop()
+        if self._buttons is not None:
+            self._buttons.close()
+        self.controller.call(self._stop).result()
+        self.controller.close()
+        self._close_telemetry()
+        if PROFILE is not None:
+            print(PROFILE.report())
+        stats = self._view.stats()
+        print(f"UI refresh: {stats['applied']} widget updates applied, {stats['skipped']} skipped")
+        if self.station is not None:
+            self.station.close()
+        self.settings.close()
+        self.journal.close()
+        if GPIO is not None:
+            GPIO.cleanup()
+        if self.root is not None:
+            self.root.destroy()
+
+STARTUP.mark("import")
 
 if __name__ == "__main__":
     root = tk.Tk()
     app = DeviceUI(root)
+    if PROFILE is not None and hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: print(PROFILE.report()))
     root.mainloop()
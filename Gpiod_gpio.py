@@ -0,0 +1,328 @@
+#libgpiod (character device) GPIO with the RPi.GPIO calls the rig uses, for the Pi 5 and newer kernels
+import glob
+import os
+import select
+import sys
+import threading
+import time
+
+try:
+    import gpiod
+    from gpiod.line import Bias, Direction, Edge, Value
+except ImportError:   # needs the v2 bindings: pip install gpiod
+    gpiod = None
+
+CONSUMER = "wear-rig"
+# gpiochip whose line offsets are the BCM numbers (override with WEAR_RIG_GPIOCHIP)
+HEADER_CHIP_LABELS = ("pinctrl-rp1", "pinctrl-bcm2711", "pinctrl-bcm2835")
+
+
+def find_chip():
+    """Path of the gpiochip driving the 40-pin header."""
+    chip = os.environ.get("WEAR_RIG_GPIOCHIP")
+    if chip:
+        return chip
+    for path in sorted(glob.glob("/dev/gpiochip*")):
+        try:
+            with gpiod.Chip(path) as c:
+                if c.get_info().label in HEADER_CHIP_LABELS:
+                    return path
+        except OSError:
+            continue
+    raise RuntimeError("no Raspberry Pi header gpiochip found (set WEAR_RIG_GPIOCHIP)")
+
+
+class _Bundle:
+    # one line request covering a device's pins
+    def __init__(self, pins):
+        self.pins = tuple(pins)
+        self.settings = {}   # pin -> gpiod.LineSettings of the pins set up so far
+        self.request = None
+        self.requested = ()
+        self.callbacks = {}  # pin -> (callback, bouncetime s)
+        self.last_edge = {}  # pin -> timestamp (s) of the last reported edge
+
+
+class GpiodGPIO:
+    """
+    Stand-in for the RPi.GPIO module on the gpiod character device API.
+    Pins are grouped into bundles (e.g. Station.pin_bundles: each pump's
+    ENA/ENB/IN1-4, the buttons); each bundle is one line request, so an
+    output() of several of its pins is a single set_values() ioctl and its
+    edge events are read together by one event thread. Pins outside every
+    bundle get a request of their own. BCM numbering only.
+
+    PWM() is a threaded software PWM like RPi.GPIO's; the chew motor pins
+    normally get hardware PWM instead (Hardware_pwm.make_pwm).
+    """
+    BCM = 'BCM'
+    BOARD = 'BOARD'
+    OUT = 'OUT'
+    IN = 'IN'
+    LOW = 0
+    HIGH = 1
+    PUD_OFF = 'PUD_OFF'
+    PUD_UP = 'PUD_UP'
+    PUD_DOWN = 'PUD_DOWN'
+    FALLING = 'FALLING'
+    RISING = 'RISING'
+    BOTH = 'BOTH'
+    hardware_pwm = True   # the header's PWM pins are real (see Hardware_pwm.make_pwm)
+
+    def __init__(self, bundles=(), chip=None):
+        if gpiod is None:
+            raise RuntimeError("libgpiod Python bindings (v2) not installed: pip install gpiod")
+        self.chip = chip or find_chip()
+        self._bundles = {}
+        for pins in bundles:
+            bundle = _Bundle(pins)
+            for pin in bundle.pins:
+                self._bundles[pin] = bundle
+        self._lock = threading.Lock()
+        self._wake_r, self._wake_w = os.pipe()
+        self._event_thread = None
+        self._closed = False
+
+    # --- RPi.GPIO API ---
+    def setmode(self, mode):
+        if mode != self.BCM:
+            raise ValueError("GpiodGPIO only supports BCM numbering")
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, pin, mode, pull_up_down=None, initial=None):
+        if isinstance(pin, (list, tuple)):
+            for p in pin:
+                self.setup(p, mode, pull_up_down, initial)
+            return
+        if mode == self.OUT:
+            settings = gpiod.LineSettings(direction=Direction.OUTPUT,
+                                          output_value=Value.ACTIVE if initial else Value.INACTIVE)
+        else:
+            bias = {self.PUD_UP: Bias.PULL_UP, self.PUD_DOWN: Bias.PULL_DOWN}.get(pull_up_down, Bias.DISABLED)
+            settings = gpiod.LineSettings(direction=Direction.INPUT, bias=bias)
+        with self._lock:
+            bundle = self._bundle(pin)
+            bundle.settings[pin] = settings
+            self._apply(bundle)
+
+    # output() and input() hold the lock too: _apply() releases and replaces a
+    # bundle's request (e.g. the buttons' event detection being set up while
+    # the pumps step), and a write must not land on the released one
+    def output(self, pin, value):
+        if not isinstance(pin, (list, tuple)):
+            with self._lock:
+                self._bundles[pin].request.set_value(pin, Value.ACTIVE if value else Value.INACTIVE)
+            return
+        values = value if isinstance(value, (list, tuple)) else [value] * len(pin)
+        writes = {}
+        for p, v in zip(pin, values):
+            writes.setdefault(self._bundles[p], {})[p] = Value.ACTIVE if v else Value.INACTIVE
+        with self._lock:
+            for bundle, lines in writes.items():
+                bundle.request.set_values(lines)
+
+    def input(self, pin):
+        with self._lock:
+            value = self._bundles[pin].request.get_value(pin)
+        return self.HIGH if value == Value.ACTIVE else self.LOW
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        detect = {self.FALLING: Edge.FALLING, self.RISING: Edge.RISING, self.BOTH: Edge.BOTH}[edge]
+        with self._lock:
+            bundle = self._bundles[pin]
+            bundle.settings[pin].edge_detection = detect
+            bundle.callbacks[pin] = (callback, (bouncetime or 0) / 1000.0)
+            self._apply(bundle)
+            if self._event_thread is None:
+                self._event_thread = threading.Thread(target=self._event_loop, name="gpiod-events", daemon=True)
+                self._event_thread.start()
+        self._wake()
+
+    def remove_event_detect(self, pin):
+        with self._lock:
+            bundle = self._bundles.get(pin)
+            if bundle is None or pin not in bundle.callbacks:
+                return
+            del bundle.callbacks[pin]
+            bundle.settings[pin].edge_detection = Edge.NONE
+            self._apply(bundle)
+        self._wake()
+
+    def PWM(self, pin, freq):
+        return SoftwarePWM(self, pin, freq)
+
+    def cleanup(self, *pins):
+        # releases every line (the rig only ever cleans up everything)
+        with self._lock:
+            self._closed = True
+            bundles = {id(b): b for b in self._bundles.values()}.values()
+            for bundle in bundles:
+                if bundle.request is not None:
+                    bundle.request.release()
+                    bundle.request = None
+        self._wake()
+        if self._event_thread is not None:
+            self._event_thread.join()
+            self._event_thread = None
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+
+    # --- line requests ---
+    def _bundle(self, pin):
+        bundle = self._bundles.get(pin)
+        if bundle is None:
+            bundle = self._bundles[pin] = _Bundle([pin])
+        return bundle
+
+    def _apply(self, bundle):
+        # (re)request the bundle's set-up lines as one request; outputs keep their level
+        if bundle.request is not None:
+            for pin in bundle.requested:
+                if bundle.settings[pin].direction == Direction.OUTPUT:
+                    bundle.settings[pin].output_value = bundle.request.get_value(pin)
+        config = {(pin,): settings for pin, settings in bundle.settings.items()}
+        pins = tuple(sorted(bundle.settings))
+        if bundle.request is not None and pins == bundle.requested:
+            bundle.request.reconfigure_lines(config)
+            return
+        if bundle.request is not None:
+            bundle.request.release()
+        bundle.request = gpiod.request_lines(self.chip, consumer=CONSUMER, config=config)
+        bundle.requested = pins
+
+    # --- edge events ---
+    def _wake(self):
+        os.write(self._wake_w, b"x")
+
+    def _event_loop(self):
+        while True:
+            with self._lock:
+                if self._closed:
+                    return
+                watched = {b.request.fd: b for b in self._bundles.values()
+                           if b.callbacks and b.request is not None}
+            ready, _, _ = select.select([self._wake_r, *watched], [], [])
+            if self._wake_r in ready:
+                os.read(self._wake_r, 64)
+                continue   # requests may have changed: rebuild the fd set
+            for fd in ready:
+                self._dispatch(watched[fd])
+
+    def _dispatch(self, bundle):
+        try:
+            events = bundle.request.read_edge_events()
+        except (OSError, ValueError, AttributeError):
+            return   # request released or reconfigured under us
+        for event in events:
+            pin = event.line_offset
+            callback, bouncetime = bundle.callbacks.get(pin, (None, 0))
+            if callback is None:
+                continue
+            # RPi.GPIO-style bouncetime: drop edges too soon after the last one reported
+            t = event.timestamp_ns / 1e9
+            if t - bundle.last_edge.get(pin, float("-inf")) < bouncetime:
+                continue
+            bundle.last_edge[pin] = t
+            callback(pin)
+
+
+class SoftwarePWM:
+    """Threaded software PWM (RPi.GPIO.PWM's interface) for pins without hardware PWM."""
+    def __init__(self, gpio, pin, freq):
+        self.gpio = gpio
+        self.pin = pin
+        self.freq = freq
+        self.duty = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, duty):
+        self.ChangeDutyCycle(duty)
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=f"pwm{self.pin}", daemon=True)
+            self._thread.start()
+
+    def ChangeDutyCycle(self, duty):
+        if not 0.0 <= duty <= 100.0:
+            raise ValueError("dutycycle must have a value from 0.0 to 100.0")
+        self.duty = duty
+
+    def ChangeFrequency(self, freq):
+        if freq <= 0:
+            raise ValueError("frequency must be greater than 0.0")
+        self.freq = freq
+
+    def _run(self):
+        output = self.gpio.output
+        level = None
+        while not self._stop.is_set():
+            period = 1.0 / self.freq
+            high = period * self.duty / 100.0
+            if 0 < high < period:
+                output(self.pin, 1)
+                time.sleep(high)
+                output(self.pin, 0)
+                time.sleep(period - high)
+                level = 0
+            else:
+                # 0% or 100%: hold the line instead of rewriting it every period
+                if level != (high > 0):
+                    level = int(high > 0)
+                    output(self.pin, level)
+                self._stop.wait(period)
+        output(self.pin, 0)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+# -------------------------------------------------------------------
+# MICROBENCHMARK (python Gpiod_gpio.py [pin ...])
+# -------------------------------------------------------------------
+def write_latency(gpio, pins, writes=20000):
+    """Mean time (s) of one single-pin output() and of one output() of all pins."""
+    started = time.perf_counter()
+    for i in range(writes):
+        gpio.output(pins[0], i & 1)
+    single = (time.perf_counter() - started) / writes
+    frames = [tuple((i >> k) & 1 for k in range(len(pins))) for i in range(4)]
+    started = time.perf_counter()
+    for i in range(writes):
+        gpio.output(pins, frames[i & 3])
+    bulk = (time.perf_counter() - started) / writes
+    gpio.output(pins, 0)
+    return single, bulk
+
+
+def benchmark(pins=(17, 27, 22, 23)):
+    # pump1's coil pins by default: harmless while its ENA/ENB stay low
+    pins = list(pins)
+    results = []
+    try:
+        import RPi.GPIO
+        RPi.GPIO.setwarnings(False)
+        RPi.GPIO.setmode(RPi.GPIO.BCM)
+        for pin in pins:
+            RPi.GPIO.setup(pin, RPi.GPIO.OUT)
+        results.append(("RPi.GPIO", write_latency(RPi.GPIO, pins)))
+        RPi.GPIO.cleanup(pins)
+    except (ImportError, RuntimeError) as e:
+        print(f"RPi.GPIO: not available ({e})")
+    gpio = GpiodGPIO(bundles=[pins])
+    for pin in pins:
+        gpio.setup(pin, gpio.OUT)
+    results.append((f"gpiod ({gpio.chip})", write_latency(gpio, pins)))
+    gpio.cleanup()
+    for name, (single, bulk) in results:
+        print(f"{name:>24}: {single * 1e6:6.2f} us per pin write, "
+              f"{bulk * 1e6:6.2f} us per {len(pins)}-pin write")
+
+
+if __name__ == "__main__":
+    benchmark([int(p) for p in sys.argv[1:]] or (17, 27, 22, 23))
@@ -0,0 +1,193 @@
+#Hardware PWM for the chew motor (GPIO12/13) with RPi.GPIO's PWM object interface
+import os
+import sys
+import time
+
+try:
+    import pigpio
+except ImportError:
+    pigpio = None
+
+# BCM pin -> PWM channel for the header's hardware PWM pins (PWM0 / PWM1)
+HARDWARE_PWM_CHANNELS = {12: 0, 13: 1, 18: 0, 19: 1}
+
+# Kernel PWM (needs "dtoverlay=pwm-2chan,pin=12,func=4,pin2=13,func2=4" in
+# config.txt); the chip number differs between Pi models, so it can be overridden
+PWMCHIP = os.environ.get("WEAR_RIG_PWMCHIP", "/sys/class/pwm/pwmchip0")
+# "auto" (sysfs, then pigpio, then software), "sysfs", "pigpio" or "software"
+PWM_MODE = os.environ.get("WEAR_RIG_PWM", "auto")
+
+
+def _check_duty(duty):
+    if not 0.0 <= duty <= 100.0:
+        raise ValueError("dutycycle must have a value from 0.0 to 100.0")
+
+
+# -------------------------------------------------------------------
+# BACKENDS
+# -------------------------------------------------------------------
+class SysfsPWM:
+    """
+    One channel of the kernel's pwmchip driver. The PWM block generates the
+    waveform, so there is no thread and no jitter; ChangeDutyCycle() is one
+    pwrite() to an already open duty_cycle file.
+    """
+    def __init__(self, channel, freq, chip=PWMCHIP):
+        self.path = os.path.join(chip, f"pwm{channel}")
+        if not os.path.isdir(self.path):
+            with open(os.path.join(chip, "export"), "w") as f:
+                f.write(str(channel))
+            # udev fixes the new files' permissions shortly after export
+            deadline = time.monotonic() + 1.0
+            while not os.access(os.path.join(self.path, "duty_cycle"), os.W_OK):
+                if time.monotonic() > deadline:
+                    raise OSError(f"{self.path} not writable after export")
+                time.sleep(0.01)
+        self.chip = chip
+        self.channel = channel
+        self.duty = 0.0
+        self.period_ns = 0
+        self._write("enable", 0)
+        self._write("duty_cycle", 0)
+        self._set_period(freq)
+        self._duty_fd = os.open(os.path.join(self.path, "duty_cycle"), os.O_WRONLY)
+
+    def _write(self, name, value):
+        with open(os.path.join(self.path, name), "w") as f:
+            f.write(str(value))
+
+    def _set_period(self, freq):
+        if freq <= 0:
+            raise ValueError("frequency must be greater than 0.0")
+        period_ns = int(round(1e9 / freq))
+        # the duty may never exceed the period, so shrink it first when needed
+        if period_ns < self.period_ns:
+            self._write("duty_cycle", int(self.duty / 100.0 * period_ns))
+        self._write("period", period_ns)
+        self.period_ns = period_ns
+
+    def start(self, duty):
+        self.ChangeDutyCycle(duty)
+        self._write("enable", 1)
+
+    def ChangeDutyCycle(self, duty):
+        _check_duty(duty)
+        if duty == self.duty:
+            return
+        self.duty = duty
+        self._write_duty()
+
+    def _write_duty(self):
+        os.pwrite(self._duty_fd, str(int(self.duty / 100.0 * self.period_ns)).encode(), 0)
+
+    def ChangeFrequency(self, freq):
+        self._set_period(freq)
+        self._write_duty()
+
+    def stop(self):
+        self.ChangeDutyCycle(0)
+        self._write("enable", 0)
+        os.close(self._duty_fd)
+        with open(os.path.join(self.chip, "unexport"), "w") as f:
+            f.write(str(self.channel))
+
+
+class PigpioPWM:
+    """Hardware PWM through the pigpio daemon (hardware_PWM, duty in millionths)."""
+    def __init__(self, pi, pin, freq):
+        self.pi = pi
+        self.pin = pin
+        self.freq = freq
+        self.duty = 0.0
+
+    def _apply(self):
+        self.pi.hardware_PWM(self.pin, int(self.freq), int(round(self.duty * 10000)))
+
+    def start(self, duty):
+        self.ChangeDutyCycle(duty)
+        self._apply()
+
+    def ChangeDutyCycle(self, duty):
+        _check_duty(duty)
+        if duty != self.duty:
+            self.duty = duty
+            self._apply()
+
+    def ChangeFrequency(self, freq):
+        self.freq = freq
+        self._apply()
+
+    def stop(self):
+        self.duty = 0.0
+        self.pi.hardware_PWM(self.pin, 0, 0)
+
+
+def make_pwm(gpio, pin, freq, pi=None):
+    """
+    A PWM object for pin with RPi.GPIO's interface (start, ChangeDutyCycle,
+    ChangeFrequency, stop). For the Pi's own hardware PWM pins driven through
+    RPi.GPIO (or Gpiod_gpio) this is the kernel pwmchip, else pigpio's hardware_PWM (pi: an
+    existing pigpio connection to reuse), else RPi.GPIO software PWM.
+    Simulated rigs and GPIO expanders always get gpio.PWM.
+
+    Sets the pin up itself: gpio.setup(pin, OUT) would take a hardware PWM
+    pin away from its PWM function, so it is only done for software PWM.
+    """
+    mode = PWM_MODE
+    channel = HARDWARE_PWM_CHANNELS.get(pin)
+    on_header = getattr(gpio, "__name__", "") == "RPi.GPIO" or getattr(gpio, "hardware_pwm", False)
+    if channel is None or not on_header or mode == "software":
+        return _software_pwm(gpio, pin, freq)
+    if mode in ("auto", "sysfs") and os.path.isdir(PWMCHIP):
+        try:
+            return SysfsPWM(channel, freq)
+        except OSError as e:
+            print(f"Hardware PWM: {PWMCHIP} unusable for GPIO{pin} ({e})")
+    if mode in ("auto", "pigpio") and pigpio is not None:
+        if pi is None:
+            pi = pigpio.pi()
+        if pi.connected:
+            return PigpioPWM(pi, pin, freq)
+    print(f"Hardware PWM: not available for GPIO{pin}, using software PWM")
+    return _software_pwm(gpio, pin, freq)
+
+
+def _software_pwm(gpio, pin, freq):
+    gpio.setup(pin, gpio.OUT)
+    return gpio.PWM(pin, freq)
+
+
+# -------------------------------------------------------------------
+# COST CHECK (python Hardware_pwm.py [pin])
+# -------------------------------------------------------------------
+def pwm_cost(gpio, pin, seconds=2.0, duty=50):
+    """
+    CPU time this process spends per second while the PWM runs at duty
+    (software PWM's thread vs none for hardware), and the mean cost of a
+    ChangeDutyCycle() call. Waveform jitter itself needs a scope.
+    """
+    pwm = make_pwm(gpio, pin, 1000)
+    pwm.start(duty)
+    try:
+        cpu = time.process_time()
+        time.sleep(seconds)
+        cpu = (time.process_time() - cpu) / seconds
+        started = time.perf_counter()
+        for i in range(1000):
+            pwm.ChangeDutyCycle(duty + 1 + i % 2)
+        call = (time.perf_counter() - started) / 1000
+    finally:
+        pwm.stop()
+    return type(pwm).__name__, cpu, call
+
+
+if __name__ == "__main__":
+    import RPi.GPIO as GPIO
+    pin = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    GPIO.setmode(GPIO.BCM)
+    try:
+        kind, cpu, call = pwm_cost(GPIO, pin)
+    finally:
+        GPIO.cleanup()
+    print(f"{kind} on GPIO{pin}: {cpu * 100:.1f}% CPU while running, "
+          f"{call * 1e6:.1f} us per ChangeDutyCycle()")
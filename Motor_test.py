@@ -2,18 +2,18 @@
 import RPi.GPIO as GPIO
 import time
 
+from Hardware_pwm import make_pwm
+
 # Pin configuration
 IN1 = 12  # IN1 on L298N
 IN2 = 13  # IN2 on L298N
 
 # GPIO setup
 GPIO.setmode(GPIO.BCM)
-GPIO.setup(IN1, GPIO.OUT)
-GPIO.setup(IN2, GPIO.OUT)
 
-# Set up PWM on IN1 and IN2 at 1000Hz
-pwm_in1 = GPIO.PWM(IN1, 1000)
-pwm_in2 = GPIO.PWM(IN2, 1000)
+# Set up PWM on IN1 and IN2 at 1000Hz (hardware PWM when available, see Hardware_pwm.py)
+pwm_in1 = make_pwm(GPIO, IN1, 1000)
+pwm_in2 = make_pwm(GPIO, IN2, 1000)
 pwm_in1.start(0)
 pwm_in2.start(0)
 
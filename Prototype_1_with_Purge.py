@@ -3,6 +3,8 @@ import RPi.GPIO as GPIO
 import time
 import board
 from adafruit_ht16k33.segments import Seg14x4  # Correct library
+from Quadrature_encoder import QuadratureEncoder
+from Segment_display import DisplayWriter
 
 # --------------------
 # Rotary Encoder Setup
@@ -16,24 +18,26 @@ DT2 = 23 # Pin 16
 SW2 = 24 # Pin 18
 
 GPIO.setmode(GPIO.BCM)
-GPIO.setup(CLK, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-GPIO.setup(DT, GPIO.IN, pull_up_down=GPIO.PUD_UP)
 GPIO.setup(SW, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-
-GPIO.setup(CLK2, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-GPIO.setup(DT2, GPIO.IN, pull_up_down=GPIO.PUD_UP)
 GPIO.setup(SW2, GPIO.IN, pull_up_down=GPIO.PUD_UP)
 
+# CLK/DT are decoded from edge interrupts; counts reset to 0 at +/-40 as before
+encoder1 = QuadratureEncoder(GPIO, CLK, DT, wrap=40)
+encoder2 = QuadratureEncoder(GPIO, CLK2, DT2, wrap=40)
+
 # --------------------
 # Display Setup
 # --------------------
+# The loop prints every iteration; the writer thread only sends changed
+# digits, at most MAX_REFRESH_RATE times a second (Segment_display.py)
 i2c = board.I2C()
-display = Seg14x4(i2c, address=0x70)
+displays = DisplayWriter()
+display = displays.add(Seg14x4(i2c, address=0x70, auto_write=False))
 # display.fill(1)  # original code commented out
 display.fill(0)  # this is new code by ChatGPT
 display.brightness = 0.5  # this is new code by ChatGPT
 
-display_cycles = Seg14x4(i2c, address=0x71)  # this is new code by ChatGPT
+display_cycles = displays.add(Seg14x4(i2c, address=0x71, auto_write=False))
 display_cycles.fill(0)  # this is new code by ChatGPT
 display_cycles.brightness = 0.5  # this is new code by ChatGPT
 
@@ -57,10 +61,7 @@ GPIO.setup(VALVE_PIN, GPIO.OUT, initial=GPIO.LOW)  # this is new code by ChatGPT
 # Global Variables
 # --------------------
 rotary_counter = 0
-clk_last_state = GPIO.input(CLK)
-
 rotary_counter2 = 0
-clk_last_state2 = GPIO.input(CLK2)
 #start_time = time.monotonic()
 last_display_update = 0
 button_state = 0
@@ -88,40 +89,20 @@ purge_mode = False  # this is new code by ChatGPT
 # Functions
 # --------------------
 def handle_rotary_encoder():
-    global clk_last_state, rotary_counter
-
-    clk_state = GPIO.input(CLK)
-    dt_state = GPIO.input(DT)
-
-    if clk_state != clk_last_state:
-        if dt_state != clk_state:
-            rotary_counter += 1
-        else:
-            rotary_counter -= 1
-
-        if rotary_counter == 40 or rotary_counter == -40:
-            rotary_counter = 0
-        print(f"Rotary Counter (encoder1): {rotary_counter}")  # this is new code by ChatGPT
-
-    clk_last_state = clk_state
+    """Pick up the latest encoder1 count (counting happens in the edge interrupts)."""
+    global rotary_counter
+    count = encoder1.count
+    if count != rotary_counter:
+        rotary_counter = count
+        print(f"Rotary Counter (encoder1): {rotary_counter}")
 
 def handle_rotary_encoder2():
-    global clk_last_state2, rotary_counter2
-
-    clk_state2 = GPIO.input(CLK2)
-    dt_state2 = GPIO.input(DT2)
-
-    if clk_state2 != clk_last_state2:
-        if dt_state2 != clk_state2:
-            rotary_counter2 += 1
-        else:
-            rotary_counter2 -= 1
-
-        if rotary_counter2 == 40 or rotary_counter2 == -40:
-            rotary_counter2 = 0
-        print(f"Rotary Counter2 (encoder2): {rotary_counter2}")  # this is new code by ChatGPT
-
-    clk_last_state2 = clk_state2
+    """Pick up the latest encoder2 count (counting happens in the edge interrupts)."""
+    global rotary_counter2
+    count = encoder2.count
+    if count != rotary_counter2:
+        rotary_counter2 = count
+        print(f"Rotary Counter2 (encoder2): {rotary_counter2}")
 
 def update_timer_display():
     global elapsed
@@ -248,11 +229,12 @@ try:
                 display_cycles.fill(0)
                 close_valve()
 
-        time.sleep(0.001)
+        time.sleep(0.01)  # encoders are interrupt-driven, no need to spin at 1 kHz
 
 except KeyboardInterrupt:
     display.fill(0)
     display_cycles.fill(0)
+    displays.close()   # sends the blanked frames before exiting
     close_valve()
     GPIO.cleanup()
     print("Program terminated.")
@@ -0,0 +1,59 @@
+#Guided pump calibration: run a known number of steps, enter the volume collected, store steps/mL
+import os
+import sys
+
+from Rig_config import CALIBRATION_DEFAULTS, SETTINGS_PATH, make_station, open_gpio
+from Rig_settings import SettingsStore
+
+CALIBRATION_STEPS = 4000   # default test run (20 mL at the factory 200 steps/mL)
+
+
+def calibrate(station, settings, pump, steps=CALIBRATION_STEPS, ask=input):
+    """
+    Run pump an exact number of steps (with its normal ramps), ask for the
+    volume measured at the outlet and store steps/mL for that pump in the
+    settings. Returns the pump's steps/mL afterwards (unchanged if the
+    operator enters nothing).
+    """
+    name = f'PUMP{pump}_STEPS_PER_ML'
+    old = settings.calibration[name]
+    ask(f"Pump {pump}: prime the line, put a measuring cylinder under the outlet, "
+        f"then press Enter to run {steps} steps ")
+    played = station.pumps[pump].run_steps(steps)
+    if played != steps:
+        print(f"Pump {pump}: run stopped after {played} of {steps} steps")
+    reply = ask("Volume collected in mL (blank keeps the current calibration): ").strip()
+    if not reply:
+        print(f"{name} unchanged at {old:.2f} steps/mL")
+        return old
+    measured = float(reply)
+    if measured <= 0 or played <= 0:
+        raise ValueError("need a positive volume from a run that moved")
+    settings.set_calibration(name, played / measured)
+    value = settings.calibration[name]
+    dose = settings.calibration['PUMP_DOSE_ML']
+    print(f"{name}: {old:.2f} -> {value:.2f} steps/mL "
+          f"(a {dose:g} mL dose is now {round(dose * value)} steps)")
+    return value
+
+
+if __name__ == "__main__":
+    # python Pump_calibration.py <pump 1|2> [steps]   (with the UI closed: it needs the GPIO)
+    if len(sys.argv) < 2 or sys.argv[1] not in ("1", "2"):
+        print("usage: python Pump_calibration.py <pump 1|2> [steps]")
+        sys.exit(1)
+    # WEAR_RIG_SIM=1 rehearses it on the simulated rig
+    if os.environ.get("WEAR_RIG_SIM"):
+        from Sim_rig import SimulatedGPIO
+        gpio = SimulatedGPIO()
+    else:
+        gpio = open_gpio()
+    settings = SettingsStore(SETTINGS_PATH, calibration_defaults=CALIBRATION_DEFAULTS)
+    station = make_station(gpio)
+    try:
+        calibrate(station, settings, int(sys.argv[1]),
+                  int(sys.argv[2]) if len(sys.argv) > 2 else CALIBRATION_STEPS)
+    finally:
+        station.close()
+        settings.close()
+        gpio.cleanup()
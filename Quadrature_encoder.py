@@ -0,0 +1,71 @@
+#Interrupt-driven quadrature decoder for the KY-040 style rotary encoders
+import threading
+
+# Gray-code transition table, indexed by (previous_state << 2) | new_state
+# where state = (CLK << 1) | DT. +1 / -1 for a valid step, 0 for no change
+# or an invalid jump (both lines changed, i.e. a missed edge).
+_TRANSITIONS = (
+     0, -1, +1,  0,
+    +1,  0,  0, -1,
+    -1,  0,  0, +1,
+     0, +1, -1,  0,
+)
+
+
+class QuadratureEncoder:
+    """
+    Counts encoder steps from both-edge interrupts on CLK and DT.
+
+    transitions_per_count=2 keeps the same scale as the old polling code
+    (one count per CLK edge). wrap=N resets the count to 0 when it reaches
+    +N or -N (the old hard-coded 40); wrap=None never resets.
+    The count is only written from the GPIO event thread, so reading
+    encoder.count is lock-free.
+    """
+    def __init__(self, gpio, clk_pin, dt_pin, wrap=None, transitions_per_count=2):
+        self.gpio = gpio
+        self.clk_pin = clk_pin
+        self.dt_pin = dt_pin
+        self.wrap = wrap
+        self.transitions_per_count = transitions_per_count
+        self._count = 0
+        self._sub = 0
+        self._lock = threading.Lock()   # edge handler vs reset() only; reads never take it
+
+        for pin in (clk_pin, dt_pin):
+            gpio.setup(pin, gpio.IN, pull_up_down=gpio.PUD_UP)
+        self._state = self._read_state()
+        for pin in (clk_pin, dt_pin):
+            gpio.add_event_detect(pin, gpio.BOTH, callback=self._on_edge)
+
+    @property
+    def count(self):
+        return self._count
+
+    def _read_state(self):
+        return (self.gpio.input(self.clk_pin) << 1) | self.gpio.input(self.dt_pin)
+
+    def _on_edge(self, channel):
+        state = self._read_state()
+        with self._lock:
+            delta = _TRANSITIONS[(self._state << 2) | state]
+            self._state = state
+            if not delta:
+                return
+            self._sub += delta
+            if abs(self._sub) < self.transitions_per_count:
+                return
+            self._sub = 0
+            count = self._count + delta
+            if self.wrap is not None and abs(count) >= self.wrap:
+                count = 0
+            self._count = count
+
+    def reset(self):
+        with self._lock:
+            self._count = 0
+            self._sub = 0
+
+    def close(self):
+        for pin in (self.clk_pin, self.dt_pin):
+            self.gpio.remove_event_detect(pin)
@@ -0,0 +1,91 @@
+#This rig's wiring, pump/motor constants and Station construction (importing it touches no hardware)
+import os
+
+from Run_timing import REAL_CLOCK
+from Station import PinMap, Station, pin_bundles
+
+# WEAR_RIG_GPIO=gpiod drives the pins through libgpiod (Gpiod_gpio.py) instead
+# of RPi.GPIO; =rpi never falls back. Unset: RPi.GPIO, or libgpiod where
+# RPi.GPIO cannot run (Pi 5)
+GPIO_BACKEND = os.environ.get("WEAR_RIG_GPIO", "")
+
+# --- GPIO pins (external buttons, set up as inputs by ButtonWatcher) ---
+STOP_PIN = 16
+GO_PIN = 1
+PAUSE_PIN = 14
+
+# --- Pump 1 GPIO pins ---
+ENA = 18
+ENB = 15
+IN1 = 17
+IN2 = 27
+IN3 = 22
+IN4 = 23
+
+# --- Pump 2 GPIO pins ---
+P2_ENA = 8
+P2_ENB = 11
+P2_IN1 = 25
+P2_IN2 = 24
+P2_IN3 = 9
+P2_IN4 = 10
+
+# --- Motor GPIO pins using PWM ---
+MOTOR_IN1 = 12
+MOTOR_IN2 = 13
+
+# --- This rig: pump stepper drivers (pigpio waves when available), chew
+# motor PWM channels and cycle scheduler, all owned by one Station ---
+PINS = PinMap(pump1_enable=(ENA, ENB), pump1_coils=(IN1, IN2, IN3, IN4),
+              pump2_enable=(P2_ENA, P2_ENB), pump2_coils=(P2_IN1, P2_IN2, P2_IN3, P2_IN4),
+              motor_in1=MOTOR_IN1, motor_in2=MOTOR_IN2,
+              stop=STOP_PIN, go=GO_PIN, pause=PAUSE_PIN)
+
+# Pump & motor variables (PUMP_DOSE_ML, PUMP_STEPS_PER_ML, MOTOR_SPEED_* and
+# HOLD_PWM are factory defaults: the rig's calibrated values live in the
+# settings store, each pump's steps/mL set by Pump_calibration.py)
+PUMP_DOSE_ML = 10.0       # mL each pump phase delivers
+PUMP_STEPS_PER_ML = 200.0
+PUMP_STEP_RATE = 1000  # steps/sec for both pumps (sets the flow rate)
+# Pump ramps: each run starts at PUMP_STEP_RATE (what the pumps reliably start
+# at from standstill) and accelerates to PUMP_CRUISE_RATE. A dose is an exact
+# step count, so ramps only change how soon it is delivered.
+# Set PUMP_CRUISE_RATE = PUMP_STEP_RATE to run without ramps.
+PUMP_CRUISE_RATE = 2000  # steps/sec
+PUMP_ACCEL = 4000        # steps/sec^2
+PUMP_RAMP = "scurve"     # or "trapezoid"
+MOTOR_SPEED_UP = 80
+MOTOR_SPEED_DOWN = 80
+HOLD_PWM = 20
+
+# Last slider values, presets and calibration (rig_settings.json, override
+# with WEAR_RIG_SETTINGS)
+SETTINGS_PATH = os.environ.get("WEAR_RIG_SETTINGS", os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "rig_settings.json"))
+CALIBRATION_DEFAULTS = {
+    'PUMP_DOSE_ML': PUMP_DOSE_ML, 'PUMP1_STEPS_PER_ML': PUMP_STEPS_PER_ML,
+    'PUMP2_STEPS_PER_ML': PUMP_STEPS_PER_ML, 'MOTOR_SPEED_UP': MOTOR_SPEED_UP,
+    'MOTOR_SPEED_DOWN': MOTOR_SPEED_DOWN, 'HOLD_PWM': HOLD_PWM}
+
+
+def open_gpio():
+    """RPi.GPIO, or libgpiod (Gpiod_gpio) where RPi.GPIO cannot run or WEAR_RIG_GPIO=gpiod."""
+    if GPIO_BACKEND != "gpiod":
+        try:
+            import RPi.GPIO
+            return RPi.GPIO
+        except (ImportError, RuntimeError) as e:
+            if GPIO_BACKEND == "rpi":
+                raise
+            print(f"RPi.GPIO unavailable ({e}), using libgpiod")
+    from Gpiod_gpio import GpiodGPIO
+    return GpiodGPIO(bundles=pin_bundles(PINS))
+
+
+def make_station(gpio, clock=REAL_CLOCK, name="rig1"):
+    """This rig's Station on gpio (BCM mode set here), pumps at their ramped rates."""
+    gpio.setmode(gpio.BCM)
+    station = Station(name, gpio, PINS, step_rate=PUMP_STEP_RATE, clock=clock)
+    for pump in station.pumps.values():
+        pump.set_rate(PUMP_CRUISE_RATE, start_rate=PUMP_STEP_RATE, accel=PUMP_ACCEL, shape=PUMP_RAMP)
+    return station
@@ -0,0 +1,180 @@
+#One asyncio event loop that owns every timed actuation of a rig
+import asyncio
+import concurrent.futures
+import functools
+import selectors
+import threading
+import traceback
+
+from Run_timing import REAL_CLOCK, CancelToken, VirtualClock
+
+
+# -------------------------------------------------------------------
+# FAST-FORWARD LOOP (simulation)
+# -------------------------------------------------------------------
+class _FastForwardSelector(selectors.DefaultSelector):
+    # instead of blocking for the loop's next timer, jump the virtual clock
+    # there; with no timer of its own due the loop waits for call() from
+    # another thread, and virtual time stands still (timers set on the clock
+    # from outside must not run ahead of work that has not reached the loop)
+    def __init__(self, clock):
+        super().__init__()
+        self.clock = clock
+
+    def select(self, timeout=None):
+        ready = super().select(0)
+        if ready or timeout == 0:
+            return ready
+        if timeout is None:
+            return super().select(None)
+        self.clock.idle(timeout)
+        return super().select(0)
+
+
+class FastForwardLoop(asyncio.SelectorEventLoop):
+    """asyncio loop whose time is a VirtualClock, so sleeps cost no wall time."""
+    def __init__(self, clock):
+        self.clock = clock
+        super().__init__(_FastForwardSelector(clock))
+
+    def time(self):
+        return self.clock.monotonic()
+
+
+# -------------------------------------------------------------------
+# CONTROLLER
+# -------------------------------------------------------------------
+class Controller:
+    """
+    Runs one asyncio loop on one thread. Each timed action (a run, a pump
+    fill, a motor move) is a task in a named actuator slot ("run", "pump1",
+    "pump2", "motor"), one task per slot; spawning into a slot
+    cancels what was there, and cancel() takes effect at the task's next
+    await, so STOP does not wait for sleeps or phase deadlines to expire.
+
+    Everything that mutates controller state runs on the loop thread. Other
+    threads (Tk, GPIO edge callbacks) hand work over with call(); results
+    go back to Tk through Ui_events. Blocking stepper playback runs on a
+    small pool via run_blocking() and is stopped through a CancelToken.
+
+    trip() is the STOP path: callable from any thread, it fires every
+    outstanding token on the calling thread (stepper threads stop within
+    one step, pigpio waves halt) before the loop even sees the request.
+    """
+    def __init__(self, clock=REAL_CLOCK, name="rig-controller"):
+        self.clock = clock
+        self.fast_forward = isinstance(clock, VirtualClock)
+        self.loop = FastForwardLoop(clock) if self.fast_forward else asyncio.new_event_loop()
+        self._tasks = {}
+        self._token = CancelToken()   # parent of every run_blocking() token; replaced by trip()
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="stepper")
+        self._thread = threading.Thread(target=self._serve, name=name, daemon=True)
+        self._thread.start()
+
+    def _serve(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    # --- thread-safe entry point ---
+    def call(self, fn, *args):
+        """Run fn(*args) on the loop thread; returns a concurrent.futures.Future."""
+        future = concurrent.futures.Future()
+
+        def run():
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                traceback.print_exc()
+                future.set_exception(e)
+
+        self.loop.call_soon_threadsafe(run)
+        return future
+
+    def trip(self):
+        """Cancel everything now (any thread): fire all tokens, then cancel all tasks on the loop."""
+        token, self._token = self._token, CancelToken()
+        token.cancel()
+        self.loop.call_soon_threadsafe(self.cancel_all)
+
+    def wait(self, slot):
+        """Block the calling (non-loop) thread until the slot's current task is done."""
+        async def done():
+            task = self._tasks.get(slot)
+            if task is not None:
+                await asyncio.wait([task])
+        asyncio.run_coroutine_threadsafe(done(), self.loop).result()
+
+    # --- loop thread only ---
+    def spawn(self, slot, coro):
+        """Start coro as the slot's task, cancelling the previous one."""
+        self.cancel(slot)
+        task = self.loop.create_task(coro)
+        self._tasks[slot] = task
+        task.add_done_callback(lambda t: self._finished(slot, t))
+        return task
+
+    def _finished(self, slot, task):
+        if self._tasks.get(slot) is task:
+            del self._tasks[slot]
+        if not task.cancelled() and task.exception() is not None:
+            e = task.exception()
+            traceback.print_exception(type(e), e, e.__traceback__)
+
+    def cancel(self, slot):
+        task = self._tasks.pop(slot, None)
+        if task is not None:
+            task.cancel()
+
+    def cancel_all(self):
+        for slot in list(self._tasks):
+            self.cancel(slot)
+
+    def busy(self, slot):
+        return slot in self._tasks
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(max(seconds, 0))
+
+    async def sleep_until(self, deadline):
+        """Sleep until an absolute clock.monotonic() deadline."""
+        await asyncio.sleep(max(deadline - self.clock.monotonic(), 0))
+
+    async def run_blocking(self, fn, *args):
+        """
+        Await fn(*args, cancel=token) on the stepper pool. The token fires
+        on trip() or when the awaiting task is cancelled; the task then waits
+        for fn to wind down (coils released) before re-raising. On a
+        fast-forward loop fn runs inline instead, since only the loop thread
+        may move virtual time, so a simulated pump phase cannot be cut short:
+        it plays out on a clock lane and the task then sleeps to the lane's
+        end, leaving that stretch of virtual time to the other tasks.
+        """
+        token = CancelToken(self._token)
+        try:
+            if self.fast_forward:
+                with self.clock.lane() as lane:
+                    result = fn(*args, cancel=token)
+                await self.sleep_until(lane.now)
+                return result
+            future = self.loop.run_in_executor(self._pool, functools.partial(fn, *args, cancel=token))
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                token.cancel()
+                await asyncio.wait([future])
+                raise
+        finally:
+            token.detach()
+
+    def close(self):
+        """Cancel every task, stop the loop and join its thread."""
+        async def shutdown():
+            tasks = list(self._tasks.values())
+            self.cancel_all()
+            if tasks:
+                await asyncio.wait(tasks)
+        if self._thread.is_alive():
+            asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+        self._pool.shutdown(wait=True)
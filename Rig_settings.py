@@ -0,0 +1,294 @@
+#Persisted rig settings: last slider values, named presets and calibration constants
+import copy
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from Rig_config import CALIBRATION_DEFAULTS
+
+SCHEMA_VERSION = 2
+SAVE_DELAY = 0.5   # s of quiet after the last change before the file is rewritten (slider drags)
+
+# Slider values restored at startup, with the range each slider allows
+SLIDER_DEFAULTS = {"total_seconds": 60, "chews": 2, "fluid_cycle": 10.0}
+SLIDER_LIMITS = {"total_seconds": (0, 720 * 60), "chews": (0, 10), "fluid_cycle": (0, 120)}
+
+# Hardware calibration: factory values are Rig_config.CALIBRATION_DEFAULTS
+# (pump doses in mL, each pump's steps per mL from Pump_calibration.py)
+CALIBRATION_LIMITS = {"PUMP_DOSE_ML": (0.1, 500), "PUMP1_STEPS_PER_ML": (1, 100000),
+                      "PUMP2_STEPS_PER_ML": (1, 100000), "MOTOR_SPEED_UP": (0, 100),
+                      "MOTOR_SPEED_DOWN": (0, 100), "HOLD_PWM": (0, 100)}
+
+# v1 files timed the pumps: PUMP_RUN_TIME seconds at this fixed step rate
+V1_PUMP_STEP_RATE = 1000
+
+
+def _v1_to_v2(data, calibration_defaults):
+    # timed pump runs -> a dose in mL at the factory steps/mL (same step count)
+    calibration = dict(data.get("calibration") or {})
+    if "PUMP_RUN_TIME" in calibration:
+        try:
+            steps = float(calibration.pop("PUMP_RUN_TIME")) * V1_PUMP_STEP_RATE
+            calibration["PUMP_DOSE_ML"] = steps / calibration_defaults["PUMP1_STEPS_PER_ML"]
+        except (TypeError, ValueError):
+            pass   # unreadable: the default dose applies
+    return dict(data, version=2, calibration=calibration)
+
+
+# Upgrades from older files: version -> function(data, calibration defaults)
+# returning the next version's data. Add an entry (and bump SCHEMA_VERSION) when the layout changes.
+MIGRATIONS = {1: _v1_to_v2}
+
+
+# -------------------------------------------------------------------
+# FILE I/O
+# -------------------------------------------------------------------
+def write_atomic(path, data):
+    """
+    Write data as JSON so that path always holds either the old or the new
+    file, never a partial one: temp file in the same folder, fsync, rename
+    over the old file, then fsync the folder so the rename survives power loss.
+    """
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=".settings-", suffix=".tmp", dir=folder)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    try:
+        dir_fd = os.open(folder, os.O_RDONLY)
+    except OSError:
+        return   # e.g. Windows: folders cannot be opened for fsync
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def _clamped(value, limits, default, name):
+    try:
+        value = type(default)(float(value))
+    except (TypeError, ValueError):
+        print(f"Settings: bad value for {name} ({value!r}), using {default}")
+        return default
+    lo, hi = limits
+    if not lo <= value <= hi:
+        print(f"Settings: {name}={value} outside {lo}..{hi}, clamped")
+        value = min(max(value, type(default)(lo)), type(default)(hi))
+    return value
+
+
+def _checked(values, defaults, limits):
+    # every known key present and in range; unknown keys are dropped
+    values = values if isinstance(values, dict) else {}
+    return {name: _clamped(values.get(name, default), limits[name], default, name)
+            for name, default in defaults.items()}
+
+
+# -------------------------------------------------------------------
+# SETTINGS STORE
+# -------------------------------------------------------------------
+class SettingsStore:
+    """
+    One small JSON file (schema-versioned) holding the last slider values,
+    named slider presets and the calibration constants. Loading is a single
+    read and parse (well under a millisecond), so the UI starts with the
+    rig's settings already in place. Changes are written atomically by a
+    background thread after SAVE_DELAY of quiet, so dragging a slider never
+    blocks Tk on an SD card fsync; save() and close() write immediately.
+
+    path=None keeps everything in memory (headless simulations). A file
+    written by a newer version is read but never overwritten.
+    """
+    def __init__(self, path, calibration_defaults=None, slider_defaults=None):
+        self.path = path
+        self.slider_defaults = dict(slider_defaults or SLIDER_DEFAULTS)
+        self.calibration_defaults = dict(calibration_defaults or CALIBRATION_DEFAULTS)
+        self.read_only = False
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = None
+
+        started = time.perf_counter()
+        self._data = self._load()
+        self.load_time = time.perf_counter() - started
+
+    # --- loading ---
+    def _defaults(self):
+        return {"version": SCHEMA_VERSION, "sliders": dict(self.slider_defaults),
+                "presets": {}, "calibration": dict(self.calibration_defaults)}
+
+    def _load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return self._defaults()
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                raise ValueError("not a JSON object")
+            version = data.get("version", 0)
+            if not isinstance(version, int) or isinstance(version, bool):
+                raise ValueError(f"schema version {version!r} is not an integer")
+        except (OSError, ValueError) as e:
+            aside = self.path + ".corrupt"
+            print(f"Settings: cannot read {self.path} ({e}); moved to {aside}, using defaults")
+            try:
+                os.replace(self.path, aside)
+            except OSError:
+                pass
+            return self._defaults()
+
+        if version > SCHEMA_VERSION:
+            print(f"Settings: {self.path} is schema v{version} (this code knows v{SCHEMA_VERSION}); "
+                  f"using it read-only")
+            self.read_only = True
+        while version < SCHEMA_VERSION and version in MIGRATIONS:
+            data = MIGRATIONS[version](data, self.calibration_defaults)
+            version = data["version"]
+        if version < SCHEMA_VERSION:
+            print(f"Settings: no upgrade from schema v{version}, using defaults")
+            return self._defaults()
+        return self._validated(data)
+
+    def _validated(self, data):
+        calibration_limits = {name: CALIBRATION_LIMITS.get(name, (float("-inf"), float("inf")))
+                              for name in self.calibration_defaults}
+        presets = data.get("presets") if isinstance(data.get("presets"), dict) else {}
+        return {
+            "version": SCHEMA_VERSION,
+            "sliders": _checked(data.get("sliders"), self.slider_defaults, SLIDER_LIMITS),
+            "presets": {str(name): _checked(values, self.slider_defaults, SLIDER_LIMITS)
+                        for name, values in presets.items()},
+            "calibration": _checked(data.get("calibration"), self.calibration_defaults,
+                                    calibration_limits),
+        }
+
+    # --- reading (copies, safe from any thread) ---
+    @property
+    def sliders(self):
+        with self._lock:
+            return dict(self._data["sliders"])
+
+    @property
+    def calibration(self):
+        with self._lock:
+            return dict(self._data["calibration"])
+
+    def preset_names(self):
+        with self._lock:
+            return sorted(self._data["presets"])
+
+    def preset(self, name):
+        """Slider values of a named preset (KeyError if there is none)."""
+        with self._lock:
+            return dict(self._data["presets"][name])
+
+    # --- changes (saved in the background) ---
+    def set_sliders(self, **values):
+        limits = {name: SLIDER_LIMITS[name] for name in values}
+        with self._lock:
+            current = self._data["sliders"]
+            updated = {name: _clamped(value, limits[name], self.slider_defaults[name], name)
+                       for name, value in values.items()}
+            if all(current.get(name) == value for name, value in updated.items()):
+                return   # e.g. a slider redrawn at its restored value
+            current.update(updated)
+        self._changed()
+
+    def save_preset(self, name, sliders=None):
+        """Store the given (or current) slider values under name."""
+        with self._lock:
+            values = sliders if sliders is not None else self._data["sliders"]
+            self._data["presets"][name] = _checked(values, self.slider_defaults, SLIDER_LIMITS)
+        self._changed()
+
+    def delete_preset(self, name):
+        with self._lock:
+            self._data["presets"].pop(name, None)
+        self._changed()
+
+    def set_calibration(self, name, value):
+        if name not in self.calibration_defaults:
+            raise KeyError(f"unknown calibration constant '{name}'")
+        limits = CALIBRATION_LIMITS.get(name, (float("-inf"), float("inf")))
+        with self._lock:
+            self._data["calibration"][name] = _clamped(value, limits, self.calibration_defaults[name], name)
+        self._changed()
+
+    # --- writing ---
+    def _changed(self):
+        with self._lock:
+            self._dirty = True
+            if self.path is None or self.read_only or self._closed:
+                return
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._save_loop, name="settings", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def _save_loop(self):
+        while not self._closed:
+            self._wake.wait()
+            # coalesce a burst of changes (a slider drag) into one write
+            while self._wake.is_set() and not self._closed:
+                self._wake.clear()
+                time.sleep(SAVE_DELAY)
+            self.save()
+
+    def save(self):
+        """Write pending changes now (no-op when nothing changed or memory-only)."""
+        with self._lock:
+            if not self._dirty or self.path is None or self.read_only:
+                return
+            data = copy.deepcopy(self._data)
+            self._dirty = False
+        try:
+            write_atomic(self.path, data)
+        except OSError as e:
+            print(f"Settings: could not save {self.path}: {e}")
+            with self._lock:
+                self._dirty = True
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.save()
+
+
+if __name__ == "__main__":
+    # python Rig_settings.py <settings file> [set NAME VALUE | preset NAME | delete-preset NAME]
+    if len(sys.argv) < 2:
+        print("usage: python Rig_settings.py <settings file> [set NAME VALUE | preset NAME | delete-preset NAME]")
+        sys.exit(1)
+    store = SettingsStore(sys.argv[1])
+    command = sys.argv[2:]
+    if command[:1] == ["set"] and len(command) == 3:
+        store.set_calibration(command[1], command[2])
+    elif command[:1] == ["preset"] and len(command) == 2:
+        store.save_preset(command[1])
+    elif command[:1] == ["delete-preset"] and len(command) == 2:
+        store.delete_preset(command[1])
+    elif command:
+        print(f"unknown command: {' '.join(command)}")
+        sys.exit(1)
+    store.close()
+    print(f"{sys.argv[1]} (schema v{SCHEMA_VERSION}, loaded in {store.load_time * 1000:.2f} ms)")
+    print(f"  sliders:     {store.sliders}")
+    print(f"  calibration: {store.calibration}")
+    for name in store.preset_names():
+        print(f"  preset {name}: {store.preset(name)}")
@@ -0,0 +1,228 @@
+#Crash-resume journal for wear runs: run settings plus a checkpoint per completed cycle
+import json
+import os
+import queue
+import sys
+import tempfile
+import threading
+
+JOURNAL_VERSION = 1
+RUN_FIELDS = ("total_seconds", "chews", "fluid_cycle")   # the run settings a resume needs
+
+
+def _fsync_folder(path):
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return   # e.g. Windows: folders cannot be opened for fsync
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def read_journal(path):
+    """
+    The interrupted run recorded in a journal file, as {"run": settings,
+    "cycle": last completed cycle, "elapsed": run seconds at that point},
+    or None if there is no (usable) journal: a header without numeric
+    RUN_FIELDS or a checkpoint without a numeric cycle makes the whole
+    journal unusable. A line torn by power loss is ignored: the checkpoint
+    before it still counts.
+    """
+    try:
+        with open(path) as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    state = None
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            break
+        if not isinstance(entry, dict):
+            return None
+        if state is None:
+            run = entry.get("run")
+            if entry.get("version") != JOURNAL_VERSION or not isinstance(run, dict):
+                return None
+            if not all(_number(run.get(name)) for name in RUN_FIELDS):
+                return None
+            state = {"run": run, "cycle": 0, "elapsed": 0.0}
+        elif "cycle" in entry:
+            cycle, elapsed = entry["cycle"], entry.get("elapsed", 0.0)
+            if not (_number(cycle) and cycle >= 0 and _number(elapsed)):
+                return None
+            state["cycle"] = int(cycle)
+            state["elapsed"] = float(elapsed)
+    return state
+
+
+class RunJournal:
+    """
+    Small append-only JSON-lines file: a header with the run's settings,
+    then one line per completed cycle. Every write is fsync'd, but on a
+    background thread: begin()/checkpoint()/finish() only queue a request,
+    so the run loop never waits on the SD card. A backlog of checkpoints
+    (fast-forward runs) collapses to the newest. finish() deletes the file,
+    so a journal only exists while a run is in progress, or after a crash.
+
+    path=None disables journalling (headless simulations).
+    """
+    def __init__(self, path):
+        self.path = path
+        self._queue = queue.SimpleQueue()
+        self._file = None
+        self._thread = None
+        if path is not None:
+            self._thread = threading.Thread(target=self._write_loop, name="run-journal", daemon=True)
+            self._thread.start()
+
+    def pending(self):
+        """
+        The interrupted run left by a crash (see read_journal), or None. An
+        unusable journal is moved aside to <path>.corrupt, like a corrupt
+        settings file.
+        """
+        if self.path is None:
+            return None
+        state = read_journal(self.path)
+        if state is None and os.path.exists(self.path):
+            aside = self.path + ".corrupt"
+            print(f"Run journal: cannot resume from {self.path}; moved to {aside}")
+            try:
+                os.replace(self.path, aside)
+            except OSError:
+                pass
+        return state
+
+    # --- requests (any thread, never block) ---
+    def begin(self, run, cycle=0, elapsed=0.0):
+        """Start a new journal for a run (settings dict), optionally at a resumed cycle."""
+        if self.path is not None:
+            self._queue.put(("begin", run, cycle, elapsed))
+
+    def checkpoint(self, cycle, elapsed):
+        if self.path is not None:
+            self._queue.put(("checkpoint", cycle, elapsed))
+
+    def finish(self):
+        """The run ended (timer or STOP): nothing left to resume."""
+        if self.path is not None:
+            self._queue.put(("finish",))
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    # --- writer thread ---
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            for i, request in enumerate(batch):
+                if request is None:
+                    self._close_file()
+                    return
+                nxt = batch[i + 1] if i + 1 < len(batch) else None
+                if request[0] == "checkpoint" and nxt is not None and nxt[0] == "checkpoint":
+                    continue   # superseded by the next one
+                try:
+                    getattr(self, "_" + request[0])(*request[1:])
+                except OSError as e:
+                    print(f"Run journal: {e}")
+
+    def _append(self, entry):
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _begin(self, run, cycle, elapsed):
+        self._close_file()
+        folder = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(folder, exist_ok=True)
+        self._file = open(self.path, "w")
+        self._append({"version": JOURNAL_VERSION, "run": run})
+        if cycle:
+            self._append({"cycle": cycle, "elapsed": round(elapsed, 3)})
+        _fsync_folder(self.path)
+
+    def _checkpoint(self, cycle, elapsed):
+        if self._file is not None:
+            self._append({"cycle": cycle, "elapsed": round(elapsed, 3)})
+
+    def _finish(self):
+        self._close_file()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+            _fsync_folder(self.path)
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# -------------------------------------------------------------------
+# SELF-CHECK (python Run_journal.py --check)
+# -------------------------------------------------------------------
+def check_journals():
+    """
+    pending() on good and damaged journal files: a damaged one must give
+    None and be moved aside. Returns True if every case behaves.
+    """
+    header = {"version": JOURNAL_VERSION, "run": {"total_seconds": 600, "chews": 2, "fluid_cycle": 10.0}}
+    cases = [
+        ("good", [header, {"cycle": 3, "elapsed": 30.0}], 3),
+        ("torn checkpoint", [header, {"cycle": 3, "elapsed": 30.0}, '{"cycle": 4, "ela'], 3),
+        ("truncated run header", [{"version": JOURNAL_VERSION, "run": {"total_seconds": 600}}], None),
+        ("non-numeric setting", [dict(header, run=dict(header["run"], fluid_cycle="10"))], None),
+        ("null cycle", [header, {"cycle": None, "elapsed": 30.0}], None),
+        ("not an object", [[1, 2]], None),
+    ]
+    ok = True
+    with tempfile.TemporaryDirectory() as folder:
+        for name, entries, cycle in cases:
+            path = os.path.join(folder, "journal.jsonl")
+            with open(path, "w") as f:
+                for entry in entries:
+                    f.write((entry if isinstance(entry, str) else json.dumps(entry)) + "\n")
+            journal = RunJournal(path)
+            state = journal.pending()
+            journal.close()
+            got = None if state is None else state["cycle"]
+            passed = got == cycle and os.path.exists(path) == (cycle is not None)
+            print(f"  {name:<22} -> {'no resume' if got is None else f'resume after cycle {got}'}"
+                  f"{'' if passed else '  FAIL'}")
+            ok = ok and passed
+            for leftover in (path, path + ".corrupt"):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+    print(f"journal check: {'PASS' if ok else 'FAIL'}")
+    return ok
+
+
+if __name__ == "__main__" and sys.argv[1:2] == ["--check"]:
+    sys.exit(0 if check_journals() else 1)
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("usage: python Run_journal.py <journal file>")
+        sys.exit(1)
+    state = read_journal(sys.argv[1])
+    if state is None:
+        print("No interrupted run")
+    else:
+        print(f"Interrupted run: {state['cycle']} cycles done, {state['elapsed']:.1f} s "
+              f"of {state['run'].get('total_seconds')} s; settings {state['run']}")
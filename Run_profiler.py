@@ -0,0 +1,127 @@
+#Latency / jitter profiler for the actuation loop (enable with WEAR_RIG_PROFILE=1)
+import math
+import random
+import threading
+import time
+
+RESERVOIR = 50000   # samples kept per metric for percentiles/histograms
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list (p in 0..100)."""
+    if not sorted_values:
+        return 0.0
+    k = max(math.ceil(p / 100.0 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(k, len(sorted_values) - 1)]
+
+
+class _Metric:
+    # exact count/max/sum, plus a uniform reservoir sample for percentiles,
+    # so a 12 hour run (millions of step intervals) stays a few MB
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = float("-inf")
+        self.min = float("inf")
+        self.samples = []
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        if value < self.min:
+            self.min = value
+        if len(self.samples) < RESERVOIR:
+            self.samples.append(value)
+        else:
+            i = random.randrange(self.count)
+            if i < RESERVOIR:
+                self.samples[i] = value
+
+
+class LatencyProfile:
+    """
+    Named latency samples in seconds (phase overshoot, step interval error,
+    STOP-to-PWM-off delay, ...). add() is cheap enough for the run loop;
+    stats()/report() can be called from any thread at any time.
+    """
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = _Metric()
+            metric.add(seconds)
+
+    def extend(self, name, values):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = _Metric()
+            for value in values:
+                metric.add(value)
+
+    def names(self):
+        with self._lock:
+            return sorted(self._metrics)
+
+    def stats(self, name):
+        """count, mean, p50, p99, min and max of one metric (seconds)."""
+        with self._lock:
+            metric = self._metrics[name]
+            values = sorted(metric.samples)
+            count, total, lo, hi = metric.count, metric.total, metric.min, metric.max
+        return {"count": count, "mean": total / count, "p50": percentile(values, 50),
+                "p99": percentile(values, 99), "min": lo, "max": hi}
+
+    def histogram(self, name, bins=10, width=30):
+        """Text histogram of one metric, bin edges in ms."""
+        with self._lock:
+            values = list(self._metrics[name].samples)
+        lo, hi = min(values), max(values)
+        step = (hi - lo) / bins or 1e-6
+        counts = [0] * bins
+        for value in values:
+            counts[min(int((value - lo) / step), bins - 1)] += 1
+        peak = max(counts)
+        lines = []
+        for i, n in enumerate(counts):
+            edge = (lo + i * step) * 1000
+            bar = "#" * int(round(width * n / peak)) if peak else ""
+            lines.append(f"  {edge:>9.3f} ms | {bar} {n}")
+        return "\n".join(lines)
+
+    def report(self, histograms=True):
+        """All metrics as p50/p99/max in ms, optionally with a histogram each."""
+        lines = ["Latency profile (ms):",
+                 f"  {'metric':<24}{'count':>9}{'mean':>9}{'p50':>9}{'p99':>9}{'max':>9}"]
+        for name in self.names():
+            s = self.stats(name)
+            lines.append(f"  {name:<24}{s['count']:>9d}{s['mean'] * 1000:>9.3f}"
+                         f"{s['p50'] * 1000:>9.3f}{s['p99'] * 1000:>9.3f}{s['max'] * 1000:>9.3f}")
+        if histograms:
+            for name in self.names():
+                lines.append(f"{name}:")
+                lines.append(self.histogram(name))
+        return "\n".join(lines)
+
+
+class StartupTimeline:
+    """
+    Milestones of one program start (import done, first frame drawn,
+    hardware ready) in seconds since t0, taken as early as possible in the
+    importing script so the figure covers library imports too.
+    """
+    def __init__(self, t0=None):
+        self.t0 = time.perf_counter() if t0 is None else t0
+        self.marks = []
+
+    def mark(self, name):
+        self.marks.append((name, time.perf_counter() - self.t0))
+
+    def report(self):
+        return "Startup: " + ", ".join(f"{name} {t:.3f} s" for name, t in self.marks)
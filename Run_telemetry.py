@@ -0,0 +1,213 @@
+#Phase-boundary telemetry for wear runs: binary ring buffer, background flusher, log reader
+import os
+import struct
+import sys
+import threading
+import time
+
+# --- Event codes (one record per phase boundary) ---
+RUN_START = 1
+CYCLE_START = 2
+PUMP_ON = 3       # arg = pump number
+PUMP_OFF = 4
+CHEW_DOWN = 5     # arg = PWM duty
+CHEW_UP = 6
+MOTOR_OFF = 7     # end of a chew move (arg = hold PWM left on, 0 = released)
+HOLD_START = 8    # arg = nominal wait/hold length (s)
+HOLD_END = 9
+CYCLE_END = 10
+PAUSE = 11
+RESUME = 12
+STOP = 13
+RUN_END = 14
+
+EVENT_NAMES = {
+    RUN_START: "run_start", CYCLE_START: "cycle_start", PUMP_ON: "pump_on",
+    PUMP_OFF: "pump_off", CHEW_DOWN: "chew_down", CHEW_UP: "chew_up",
+    MOTOR_OFF: "motor_off", HOLD_START: "hold_start", HOLD_END: "hold_end",
+    CYCLE_END: "cycle_end", PAUSE: "pause", RESUME: "resume", STOP: "stop",
+    RUN_END: "run_end",
+}
+
+# monotonic time (s), cycle number, event code, argument
+RECORD = struct.Struct("<dIHf")
+MAGIC = b"WEARLOG1"
+DEFAULT_CAPACITY = 4096      # records held in memory between flushes
+FLUSH_INTERVAL = 0.5         # s between batch writes (sooner when half full)
+
+
+# -------------------------------------------------------------------
+# RING BUFFER + FLUSHER
+# -------------------------------------------------------------------
+class TelemetryLog:
+    """
+    Fixed-size binary ring buffer of RECORDs, allocated once. record() only
+    packs 18 bytes into the buffer under a short lock; a background thread
+    appends pending records to the log file in batches, so file I/O never
+    runs on the actuation thread. If the flusher falls a whole buffer behind,
+    new records are dropped (and counted) rather than blocking.
+    """
+    def __init__(self, path, clock=time.monotonic, capacity=DEFAULT_CAPACITY,
+                 flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.clock = clock
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._buf = bytearray(RECORD.size * capacity)
+        self._head = 0   # records written (total)
+        self._tail = 0   # records flushed (total)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._file = open(path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        self._thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self._thread.start()
+
+    def record(self, event, cycle=0, arg=0.0):
+        t = self.clock()
+        with self._lock:
+            if self._closed:
+                return
+            if self._head - self._tail >= self.capacity:
+                self.dropped += 1
+                return
+            RECORD.pack_into(self._buf, (self._head % self.capacity) * RECORD.size,
+                             t, cycle, event, arg)
+            self._head += 1
+            pending = self._head - self._tail
+        if pending >= self.capacity // 2:
+            self._wake.set()
+
+    def _take_pending(self):
+        # copy out the pending slice (may wrap) without holding the lock during I/O
+        with self._lock:
+            start, end = self._tail, self._head
+        if start == end:
+            return start, end, b""
+        a = (start % self.capacity) * RECORD.size
+        b = (end % self.capacity) * RECORD.size
+        if a < b:
+            chunk = bytes(self._buf[a:b])
+        else:
+            chunk = bytes(self._buf[a:]) + bytes(self._buf[:b])
+        return start, end, chunk
+
+    def flush(self):
+        start, end, chunk = self._take_pending()
+        if chunk:
+            self._file.write(chunk)
+            self._file.flush()
+            with self._lock:
+                self._tail = end
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._wake.set()
+        self._thread.join()
+        self.flush()
+        self._file.close()
+        if self.dropped:
+            print(f"Telemetry: {self.dropped} records dropped (flusher fell behind)")
+
+
+# -------------------------------------------------------------------
+# READER
+# -------------------------------------------------------------------
+def read_log(path):
+    """Yield (time, event_name, cycle, arg) for every record in a log file."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path}: not a wear run telemetry log")
+    offset = len(MAGIC)
+    usable = offset + (len(data) - offset) // RECORD.size * RECORD.size
+    for t, cycle, event, arg in RECORD.iter_unpack(data[offset:usable]):
+        yield t, EVENT_NAMES.get(event, str(event)), cycle, arg
+
+
+# start/end event pairs timed per cycle, and the column each adds to
+_SPANS = {
+    "pump_on": ("pump_off", None),
+    "chew_down": ("motor_off", "chew_down"),
+    "chew_up": ("motor_off", "chew_up"),
+    "hold_start": ("hold_end", "hold"),
+    "pause": ("resume", "paused"),
+}
+
+
+def cycle_table(records):
+    """
+    Turn log records into one row per cycle: start (s since run start),
+    length, and the time spent in each phase kind (pump1, pump2, ...,
+    chew_down, chew_up, hold, paused). A log may hold several runs; cycle
+    numbers restart with each run_start.
+    """
+    rows = []
+    row = None
+    run_t0 = None
+    open_spans = {}
+    for t, name, cycle, arg in records:
+        if name == "run_start":
+            run_t0 = t
+            row = None
+        elif name == "cycle_start":
+            row = {"cycle": cycle, "start": t - (t if run_t0 is None else run_t0), "length": None}
+            rows.append(row)
+            open_spans.clear()
+            cycle_t0 = t
+        elif name in _SPANS:
+            open_spans[_SPANS[name][0]] = (t, f"pump{int(arg)}" if name == "pump_on" else _SPANS[name][1])
+        elif name in open_spans and row is not None:
+            started, column = open_spans.pop(name)
+            row[column] = row.get(column, 0.0) + (t - started)
+        if name == "cycle_end" and row is not None:
+            row["length"] = t - cycle_t0
+        elif name == "stop" and row is not None and row["length"] is None:
+            row["length"] = t - cycle_t0
+            row["stopped"] = True
+    return rows
+
+
+def format_table(rows):
+    """Fixed-width text table of cycle_table() rows, times in seconds."""
+    columns = ["cycle", "start", "length"]
+    for row in rows:
+        for key in row:
+            if key not in columns and key != "stopped":
+                columns.append(key)
+    lines = ["  ".join(f"{c:>10}" for c in columns)]
+    for row in rows:
+        cells = []
+        for c in columns:
+            value = row.get(c)
+            if value is None:
+                cells.append(f"{'-':>10}")
+            elif c == "cycle":
+                cells.append(f"{value:>10d}")
+            else:
+                cells.append(f"{value:>10.3f}")
+        lines.append("  ".join(cells) + ("  stopped" if row.get("stopped") else ""))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("usage: python Run_telemetry.py <run log>")
+        sys.exit(1)
+    print(format_table(cycle_table(read_log(sys.argv[1]))))
@@ -0,0 +1,277 @@
+#Timing primitives shared by the run loop and the actuator helpers
+import contextlib
+import heapq
+import itertools
+import math
+import threading
+import time
+
+DRIFT_TOLERANCE = 0.05  # s; a cycle starting later than this behind schedule is reported
+
+
+# -------------------------------------------------------------------
+# CLOCKS
+# -------------------------------------------------------------------
+# Everything that sleeps or waits during a run goes through a clock object,
+# so a simulated rig can swap in VirtualClock and fast-forward whole runs.
+class RealClock:
+    monotonic = staticmethod(time.monotonic)
+    perf_counter = staticmethod(time.perf_counter)
+    sleep = staticmethod(time.sleep)
+
+    @staticmethod
+    def wait(cond, timeout=None):
+        """Wait on a held threading.Condition (notify or timeout)."""
+        cond.wait(timeout)
+
+
+REAL_CLOCK = RealClock()
+
+
+class _Lane:
+    def __init__(self, now):
+        self.now = now
+
+
+class VirtualClock:
+    """
+    Fast-forward clock for simulation. sleep() and wait() jump virtual time
+    ahead instead of blocking. Callbacks registered with call_at() (e.g. a
+    simulated button press) run in the waiting thread when time reaches
+    them, and end a pending wait() early the way a notify would.
+
+    Inside lane() a thread keeps time of its own: its sleeps move only the
+    lane's clock, so blocking work (a simulated pump phase) can be played
+    out ahead of everything else and waited for afterwards, while other
+    tasks use the same stretch of virtual time.
+    """
+    def __init__(self, start=0.0):
+        self._now = start
+        self._timers = []
+        self._seq = itertools.count()
+        self._lock = threading.RLock()
+        self._local = threading.local()
+
+    def monotonic(self):
+        lane = getattr(self._local, "lane", None)
+        return self._now if lane is None else lane.now
+
+    perf_counter = monotonic
+
+    @contextlib.contextmanager
+    def lane(self):
+        """Give the calling thread its own timeline from now; the lane's .now is where it ended."""
+        lane = _Lane(self._now)
+        self._local.lane = lane
+        try:
+            yield lane
+        finally:
+            self._local.lane = None
+
+    def call_at(self, when, callback):
+        with self._lock:
+            heapq.heappush(self._timers, (when, next(self._seq), callback))
+
+    def call_later(self, delay, callback):
+        self.call_at(self._now + delay, callback)
+
+    def _advance(self, limit):
+        # move to limit, or to the first timer before it and run that timer
+        with self._lock:
+            if not self._timers or self._timers[0][0] > limit:
+                self._now = max(self._now, limit)
+                return
+            when, _, callback = heapq.heappop(self._timers)
+            self._now = max(self._now, when)
+        callback()
+
+    def sleep(self, seconds):
+        lane = getattr(self._local, "lane", None)
+        if lane is not None:
+            lane.now += max(seconds, 0)
+            return
+        end = self._now + max(seconds, 0)
+        while self._now < end:
+            self._advance(end)
+
+    def pending(self):
+        return bool(self._timers)
+
+    def idle(self, timeout=None):
+        """Jump ahead by timeout, or to the next timer (running it) if that comes first."""
+        if timeout is None:
+            if not self._timers:
+                raise RuntimeError("virtual clock: waiting forever with nothing scheduled")
+            limit = self._timers[0][0]
+        else:
+            limit = self._now + timeout
+        self._advance(limit)
+
+    def wait(self, cond, timeout=None):
+        self.idle(timeout)
+
+
+# -------------------------------------------------------------------
+# CANCELLATION TOKEN
+# -------------------------------------------------------------------
+# Every actuation primitive (stepper playback, timed moves) takes one of
+# these. cancel() is callable from any thread: it sets the flag, wakes
+# anything blocked in wait()/sleep() at once, and runs on_cancel()
+# callbacks (e.g. stop a pigpio wave) on the cancelling thread.
+class CancelToken:
+    def __init__(self, parent=None):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._parent = parent
+        if parent is not None:
+            parent.on_cancel(self.cancel)
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def keep_running(self):
+        return not self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def on_cancel(self, callback):
+        """Run callback on cancel (at once if already cancelled)."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def discard(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def detach(self):
+        """Unlink from the parent token once this one is no longer needed."""
+        if self._parent is not None:
+            self._parent.discard(self.cancel)
+            self._parent = None
+
+    def wait(self, timeout=None):
+        """Block until cancelled or timeout; True if cancelled."""
+        return self._event.wait(timeout)
+
+    def sleep(self, seconds):
+        """Sleep unless cancelled first; True if the full time elapsed."""
+        return not self._event.wait(max(seconds, 0))
+
+
+# -------------------------------------------------------------------
+# CYCLE SCHEDULER
+# -------------------------------------------------------------------
+class CycleScheduler:
+    """
+    Drift-free fluid-cycle timeline on time.monotonic(). Cycle k is due at
+    start + k * period + paused time, however long earlier cycles actually
+    took, so a 12 hour run starts exactly ceil(total / period) cycles as long
+    as no cycle overruns its whole period.
+
+    Within a cycle every phase is laid on the same timeline with advance().
+    Hold/idle phases wait until their absolute deadline, so time lost in a
+    pump or motor phase is paid back out of the next hold window. end_phase()
+    records each phase's own overrun; drift is how far behind the ideal
+    timeline the run currently is (it does not accumulate across cycles).
+    """
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.start(1.0)
+
+    def start(self, period, cycles=0):
+        """Start the timeline; cycles > 0 resumes a run as if that many cycles were already done."""
+        now = self.clock()
+        self.period = period
+        self.t0 = now - cycles * period
+        self.paused_total = 0.0
+        self._pause_started = None
+        self.cycles = cycles
+        self.cursor = now
+        self._lateness = 0.0
+        self.drift = 0.0
+        self.max_drift = 0.0
+        self.late_cycles = 0
+        self.overruns = {}   # phase name -> worst overrun of its nominal duration (s)
+
+    # -- run time (excludes pauses) --
+    def elapsed(self):
+        now = self._pause_started if self._pause_started is not None else self.clock()
+        return now - self.t0 - self.paused_total
+
+    def time_at(self, elapsed):
+        """Monotonic time at which the run will have been active for elapsed seconds."""
+        return self.t0 + self.paused_total + elapsed
+
+    def pause(self):
+        if self._pause_started is None:
+            self._pause_started = self.clock()
+
+    def resume(self):
+        if self._pause_started is not None:
+            self.paused_total += self.clock() - self._pause_started
+            self._pause_started = None
+
+    # -- cycle timeline --
+    def next_cycle_due(self):
+        return self.time_at(self.cycles * self.period)
+
+    def begin_cycle(self):
+        self.cursor = self.next_cycle_due()
+        self._lateness = max(self.clock() - self.cursor, 0.0)
+        if self._lateness > DRIFT_TOLERANCE:
+            self.late_cycles += 1
+
+    def advance(self, duration):
+        """Append a phase of nominal duration; returns its absolute deadline."""
+        self.cursor += max(duration, 0)
+        return self.cursor
+
+    def end_phase(self, name):
+        """Record how far this phase overshot its nominal length; returns the overrun."""
+        lateness = max(self.clock() - self.cursor, 0.0)
+        overrun = lateness - self._lateness
+        if overrun > self.overruns.get(name, 0.0):
+            self.overruns[name] = overrun
+        self._lateness = lateness
+        return overrun
+
+    def end_task(self, name, deadline):
+        """
+        end_phase() for a phase that ran alongside others (pipelined cycles):
+        its overrun is measured against its own deadline.
+        """
+        overrun = max(self.clock() - deadline, 0.0) - self._lateness
+        if overrun > self.overruns.get(name, 0.0):
+            self.overruns[name] = overrun
+        return max(overrun, 0.0)
+
+    def end_cycle(self, deadline=None):
+        """deadline: where a pipelined cycle's main sequence should have ended."""
+        if deadline is not None:
+            self._lateness = max(self.clock() - deadline, 0.0)
+        self.cycles += 1
+        self.drift = self._lateness
+        self.max_drift = max(self.max_drift, self.drift)
+
+    def expected_cycles(self, total_seconds):
+        return math.ceil(total_seconds / self.period) if self.period > 0 else 0
+
+    def report(self, total_seconds):
+        expected = self.expected_cycles(total_seconds)
+        worst = ", ".join(f"{name} {overrun * 1000:.1f} ms" for name, overrun in sorted(self.overruns.items()))
+        return (f"{self.cycles}/{expected} cycles, drift {self.drift * 1000:.1f} ms "
+                f"(max {self.max_drift * 1000:.1f} ms, {self.late_cycles} cycles started "
+                f"> {DRIFT_TOLERANCE * 1000:.0f} ms late); worst overrun: {worst or 'none'}")
@@ -0,0 +1,263 @@
+#Change-only, rate-limited writer for the HT16K33 segment displays (adafruit_ht16k33 Seg14x4/Seg7x4)
+import sys
+import threading
+import time
+
+MAX_REFRESH_RATE = 20   # Hz: most I2C pushes per display per second
+WRITE_OVERHEAD = 3      # bytes an extra I2C write costs (device address, register, start/stop)
+FRAME_SIZE = 17         # bytes a full show() sends per chip (register 0x00 + 16 bytes of display RAM)
+
+
+def changed_runs(old, new):
+    """
+    (start, end) byte ranges where new differs from old (old=None: all of
+    new). Runs closer together than WRITE_OVERHEAD are merged, since
+    resending a few unchanged bytes is cheaper than another transaction.
+    """
+    if old is None:
+        return [(0, len(new))]
+    runs = []
+    for i, (a, b) in enumerate(zip(old, new)):
+        if a == b:
+            continue
+        if runs and i - runs[-1][1] < WRITE_OVERHEAD:
+            runs[-1][1] = i + 1
+        else:
+            runs.append([i, i + 1])
+    return [tuple(run) for run in runs]
+
+
+class CachedDisplay:
+    """
+    One HT16K33 display (created with auto_write=False) with the calls the
+    prototypes use: print(), fill(), colon and brightness. They only change
+    the library's in-memory frame, so they cost microseconds, and repeating
+    the text already shown costs nothing at all. The DisplayWriter thread
+    sends what changed: each write starts at the first changed display
+    register and covers only the changed digits (the HT16K33 auto-increments
+    its register address), instead of the full 16-byte frame per print.
+    Partial writes read the library's frame buffer (adafruit_ht16k33 4.x
+    internals); a version without them gets a whole device.show() per
+    refresh instead, still change-only and rate-limited.
+    """
+    def __init__(self, device, writer):
+        self.device = device
+        self.writer = writer
+        self._text = None
+        self._colon = False
+        # the library keeps each chip's frame as register address 0x00 + 16 bytes
+        chips = getattr(device, "i2c_device", None)
+        self._partial = (hasattr(device, "_buffer") and hasattr(device, "_buffer_size")
+                         and isinstance(chips, list))
+        if not self._partial:
+            print(f"{type(device).__name__}: no frame buffer to diff, refreshing with show()")
+        self._chips = len(chips) if isinstance(chips, list) else 1
+        self._shown = [None] * self._chips
+        self._dirty = True   # send the whole frame once: the chip's RAM is unknown
+
+    def print(self, value):
+        with self.writer.lock:
+            if value == self._text:
+                return
+            self.device.print(value)
+            self._text = value
+            self._changed()
+
+    def fill(self, color):
+        with self.writer.lock:
+            self.device.fill(color)
+            self._text = None
+            self._changed()
+
+    @property
+    def colon(self):
+        return self._colon
+
+    @colon.setter
+    def colon(self, on):
+        # only the 7-segment displays have a colon (on Seg14x4 this is a no-op, as before)
+        with self.writer.lock:
+            if on == self._colon:
+                return
+            self._colon = on
+            if hasattr(type(self.device), "colon"):
+                self.device.colon = on
+                self._changed()
+
+    @property
+    def brightness(self):
+        return self.device.brightness
+
+    @brightness.setter
+    def brightness(self, value):
+        with self.writer.bus_lock:
+            self.device.brightness = value   # a single command byte, written now
+
+    def _changed(self):
+        self._dirty = True
+        self.writer.wake()
+
+    def flush(self):
+        """Send the changed bytes (writer thread). Returns the bytes put on the bus."""
+        if not self._partial:
+            return self._show()
+        with self.writer.lock:
+            if not self._dirty:
+                return 0
+            self._dirty = False
+            frame = bytes(self.device._buffer)
+        size = self.device._buffer_size
+        sent = 0
+        for k, i2c_dev in enumerate(self.device.i2c_device):
+            data = frame[k * size + 1:(k + 1) * size]
+            try:
+                with self.writer.bus_lock, i2c_dev:
+                    for start, end in changed_runs(self._shown[k], data):
+                        i2c_dev.write(bytes([start]) + data[start:end])
+                        sent += end - start + 1
+                self._shown[k] = data
+            except OSError as e:
+                # e.g. a loose display cable: resend everything on the next refresh
+                print(f"Display 0x{i2c_dev.device_address:02x}: write failed ({e})")
+                self._shown[k] = None
+                with self.writer.lock:
+                    self._dirty = True
+        return sent
+
+    def _show(self):
+        # no frame buffer to copy: hold the frame still while show() sends it
+        with self.writer.lock:
+            if not self._dirty:
+                return 0
+            self._dirty = False
+            try:
+                with self.writer.bus_lock:
+                    self.device.show()
+            except OSError as e:
+                print(f"Display {type(self.device).__name__}: write failed ({e})")
+                self._dirty = True
+                return 0
+        return FRAME_SIZE * self._chips
+
+
+class DisplayWriter:
+    """
+    Background thread that pushes the changed digits of its displays to
+    the I2C bus at most max_rate times a second. Updates between two
+    refreshes coalesce into one write, so the main loop never waits on the
+    bus however often it prints.
+    """
+    def __init__(self, max_rate=MAX_REFRESH_RATE):
+        self.period = 1.0 / max_rate
+        self.lock = threading.Lock()       # the displays' frames
+        self.bus_lock = threading.Lock()   # I2C transactions from this process
+        self.displays = []
+        self.writes = 0         # refreshes that sent anything
+        self.bytes_sent = 0
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="displays", daemon=True)
+        self._thread.start()
+
+    def add(self, device):
+        """Wrap a Seg14x4/Seg7x4 made with auto_write=False; returns its CachedDisplay."""
+        device.auto_write = False
+        display = CachedDisplay(device, self)
+        with self.lock:
+            self.displays.append(display)
+        self.wake()
+        return display
+
+    def wake(self):
+        self._wake.set()
+
+    def flush(self):
+        sent = sum(display.flush() for display in list(self.displays))
+        if sent:
+            self.writes += 1
+            self.bytes_sent += sent
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait()
+            self._wake.clear()
+            started = time.monotonic()
+            self.flush()
+            time.sleep(max(self.period - (time.monotonic() - started), 0))
+
+    def close(self):
+        """Stop the thread after one last flush (e.g. the blanked displays at exit)."""
+        self._closed = True
+        self.wake()
+        self._thread.join()
+        self.flush()
+
+
+# -------------------------------------------------------------------
+# BENCHMARK (python Segment_display.py [loop iterations])
+# -------------------------------------------------------------------
+class _RecordingI2C:
+    # stands in for board.I2C(): counts bytes and holds the caller for the
+    # time they take on a 100 kHz bus (9 bits per byte plus the address byte)
+    def __init__(self, hz=100000):
+        self.hz = hz
+        self.transactions = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def try_lock(self):
+        return self._lock.acquire(blocking=False)
+
+    def unlock(self):
+        self._lock.release()
+
+    def writeto(self, address, buffer, *, start=0, end=None):
+        n = len(buffer[start:end])
+        self.transactions += 1
+        self.bytes += n
+        time.sleep((n + 1) * 9 / self.hz)
+
+
+def benchmark(iterations=1000):
+    """
+    Prototype_1_with_Purge's running loop (timer and cycle displays
+    updated every 10 ms iteration), direct vs through a DisplayWriter:
+    I2C traffic and main-loop time spent on the displays per iteration.
+    """
+    from adafruit_ht16k33.segments import Seg14x4
+
+    def run(print_timer, print_cycles):
+        spent = 0.0
+        for i in range(iterations):
+            elapsed = i // 100   # one iteration = 10 ms
+            started = time.perf_counter()
+            print_timer(f"{elapsed // 60:02d}{elapsed % 60:02d}")
+            print_cycles(f"{elapsed // 2:04d}")
+            spent += time.perf_counter() - started
+            time.sleep(0.01)
+        return spent / iterations
+
+    bus = _RecordingI2C()
+    timer, cycles = Seg14x4(bus, address=0x70), Seg14x4(bus, address=0x71)
+    bus.transactions = bus.bytes = 0
+    direct = run(timer.print, cycles.print)
+    results = [("direct print()", direct, bus.transactions, bus.bytes)]
+
+    bus = _RecordingI2C()
+    timer, cycles = Seg14x4(bus, address=0x70, auto_write=False), Seg14x4(bus, address=0x71, auto_write=False)
+    bus.transactions = bus.bytes = 0
+    writer = DisplayWriter()
+    timer, cycles = writer.add(timer), writer.add(cycles)
+    cached = run(timer.print, cycles.print)
+    writer.close()
+    results.append(("DisplayWriter", cached, bus.transactions, bus.bytes))
+
+    seconds = iterations / 100
+    print(f"{iterations} loop iterations ({seconds:g} s of timer), 2 displays:")
+    for name, per_loop, transactions, sent in results:
+        print(f"  {name:>16}: {per_loop * 1e6:9.1f} us per iteration, "
+              f"{transactions:6d} I2C writes, {sent:7d} bytes")
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,547 @@
+#Simulated wear rig: drop-in stand-in for RPi.GPIO plus a headless run harness
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+
+from Run_timing import REAL_CLOCK, VirtualClock
+from Stepper_driver import ramp_segments
+
+
+# -------------------------------------------------------------------
+# SIMULATED GPIO (same calls DeviceUI makes on RPi.GPIO)
+# -------------------------------------------------------------------
+class SimulatedPWM:
+    def __init__(self, gpio, pin, freq):
+        self.gpio = gpio
+        self.pin = pin
+        self.freq = freq
+        self.duty = 0
+
+    def start(self, duty):
+        self.ChangeDutyCycle(duty)
+
+    def ChangeDutyCycle(self, duty):
+        if duty != self.duty:
+            self.duty = duty
+            self.gpio.record('pwm', self.pin, duty)
+            for callback in self.gpio.pwm_watchers:
+                callback(self.pin, duty)
+
+    def ChangeFrequency(self, freq):
+        self.freq = freq
+
+    def stop(self):
+        self.ChangeDutyCycle(0)
+
+
+class SimulatedGPIO:
+    """
+    Records every output change, PWM duty change and stepper burst into
+    self.trace as (time, kind, pin(s), value), timestamped by the clock it
+    was given (a VirtualClock makes whole runs fast-forward). Inputs idle
+    HIGH like the pulled-up buttons; press() simulates a button press.
+    """
+    BCM = 'BCM'
+    BOARD = 'BOARD'
+    OUT = 'OUT'
+    IN = 'IN'
+    LOW = 0
+    HIGH = 1
+    PUD_UP = 'PUD_UP'
+    PUD_DOWN = 'PUD_DOWN'
+    FALLING = 'FALLING'
+    RISING = 'RISING'
+    BOTH = 'BOTH'
+
+    def __init__(self, clock=REAL_CLOCK, strict=False):
+        self.clock = clock
+        self.strict = strict    # like RPi.GPIO: output() only to pins set up as outputs
+        self.outputs = set()
+        self.levels = {}
+        self.trace = []
+        self.pwm_watchers = []   # callback(pin, duty) on every PWM change (simulated plants)
+        self._callbacks = {}
+
+    def record(self, kind, pin, value, t=None):
+        self.trace.append((self.clock.monotonic() if t is None else t, kind, pin, value))
+
+    # --- RPi.GPIO API ---
+    def setmode(self, mode):
+        pass
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, pin, mode, pull_up_down=None, initial=None):
+        if mode == self.IN:
+            self.outputs.discard(pin)
+            self.levels.setdefault(pin, self.LOW if pull_up_down == self.PUD_DOWN else self.HIGH)
+        else:
+            self.outputs.add(pin)
+            if initial is not None:
+                self.output(pin, initial)
+
+    def output(self, pin, value):
+        if isinstance(pin, (list, tuple)):
+            values = value if isinstance(value, (list, tuple)) else [value] * len(pin)
+            for p, v in zip(pin, values):
+                self.output(p, v)
+            return
+        if self.strict and pin not in self.outputs:
+            raise RuntimeError(f"The GPIO channel {pin} has not been set up as an OUTPUT")
+        self.drive(pin, value)
+
+    def drive(self, pin, value):
+        """Set a pin's level without the RPi.GPIO checks (other pin owners, e.g. pigpio)."""
+        value = int(bool(value))
+        if self.levels.get(pin) != value:
+            self.levels[pin] = value
+            self.record('out', pin, value)
+
+    def input(self, pin):
+        return self.levels.get(pin, self.HIGH)
+
+    def PWM(self, pin, freq):
+        return SimulatedPWM(self, pin, freq)
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        self._callbacks[pin] = callback
+
+    def remove_event_detect(self, pin):
+        self._callbacks.pop(pin, None)
+
+    def cleanup(self, *pins):
+        self._callbacks.clear()
+
+    # --- simulation helpers ---
+    def press(self, pin):
+        """Momentary button press: line goes LOW, edge callback fires, line returns HIGH."""
+        self.levels[pin] = self.LOW
+        self.record('in', pin, self.LOW)
+        callback = self._callbacks.get(pin)
+        if callback is not None:
+            callback(pin)
+        self.levels[pin] = self.HIGH
+        self.record('in', pin, self.HIGH)
+
+    def record_steps(self, pins, phases, period, steps, first_index, t=None, intervals=None):
+        """
+        Log a stepper burst starting at t as one entry; consecutive chunks of
+        the same burst are merged. A ramp is logged with its per-step
+        intervals (a shared tuple, not copied) and never merged.
+        """
+        pins = tuple(pins)
+        t = self.clock.monotonic() if t is None else t
+        if intervals is not None:
+            self.record('steps', pins, {'phases': phases, 'period': period, 'steps': steps,
+                                        'first_index': first_index, 'intervals': intervals}, t)
+            self._set_last_phase(pins, phases, first_index + steps - 1)
+            return
+        if self.trace:
+            last_t, kind, last_pins, value = self.trace[-1]
+            if (kind == 'steps' and last_pins == pins and value['period'] == period
+                    and 'intervals' not in value
+                    and value['first_index'] + value['steps'] == first_index
+                    and abs(last_t + value['steps'] * period - t) < period):
+                value['steps'] += steps
+                self._set_last_phase(pins, phases, first_index + steps - 1)
+                return
+        self.record('steps', pins, {'phases': phases, 'period': period,
+                                    'steps': steps, 'first_index': first_index}, t)
+        self._set_last_phase(pins, phases, first_index + steps - 1)
+
+    def _set_last_phase(self, pins, phases, index):
+        for pin, level in zip(pins, phases[index % len(phases)]):
+            self.levels[pin] = level
+
+    def stepper_backend(self):
+        return SimStepperBackend(self)
+
+
+class SimStepperBackend:
+    """StepperDriver backend that logs step bursts instead of timing every step."""
+    CHUNK = 0.05   # s of stepping simulated between keep_running() checks
+
+    def __init__(self, gpio):
+        self.gpio = gpio
+
+    def setup_outputs(self, pins):
+        for pin in pins:
+            self.gpio.setup(pin, self.gpio.OUT)
+            self.gpio.output(pin, 0)
+
+    def write(self, pins, levels):
+        self.gpio.output(list(pins), tuple(levels))
+
+    def _wait(self, end, cancel):
+        # True if a cancel cut the wait short (real time only)
+        clock = self.gpio.clock
+        if cancel is not None and not isinstance(clock, VirtualClock):
+            return cancel.wait(max(end - clock.monotonic(), 0))
+        clock.sleep(max(end - clock.monotonic(), 0))
+        return False
+
+    def play(self, pins, phases, period, steps=None, keep_running=None, cancel=None, ramp=None):
+        clock = self.gpio.clock
+        chunk = max(int(self.CHUNK / period), 1)
+        t = clock.monotonic()   # every segment and chunk stays on the burst's own timeline
+        done = 0
+        for intervals, count in ramp_segments(period, ramp, steps):
+            if intervals is not None:
+                # a ramp is short: simulate it in one go
+                if (keep_running is not None and not keep_running()) or (cancel is not None and cancel.cancelled):
+                    return done
+                end = t + sum(intervals)
+                n = count
+                if self._wait(end, cancel):
+                    elapsed = itertools.accumulate(intervals)
+                    n = min(sum(1 for e in elapsed if t + e <= clock.monotonic()) + 1, count)
+                    intervals = intervals[:n]
+                self.gpio.record_steps(pins, phases, period, n, done, t, intervals)
+                done += n
+                if n < count:
+                    return done
+                t = end
+                continue
+            seg_done = 0
+            while count is None or seg_done < count:
+                if keep_running is not None and not keep_running():
+                    return done
+                if cancel is not None and cancel.cancelled:
+                    return done
+                n = chunk if count is None else min(chunk, count - seg_done)
+                end = t + n * period
+                if self._wait(end, cancel):
+                    # a cancel ends the chunk at once; log only the steps that fit
+                    n = min(int((clock.monotonic() - t) / period) + 1, n)
+                    self.gpio.record_steps(pins, phases, period, n, done, t)
+                    return done + n
+                self.gpio.record_steps(pins, phases, period, n, done, t)
+                done += n
+                seg_done += n
+                t = end
+        return done
+
+    def halt(self, pins=None):
+        pass
+
+
+class SimPigpioBackend(SimStepperBackend):
+    """Like PigpioBackend, owns the pump pins itself: they are never gpio.setup() as outputs."""
+    def setup_outputs(self, pins):
+        for pin in pins:
+            self.gpio.drive(pin, 0)
+
+    def write(self, pins, levels):
+        for pin, level in zip(pins, levels):
+            self.gpio.drive(pin, level)
+
+
+# -------------------------------------------------------------------
+# SIMULATED CHEW AXIS (plant for closed-loop chew moves)
+# -------------------------------------------------------------------
+class SimulatedChewAxis:
+    """
+    Chew head driven by the motor's two PWM channels: speed follows the
+    H-bridge duty above a deadband (no inertia), scaled by load, between
+    hard stops. The position reads like an encoder's .count, so it plugs
+    into Chew_axis.EncoderFeedback. Changing load mimics a stiffer sample
+    or a sagging supply, which shortens open-loop timed moves.
+    """
+    def __init__(self, gpio, in1_pin, in2_pin, counts_per_s_full=3000.0, deadband=10,
+                 stops=(-20, 450), load=1.0):
+        self.clock = gpio.clock
+        self.in1_pin = in1_pin
+        self.duty = {in1_pin: 0, in2_pin: 0}
+        self.counts_per_s_full = counts_per_s_full
+        self.deadband = deadband
+        self.stops = stops
+        self.load = load
+        self._position = 0.0
+        self._t = self.clock.monotonic()
+        gpio.pwm_watchers.append(self._on_pwm)
+
+    def _advance(self):
+        now = self.clock.monotonic()
+        in1, in2 = (self.duty[pin] for pin in self.duty)
+        drive = in1 - in2   # in1 drives down (larger counts)
+        speed = self.counts_per_s_full * self.load * max(abs(drive) - self.deadband, 0) / (100 - self.deadband)
+        self._position += (speed if drive > 0 else -speed) * (now - self._t)
+        self._position = min(max(self._position, self.stops[0]), self.stops[1])
+        self._t = now
+
+    def _on_pwm(self, pin, duty):
+        if pin in self.duty:
+            self._advance()
+            self.duty[pin] = duty
+
+    @property
+    def count(self):
+        self._advance()
+        return int(round(self._position))
+
+
+# -------------------------------------------------------------------
+# TRACE HELPERS
+# -------------------------------------------------------------------
+def transitions(trace):
+    """Expand a trace into individual (time, pin, level) transitions, steps included."""
+    levels = {}
+    for t, kind, pin, value in trace:
+        if kind == 'steps':
+            phases, period = value['phases'], value['period']
+            intervals = value.get('intervals')
+            offset = 0.0
+            for i in range(value['steps']):
+                phase = phases[(value['first_index'] + i) % len(phases)]
+                for p, level in zip(pin, phase):
+                    if levels.get(p) != level:
+                        levels[p] = level
+                        yield (t + (offset if intervals else i * period), p, level)
+                if intervals:
+                    offset += intervals[i]
+        elif kind in ('out', 'in'):
+            levels[pin] = value
+            yield (t, pin, value)
+
+
+def summarize(trace):
+    """Per-kind counts and total steps per stepper, for regression comparisons."""
+    summary = {'out': 0, 'in': 0, 'pwm': 0, 'steps': {}}
+    for _, kind, pin, value in trace:
+        if kind == 'steps':
+            key = ",".join(str(p) for p in pin)
+            summary['steps'][key] = summary['steps'].get(key, 0) + value['steps']
+        else:
+            summary[kind] += 1
+    return summary
+
+
+def save_trace(trace, path):
+    """Write the trace as JSON lines (one entry per line)."""
+    with open(path, "w") as f:
+        for t, kind, pin, value in trace:
+            f.write(json.dumps([round(t, 6), kind, pin, value]) + "\n")
+
+
+# -------------------------------------------------------------------
+# HEADLESS RUN
+# -------------------------------------------------------------------
+def run_headless(minutes=720, chews=2, fluid_cycle=10.0, presses=(), recipe_path=None):
+    """
+    Run a whole DeviceUI run with no Tk and no Pi on a virtual clock.
+    presses is a list of (seconds_into_run, pin) button presses, timed
+    from the run's start on the controller loop. Returns (app, trace). WEAR_RIG_SIM=fast must be in effect when
+    Final_Prototype_UI is first imported; this sets it if it can.
+    """
+    os.environ.setdefault("WEAR_RIG_SIM", "fast")
+    import Final_Prototype_UI as ui
+    if ui.SIMULATE != "fast":
+        raise RuntimeError("Final_Prototype_UI was already imported without WEAR_RIG_SIM=fast")
+
+    app = ui.DeviceUI(None, recipe_path or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "recipes", "default_wear.json"))
+    app.total_seconds = int(minutes * 60)
+    app.chews = chews
+    app.fluid_cycle = max(fluid_cycle, app._calculate_min_fluid_cycle())
+
+    def begin():
+        app._start()
+        for when, pin in presses:
+            app.controller.loop.call_later(when, ui.GPIO.press, pin)
+
+    app.controller.call(begin).result()
+    app.controller.wait('run')
+    return app, ui.GPIO.trace
+
+
+# -------------------------------------------------------------------
+# STOP LATENCY TEST (real time)
+# -------------------------------------------------------------------
+def _stop_latency(trace, pressed_at, motor_pins, pump_pins):
+    # motor: first moment from the press on with both PWM duties at 0 (a STOP
+    # in replace mode lowers the sample again afterwards, which is intended);
+    # pumps: the last change to any enable/coil pin, and they must end low
+    duty = {}
+    motor_off = None
+    for t, kind, pin, value in sorted(trace, key=lambda entry: entry[0]):
+        if t >= pressed_at and motor_off is None and not any(duty.values()):
+            motor_off = pressed_at
+        if kind == 'pwm' and pin in motor_pins:
+            duty[pin] = value
+            if t >= pressed_at and motor_off is None and not any(duty.values()):
+                motor_off = t
+    levels = {}
+    pumps_off = pressed_at
+    for t, pin, level in sorted(transitions(trace)):
+        if pin in pump_pins:
+            levels[pin] = level
+            if t >= pressed_at:
+                pumps_off = t
+    if motor_off is None or any(levels.values()):
+        return float("inf")
+    return max(motor_off, pumps_off) - pressed_at
+
+
+def _stop_latency_live(gpio, station, pump_pins, playing, pressed_at, timeout=1.0):
+    # read the outputs themselves until the stepper burst has wound down and
+    # every pump pin and motor duty is low (a step finishing after the trip
+    # would raise a coil again, which the trace cannot show)
+    while REAL_CLOCK.monotonic() - pressed_at < timeout:
+        if (not playing.is_set() and not any(gpio.levels.get(pin) for pin in pump_pins)
+                and station.pwm_in1.duty == 0 and station.pwm_in2.duty == 0):
+            return REAL_CLOCK.monotonic() - pressed_at
+        time.sleep(0.0001)
+    return float("inf")
+
+
+def stop_latency_test(trials=12, bound=0.005, seed=None):
+    """
+    Press STOP at random moments of a real-time simulated run, startup fill
+    and replace-sample lift, and measure from the press to every output
+    (motor PWM, pump enables, stepper coils) being low. The "pump" trials
+    press while a dose is playing on a stepper thread and read the outputs
+    until that thread has stopped. Returns (latencies in s, passed).
+    WEAR_RIG_SIM=1 must be in effect when Final_Prototype_UI is first
+    imported; this sets it if it can.
+    """
+    import random
+    os.environ.setdefault("WEAR_RIG_SIM", "1")
+    import Final_Prototype_UI as ui
+    if ui.SIMULATE in ("", "fast"):
+        raise RuntimeError("Final_Prototype_UI was already imported without WEAR_RIG_SIM=1")
+
+    rng = random.Random(seed)
+    app = ui.DeviceUI(None, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                         "recipes", "default_wear.json"))
+    pins = ui.PINS
+    motor_pins = (pins.motor_in1, pins.motor_in2)
+    pump_pins = set(pins.pump1_enable + pins.pump1_coils + pins.pump2_enable + pins.pump2_coils)
+    playing = threading.Event()   # a pump burst is playing on a stepper thread
+    play = app.station.backend.play
+
+    def watched_play(*args, **kwargs):
+        playing.set()
+        try:
+            return play(*args, **kwargs)
+        finally:
+            playing.clear()
+
+    app.station.backend.play = watched_play
+    scenarios = [("run", app.start, 0.2, 6.0),
+                 ("startup", app._toggle_startup, 0.1, 1.0),
+                 ("replace", app._toggle_replace, 0.05, 0.4),
+                 ("pump", app.start, 0.05, 0.5)]
+    latencies = []
+    try:
+        for i in range(trials):
+            name, begin, lo, hi = scenarios[i % len(scenarios)]
+            begin()
+            if name == "pump" and not playing.wait(10):
+                raise RuntimeError("stop latency: no pump phase started")
+            time.sleep(rng.uniform(lo, hi))
+            pressed_at = REAL_CLOCK.monotonic()
+            ui.GPIO.press(pins.stop)
+            if name == "pump":
+                latency = _stop_latency_live(ui.GPIO, app.station, pump_pins, playing, pressed_at)
+            for slot in ('run', 'pump1', 'pump2', 'motor'):
+                app.controller.wait(slot)   # includes the replace sample being lowered again
+            if name != "pump":
+                latency = _stop_latency(ui.GPIO.trace, pressed_at, motor_pins, pump_pins)
+            latencies.append(latency)
+            print(f"  {name:<8} STOP -> outputs safe {latency * 1000:8.3f} ms")
+    finally:
+        app.controller.close()
+        app.station.close()
+    ordered = sorted(latencies)
+    worst = ordered[-1]
+    print(f"{trials} stops: p50 {ordered[len(ordered) // 2] * 1000:.3f} ms, "
+          f"max {worst * 1000:.3f} ms (bound {bound * 1000:g} ms) -> {'PASS' if worst <= bound else 'FAIL'}")
+    return latencies, worst <= bound
+
+
+# -------------------------------------------------------------------
+# SAFE-OUTPUTS CHECK
+# -------------------------------------------------------------------
+def check_safe_outputs():
+    """
+    Station.safe(), pumps_off() and close() on a strict GPIO (RPi.GPIO's
+    'not set up as an OUTPUT' error) with a pigpio-style backend that owns
+    the pump pins, after a pump was left running. Returns True if every
+    pump and motor output ends low.
+    """
+    from Station import PinMap, Station
+    pins = PinMap((18, 15), (17, 27, 22, 23), (8, 11), (25, 24, 9, 10), 12, 13, 16, 1, 14)
+    gpio = SimulatedGPIO(VirtualClock(), strict=True)
+    station = Station("rig1", gpio, pins, backend=SimPigpioBackend(gpio), clock=gpio.clock)
+    station.pump1.energize()
+    station.pump1.step(1)
+    try:
+        station.pumps_off()
+        station.safe()
+        station.close()
+    except RuntimeError as e:
+        print(f"safe outputs: FAIL ({e})")
+        return False
+    pump_pins = pins.pump1_enable + pins.pump1_coils + pins.pump2_enable + pins.pump2_coils
+    low = not any(gpio.levels.get(pin) for pin in pump_pins)
+    low = low and station.pwm_in1.duty == 0 and station.pwm_in2.duty == 0
+    print(f"safe outputs: {'PASS' if low else 'FAIL (outputs left high)'}")
+    return low
+
+
+# -------------------------------------------------------------------
+# REPEATABILITY CHECK (fast-forward)
+# -------------------------------------------------------------------
+def check_repeatable(runs=6, minutes=10):
+    """
+    The same headless run (PAUSE at 25 s, GO at 100 s, STOP at 300 s)
+    several times over: every pin and PWM change must come at the same
+    time from the run's start each time. Returns True if they all match.
+    """
+    os.environ.setdefault("WEAR_RIG_SIM", "fast")
+    import Final_Prototype_UI as ui
+    if ui.SIMULATE != "fast":
+        raise RuntimeError("Final_Prototype_UI was already imported without WEAR_RIG_SIM=fast")
+    ui.init_hardware()   # pin setup once, outside the compared runs
+    pins = ui.PINS
+    presses = [(25, pins.pause), (100, pins.go), (300, pins.stop)]
+    first = None
+    for i in range(runs):
+        started, seen = ui.CLOCK.monotonic(), len(ui.GPIO.trace)
+        app, trace = run_headless(minutes, presses=presses)
+        app.controller.close()
+        run = [(round(t - started, 6), kind, pin, value) for t, kind, pin, value in trace[seen:]]
+        if first is None:
+            first = run
+        elif run != first:
+            print(f"repeatable: FAIL (run {i + 1} differs from run 1)")
+            return False
+    print(f"repeatable: PASS ({runs} runs, {len(first)} trace entries each)")
+    return True
+
+
+if __name__ == "__main__" and sys.argv[1:2] == ["--check-repeatable"]:
+    sys.exit(0 if check_repeatable() else 1)
+
+if __name__ == "__main__" and sys.argv[1:2] == ["--check-safe"]:
+    sys.exit(0 if check_safe_outputs() else 1)
+
+if __name__ == "__main__" and sys.argv[1:2] == ["--stop-latency"]:
+    trials = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+    sys.exit(0 if stop_latency_test(trials)[1] else 1)
+
+if __name__ == "__main__":
+    minutes = float(sys.argv[1]) if len(sys.argv) > 1 else 720
+    wall = time.perf_counter()
+    app, trace = run_headless(minutes)
+    wall = time.perf_counter() - wall
+    print(f"{minutes:g} min simulated in {wall:.2f} s wall: {app.cycle_count} cycles, "
+          f"{len(trace)} trace entries")
+    print(summarize(trace))
+    import Final_Prototype_UI as ui
+    if ui.PROFILE is not None:
+        print(ui.PROFILE.report(histograms=False))
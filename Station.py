@@ -0,0 +1,358 @@
+#One wear rig as an object, and a supervisor that runs several rigs from one timing thread
+import heapq
+import itertools
+import sys
+import threading
+import time
+from collections import namedtuple
+
+from Hardware_pwm import make_pwm
+from Run_timing import CycleScheduler, REAL_CLOCK
+from Stepper_driver import DEFAULT_STEP_RATE, StepperDriver, make_backend
+
+# Wiring of one rig (BCM numbers on whatever gpio object drives it: the Pi
+# header, or a GPIO expander with an RPi.GPIO-style interface)
+PinMap = namedtuple("PinMap", "pump1_enable pump1_coils pump2_enable pump2_coils "
+                              "motor_in1 motor_in2 stop go pause")
+
+
+
+def pin_bundles(pins):
+    """Pins that are written or watched together: each pump's ENA/ENB/IN1-4, and the buttons."""
+    return [list(pins.pump1_enable) + list(pins.pump1_coils),
+            list(pins.pump2_enable) + list(pins.pump2_coils),
+            [pins.stop, pins.go, pins.pause]]
+
+
+MOTOR_PWM_FREQ = 1000
+# A pump that wakes late catches up on missed steps (keeping its dose and
+# its phase deadline) unless it is this far behind, then it resyncs instead
+STEP_CATCHUP = 0.02   # s
+
+
+# -------------------------------------------------------------------
+# STATION
+# -------------------------------------------------------------------
+class Station:
+    """
+    Everything one rig owns: its gpio, pin map, two pump StepperDrivers,
+    the chew motor's two PWM channels and its own CycleScheduler. DeviceUI
+    drives one Station from its Controller's event loop; a Supervisor
+    drives any number of them from a single thread via timeline().
+    """
+    def __init__(self, name, gpio, pins, backend=None, step_rate=DEFAULT_STEP_RATE,
+                 clock=REAL_CLOCK):
+        self.name = name
+        self.gpio = gpio
+        self.pins = pins
+        self.clock = clock
+        self.backend = backend if backend is not None else make_backend(gpio)
+
+        self.pump1 = StepperDriver(self.backend, pins.pump1_enable, pins.pump1_coils, step_rate)
+        self.pump2 = StepperDriver(self.backend, pins.pump2_enable, pins.pump2_coils, step_rate)
+        self.pumps = {1: self.pump1, 2: self.pump2}   # recipe "pump" numbers
+        self.enable_pins = list(pins.pump1_enable) + list(pins.pump2_enable)  # cleared in one call
+        self.coil_pins = list(pins.pump1_coils) + list(pins.pump2_coils)
+
+        # hardware PWM on GPIO12/13 when the Pi offers it (Hardware_pwm.make_pwm)
+        pi = getattr(self.backend, "pi", None)   # reuse the steppers' pigpio connection
+        self.pwm_in1 = make_pwm(gpio, pins.motor_in1, MOTOR_PWM_FREQ, pi)
+        self.pwm_in2 = make_pwm(gpio, pins.motor_in2, MOTOR_PWM_FREQ, pi)
+        self.pwm_in1.start(0)
+        self.pwm_in2.start(0)
+
+        self.scheduler = CycleScheduler(clock.monotonic)
+        self.chew_axis = None   # optional closed-loop chew moves (Chew_axis.ChewAxis)
+
+        # run state when driven by a Supervisor
+        self.cycle = None
+        self.total_seconds = 0
+        self.cycle_count = 0
+        self.running = False
+        self.paused = False
+
+    def motor(self, in1, in2):
+        """Set both H-bridge PWM duties (in1 drives down, in2 drives up)."""
+        self.pwm_in1.ChangeDutyCycle(in1)
+        self.pwm_in2.ChangeDutyCycle(in2)
+
+    def pumps_off(self):
+        # through the stepper backend: with pigpio it alone owns the pump pins
+        # (they are never GPIO.setup() as outputs)
+        self.backend.write(self.enable_pins, [0] * len(self.enable_pins))
+
+    def safe(self):
+        """Motor released, pumps off and coils de-energised (safe from any thread)."""
+        self.motor(0, 0)
+        self.backend.halt()   # a playing wave would energise the coils again
+        self.pumps_off()
+        self.backend.write(self.coil_pins, [0] * len(self.coil_pins))
+
+    def close(self):
+        self.safe()
+        self.pwm_in1.stop()
+        self.pwm_in2.stop()
+
+    # --- cooperative run (one generator step per supervisor wake-up) ---
+    def timeline(self):
+        """
+        Generator that runs the compiled cycle on this station's scheduler.
+        It never sleeps: each yield is the absolute clock time at which it
+        wants to be resumed, or None to park until Supervisor.resume().
+
+        This is a second, simpler executor than DeviceUI's: commands run
+        strictly in order, chew moves are timed (chew_axis is not used),
+        and there is no telemetry log, run journal or latency profile.
+        """
+        sched = self.scheduler
+        try:
+            while self.running and sched.elapsed() < self.total_seconds:
+                if self.paused:
+                    self.safe()
+                    sched.pause()
+                    yield None
+                    sched.resume()
+                    continue
+
+                due = sched.next_cycle_due()
+                if self.clock.monotonic() < due:
+                    yield min(due, sched.time_at(self.total_seconds))
+                    continue
+
+                sched.begin_cycle()
+                for cmd in self.cycle.commands:
+                    deadline = sched.advance(cmd.duration)
+                    if cmd.action == 'pump':
+                        pump = self.pumps[cmd.args['pump']]
+                        steps = (pump.steps_for(cmd.args['volume']) if 'volume' in cmd.args
+                                 else pump.steps_in(cmd.duration))
+                        yield from self._pump_steps(pump, steps)
+                    elif cmd.action == 'motor':
+                        yield from self._motor_move(cmd.args, deadline)
+                    else:
+                        yield deadline
+                    sched.end_phase(cmd.name)
+                sched.end_cycle()
+                self.cycle_count += 1
+        finally:
+            self.running = False
+            self.safe()
+
+    def _pump_steps(self, pump, steps):
+        pump.energize()
+        try:
+            t = self.clock.monotonic()
+            for i, interval in enumerate(pump.intervals(steps)):
+                pump.step(i)
+                t += interval
+                now = self.clock.monotonic()
+                if t < now - STEP_CATCHUP:
+                    t = now   # far behind (e.g. a long stall): resync, don't burst
+                yield t
+        finally:
+            pump.release()
+
+    def _motor_move(self, args, deadline):
+        hold_pwm = args.get('hold_pwm', 0)
+        if args['direction'] == 'down':
+            self.motor(args['pwm'], 0)
+            yield deadline
+            self.motor(0, 0)
+        else:
+            self.motor(0, args['pwm'])
+            yield deadline
+            self.motor(0, hold_pwm)   # keep holding torque at the top if requested
+
+
+# -------------------------------------------------------------------
+# SUPERVISOR
+# -------------------------------------------------------------------
+class Supervisor:
+    """
+    Runs every started Station's timeline() on one thread. Wake-ups of all
+    stations share one heap ordered by due time, and the thread sleeps on a
+    Condition until the earliest one, so N rigs cost one thread (not a run
+    thread plus pump/motor workers per rig) and stepping for several pumps
+    interleaves on the same timeline.
+
+    Stations run Station.timeline(), not DeviceUI's executor: sequential
+    cycles with timed chew moves only (start() refuses pipelined cycles
+    and closed-loop chew axes), and no telemetry or run journal.
+    """
+    def __init__(self, stations, clock=REAL_CLOCK):
+        self.stations = {station.name: station for station in stations}
+        self.clock = clock
+        self._heap = []   # (due, seq, station, timeline generator)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._steps = {}   # station name -> its live timeline generator
+        self._closed = False
+        self._thread = None
+
+    def _push(self, when, station, steps):
+        heapq.heappush(self._heap, (when, next(self._seq), station, steps))
+        self._cond.notify_all()
+
+    def start(self, name, cycle, total_seconds, period):
+        """Start (or restart) a run on one station with a compiled cycle."""
+        station = self.stations[name]
+        if cycle.pipelined:
+            raise ValueError("Supervisor runs sequential cycles only (compile without pipelined)")
+        if station.chew_axis is not None:
+            raise ValueError(f"{name}: Supervisor runs timed chew moves only (chew_axis is set)")
+        with self._cond:
+            old = self._steps.pop(name, None)
+            if old is not None:
+                old.close()
+            station.cycle = cycle
+            station.total_seconds = total_seconds
+            station.cycle_count = 0
+            station.running = True
+            station.paused = False
+            station.scheduler.start(period)
+            steps = station.timeline()
+            self._steps[name] = steps
+            self._push(self.clock.monotonic(), station, steps)
+
+    def stop(self, name):
+        """Stop a station now: outputs go safe on the caller's thread."""
+        station = self.stations[name]
+        with self._cond:
+            steps = self._steps.pop(name, None)
+            if steps is not None:
+                steps.close()   # runs the timeline's cleanup: not running, outputs safe
+            station.running = False
+            station.safe()
+            self._cond.notify_all()
+
+    def pause(self, name):
+        """Halt at the end of the current cycle."""
+        self.stations[name].paused = True
+
+    def resume(self, name):
+        station = self.stations[name]
+        with self._cond:
+            if station.paused:
+                station.paused = False
+                steps = self._steps.get(name)
+                if steps is not None:
+                    self._push(self.clock.monotonic(), station, steps)
+
+    def watch_buttons(self, watcher, name, cycle, total_seconds, period):
+        """Wire a station's STOP/GO/PAUSE pins (External_buttons.ButtonWatcher)."""
+        station = self.stations[name]
+
+        def go():
+            if station.paused:
+                self.resume(name)
+            elif not station.running:
+                self.start(name, cycle, total_seconds, period)
+
+        watcher.on_press(station.pins.stop, lambda: self.stop(name))
+        watcher.on_press(station.pins.go, go)
+        watcher.on_press(station.pins.pause, lambda: self.pause(name))
+
+    def active(self):
+        return [s.name for s in self.stations.values() if s.running]
+
+    # --- the shared timing thread ---
+    def _next(self, stop_when_idle):
+        with self._cond:
+            while not self._closed:
+                if self._heap:
+                    remaining = self._heap[0][0] - self.clock.monotonic()
+                    if remaining <= 0:
+                        return heapq.heappop(self._heap)
+                    self.clock.wait(self._cond, remaining)
+                elif stop_when_idle and not any(s.running and not s.paused
+                                                 for s in self.stations.values()):
+                    return None
+                else:
+                    self.clock.wait(self._cond)
+            return None
+
+    def _loop(self, stop_when_idle=False):
+        # timeline steps never block, so they run under the lock; stop()
+        # from a button thread therefore never races a step in progress
+        while True:
+            entry = self._next(stop_when_idle)
+            if entry is None:
+                return
+            _, _, station, steps = entry
+            with self._cond:
+                if self._steps.get(station.name) is not steps:
+                    continue   # stopped or restarted since this wake-up was queued
+                try:
+                    when = next(steps)
+                except StopIteration:
+                    del self._steps[station.name]
+                    continue
+                if when is not None:   # None: parked until resume()
+                    self._push(when, station, steps)
+
+    def run(self):
+        """Run on the calling thread until no station has work left (headless)."""
+        self._loop(stop_when_idle=True)
+
+    def start_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        for station in self.stations.values():
+            station.running = False
+            station.close()
+
+
+# -------------------------------------------------------------------
+# SIMULATED MULTI-RIG RUN
+# -------------------------------------------------------------------
+def simulate(n_stations=4, minutes=5, chews=2, fluid_cycle=10.0):
+    """
+    N simulated rigs (each on its own SimulatedGPIO, like separate
+    expander boards) on one Supervisor and a fast-forward clock.
+    Returns the supervisor so the caller can inspect each station.
+    """
+    import os
+    from Cycle_recipe import compile_recipe, load_recipe
+    from Run_timing import VirtualClock
+    from Sim_rig import SimulatedGPIO
+
+    pins = PinMap((18, 15), (17, 27, 22, 23), (8, 11), (25, 24, 9, 10), 12, 13, 16, 1, 14)
+    clock = VirtualClock()
+    stations = []
+    for i in range(n_stations):
+        gpio = SimulatedGPIO(clock)
+        stations.append(Station(f"rig{i + 1}", gpio, pins, backend=gpio.stepper_backend(), clock=clock))
+        for pump in stations[-1].pumps.values():
+            pump.steps_per_ml = 200.0
+
+    recipe = load_recipe(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                      "recipes", "default_wear.json"))
+    params = {"INITIAL_WAIT": 1, "PUMP_DOSE_ML": 10.0, "MOTOR_SPEED_DOWN": 80,
+              "MOTOR_SPEED_UP": 80, "HOLD_PWM": 20, "MOTOR_DOWN_DURATION": 0.5,
+              "MOTOR_UP_DURATION": 0.5, "chews": chews, "fluid_cycle": fluid_cycle}
+    cycle = compile_recipe(recipe, params, dose_time=lambda pump, ml: stations[0].pumps[pump].dose_time(ml))
+
+    supervisor = Supervisor(stations, clock)
+    for station in stations:
+        supervisor.start(station.name, cycle, minutes * 60, fluid_cycle)
+    supervisor.run()
+    return supervisor
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    minutes = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    wall = time.perf_counter()
+    supervisor = simulate(n, minutes)
+    wall = time.perf_counter() - wall
+    print(f"{n} stations x {minutes:g} min simulated on one thread in {wall:.2f} s wall")
+    for station in supervisor.stations.values():
+        print(f"  {station.name}: {station.scheduler.report(station.total_seconds)}")
@@ -0,0 +1,535 @@
+#Stepper pulse engine shared by the pump scripts and the final UI
+import bisect
+import itertools
+import threading
+import time
+
+try:
+    import pigpio
+except ImportError:  # not installed (desktop preview) -> pure-Python fallback only
+    pigpio = None
+
+# Full-step sequence for bipolar stepper (IN1, IN2, IN3, IN4)
+FULL_STEP_SEQUENCE = (
+    (1, 0, 1, 0),
+    (0, 1, 1, 0),
+    (0, 1, 0, 1),
+    (1, 0, 0, 1),
+)
+
+DEFAULT_STEP_RATE = 1000  # steps/sec, same nominal rate as the old sleep(0.001) loops
+RAMP_SHAPES = ("trapezoid", "scurve")
+
+
+def phase_masks(pins, phases):
+    """Precompute (set_mask, clear_mask) GPIO bitmasks for each phase."""
+    masks = []
+    for phase in phases:
+        on = off = 0
+        for pin, level in zip(pins, phase):
+            if level:
+                on |= 1 << pin
+            else:
+                off |= 1 << pin
+        masks.append((on, off))
+    return masks
+
+
+# -------------------------------------------------------------------
+# RAMPS
+# -------------------------------------------------------------------
+class RampProfile:
+    """
+    Step intervals (s) that take a stepper from start_rate up to
+    cruise_rate, computed once per speed setting. "trapezoid" ramps the
+    rate linearly at accel (steps/s^2); "scurve" follows a smoothstep, so
+    acceleration (and the torque demand) builds up and dies away gently,
+    over the same ramp time. The ramp down is the same intervals reversed.
+    """
+    def __init__(self, start_rate, cruise_rate, accel, shape="trapezoid"):
+        if shape not in RAMP_SHAPES:
+            raise ValueError(f"unknown ramp shape '{shape}'")
+        if not 0 < start_rate < cruise_rate or accel <= 0:
+            raise ValueError("a ramp needs 0 < start_rate < cruise_rate and accel > 0")
+        ramp_time = (cruise_rate - start_rate) / accel
+        intervals = []
+        t = 0.0
+        while t < ramp_time:
+            x = t / ramp_time
+            if shape == "scurve":
+                x = x * x * (3 - 2 * x)
+            interval = 1.0 / (start_rate + (cruise_rate - start_rate) * x)
+            intervals.append(interval)
+            t += interval
+        self.shape = shape
+        self.up = tuple(intervals)
+        self.down = tuple(reversed(intervals))
+        self.elapsed = tuple(itertools.accumulate(intervals))   # time after each ramp step
+        self.duration = self.elapsed[-1] if intervals else 0.0
+
+
+def step_intervals(period, ramp, steps):
+    """
+    Delay after each step of a run: the ramp up (if any), cruise at period,
+    and for a counted run the ramp down, shortened symmetrically when the
+    run is too short to reach cruise speed. steps=None never ends.
+    """
+    up = ramp.up if ramp is not None else ()
+    if steps is None:
+        return itertools.chain(up, itertools.repeat(period))
+    k = min(len(up), steps // 2)
+    peak = period if k == len(up) else up[k]   # a short run's odd middle step
+    return itertools.chain(up[:k], itertools.repeat(peak, steps - 2 * k), up[:k][::-1])
+
+
+def ramp_segments(period, ramp, steps):
+    """
+    The same schedule as step_intervals() in runs: a list of (intervals,
+    count) where intervals is a tuple of per-step delays, or None for
+    count steps at period (count None: until stopped).
+    """
+    if ramp is None:
+        return [(None, steps)]
+    if steps is None:
+        return [(ramp.up, len(ramp.up)), (None, None)]
+    k = min(len(ramp.up), steps // 2)
+    if k == len(ramp.up):
+        segments = [(ramp.up, k), (None, steps - 2 * k), (ramp.down, k)]
+    else:   # too short to reach cruise speed
+        up = ramp.up[:k]
+        segments = [(up + ramp.up[k:k + steps - 2 * k] + up[::-1], steps)]
+    return [(intervals, n) for intervals, n in segments if n]
+
+
+# -------------------------------------------------------------------
+# BACKENDS
+# -------------------------------------------------------------------
+class PythonBackend:
+    """
+    Pure-Python fallback: plays phases from a thread using absolute
+    perf_counter deadlines, so the average step rate does not drift with
+    the time spent in GPIO calls. Each phase is applied as one multi-pin
+    GPIO.output(list, tuple) call. Works with RPi.GPIO or any object that
+    has setup()/output()/OUT.
+
+    Set profile to a Run_profiler.LatencyProfile to record each step
+    interval's error against the nominal period ("step_interval").
+    """
+    def __init__(self, gpio):
+        self.gpio = gpio
+        self.profile = None
+
+    def setup_outputs(self, pins):
+        for pin in pins:
+            self.gpio.setup(pin, self.gpio.OUT)
+            self.gpio.output(pin, 0)
+
+    def write(self, pins, levels):
+        self.gpio.output(list(pins), tuple(levels))
+
+    def play(self, pins, phases, period, steps=None, keep_running=None, cancel=None, ramp=None):
+        """
+        Step through phases; steps=None runs until keep_running() is False
+        or cancel (a Run_timing.CancelToken) fires. A cancel also cuts the
+        sleep between steps short, so playback ends within one step. With
+        a RampProfile the step intervals follow step_intervals().
+        """
+        output = self.gpio.output
+        pins = list(pins)
+        frames = [tuple(phase) for phase in phases]
+        n = len(frames)
+        intervals = step_intervals(period, ramp, steps)
+        done = 0
+        stamps = [] if self.profile is not None else None
+        expected = []
+        next_t = time.perf_counter()
+        for i, interval in enumerate(intervals):
+            if keep_running is not None and not keep_running():
+                break
+            if cancel is not None and cancel.cancelled:
+                break
+            output(pins, frames[i % n])
+            if stamps is not None:
+                stamps.append(time.perf_counter())
+                expected.append(interval)
+            done += 1
+            next_t += interval
+            delay = next_t - time.perf_counter()
+            if delay > 0:
+                if cancel is None:
+                    time.sleep(delay)
+                elif cancel.wait(delay):
+                    break
+            elif delay < -interval:
+                # fell more than a step behind: resync instead of bursting to catch up
+                next_t = time.perf_counter()
+        if stamps:
+            self.profile.extend("step_interval", [b - a - want for a, b, want
+                                                  in zip(stamps, stamps[1:], expected)])
+        return done
+
+    def halt(self, pins=None):
+        pass
+
+
+# pigpiod has one wave engine, shared by every PigpioBackend in this process
+_WAVE_ENGINE = threading.Lock()
+
+
+class PigpioBackend:
+    """
+    DMA-timed backend built on pigpio waves. Each phase becomes one pulse
+    (set/clear masks + delay), so step timing is generated by hardware and
+    does not depend on the GIL or scheduler.
+
+    Only one wave plays at a time, so play() calls take turns (a second
+    pump waits for the first to finish instead of cutting its wave off);
+    serial_playback tells planners (Cycle_recipe pump_resources) so.
+    """
+    MAX_LOOP = 65535        # largest repeat count a single wave_chain loop accepts
+    POLL_INTERVAL = 0.01    # how often keep_running() is checked while a wave plays (cancel stops it at once)
+    serial_playback = True
+
+    def __init__(self, pi):
+        self.pi = pi
+        self._waves = {}
+        self._playing = None   # coil pins of the wave this backend is playing
+        self._halted = False    # halt() stopped that wave (it did not play out)
+
+    def setup_outputs(self, pins):
+        for pin in pins:
+            self.pi.set_mode(pin, pigpio.OUTPUT)
+            self.pi.write(pin, 0)
+
+    def write(self, pins, levels):
+        # register-level: one bank set + one bank clear regardless of pin count
+        (on, off), = phase_masks(pins, [levels])
+        if on:
+            self.pi.set_bank_1(on)
+        if off:
+            self.pi.clear_bank_1(off)
+
+    def _wave(self, pins, phases, period):
+        key = (tuple(pins), tuple(phases), period)
+        wid = self._waves.get(key)
+        if wid is None:
+            delays = period if isinstance(period, tuple) else [period] * len(phases)
+            pulses = [pigpio.pulse(on, off, max(int(round(delay * 1e6)), 1))
+                      for (on, off), delay in zip(phase_masks(pins, phases), delays)]
+            self.pi.wave_add_new()
+            self.pi.wave_add_generic(pulses)
+            wid = self.pi.wave_create()
+            self._waves[key] = wid
+        return wid
+
+    def _ramp_wave(self, pins, phases, intervals, first):
+        # one pulse per ramp step, each with its own delay (cached like the cruise waves)
+        frames = tuple(phases[(first + i) % len(phases)] for i in range(len(intervals)))
+        return self._wave(pins, frames, intervals)
+
+    def _cruise_chain(self, pins, phases, period, steps, first, waves):
+        rotated = tuple(phases[(first + i) % len(phases)] for i in range(len(phases)))
+        wid = self._wave(pins, rotated, period)
+        waves.add(wid)
+        reps, rem = divmod(steps, len(phases))
+        chain = []
+        while reps:
+            chunk = min(reps, self.MAX_LOOP)
+            chain += [255, 0, wid, 255, 1, chunk & 0xFF, chunk >> 8]
+            reps -= chunk
+        if rem:
+            chain.append(self._wave(pins, rotated[:rem], period))
+            waves.add(chain[-1])
+        return chain
+
+    @staticmethod
+    def _called_off(keep_running, cancel):
+        return (keep_running is not None and not keep_running()) or (cancel is not None and cancel.cancelled)
+
+    def _acquire(self, keep_running, cancel):
+        # wait for the wave engine; False if the run was called off meanwhile
+        while not _WAVE_ENGINE.acquire(timeout=self.POLL_INTERVAL):
+            if self._called_off(keep_running, cancel):
+                return False
+        return True
+
+    def play(self, pins, phases, period, steps=None, keep_running=None, cancel=None, ramp=None):
+        if cancel is not None and cancel.cancelled:
+            return 0
+        if not self._acquire(keep_running, cancel):
+            return 0
+        try:
+            self._playing = tuple(pins)
+            self._halted = False
+            return self._play(pins, phases, period, steps, keep_running, cancel, ramp)
+        finally:
+            self._playing = None
+            _WAVE_ENGINE.release()
+
+    def _play(self, pins, phases, period, steps, keep_running, cancel, ramp):
+        start = time.perf_counter()
+        chain = []
+        waves = set()   # this run's wave ids, to tell its wave from anyone else's
+        first = 0
+        for intervals, n in ramp_segments(period, ramp, steps):
+            if intervals is not None:
+                chain.append(self._ramp_wave(pins, phases, intervals, first))
+                waves.add(chain[-1])
+            elif n is not None:
+                chain += self._cruise_chain(pins, phases, period, n, first, waves)
+            else:
+                break   # continuous cruise: repeated after the ramp below
+            first += n
+        if steps is None:
+            rotated = tuple(phases[(first + i) % len(phases)] for i in range(len(phases)))
+            cruise = self._wave(pins, rotated, period)
+            waves.add(cruise)
+            if chain:
+                self.pi.wave_send_once(chain[0])
+                self.pi.wave_send_using_mode(cruise, pigpio.WAVE_MODE_REPEAT_SYNC)
+            else:
+                self.pi.wave_send_repeat(cruise)
+        else:
+            self.pi.wave_chain(chain)
+
+        if cancel is not None:
+            cancel.on_cancel(self.pi.wave_tx_stop)   # stop the DMA wave from the cancelling thread
+        try:
+            while self.pi.wave_tx_busy():
+                if self.pi.wave_tx_at() not in waves:
+                    # another wave took the engine (e.g. another pigpio client): ours was cut off
+                    print(f"Stepper: wave on GPIO{list(pins)} replaced by another wave")
+                    break
+                if keep_running is not None and not keep_running():
+                    self.pi.wave_tx_stop()
+                    break
+                if cancel is None:
+                    time.sleep(self.POLL_INTERVAL)
+                elif cancel.wait(self.POLL_INTERVAL):
+                    break
+            else:
+                # the wave ended: played out, unless a cancel, keep_running or
+                # halt() stopped it between two polls
+                if not (self._halted or self._called_off(keep_running, cancel)):
+                    return steps
+        except BaseException:
+            self.pi.wave_tx_stop()
+            raise
+        finally:
+            if cancel is not None:
+                cancel.discard(self.pi.wave_tx_stop)
+        return _steps_within(time.perf_counter() - start, period, ramp)
+
+    def halt(self, pins=None):
+        """Stop the wave playing for pins (None: whatever is playing)."""
+        if pins is None or self._playing == tuple(pins):
+            self._halted = self._playing is not None
+            self.pi.wave_tx_stop()
+
+
+class RecordingGPIO:
+    """Mock GPIO that timestamps every output() call, for benchmarking."""
+    OUT = 'OUT'
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.events = []   # (timestamp, pin, level)
+        self.calls = 0     # output() calls, i.e. Python -> C transitions on real RPi.GPIO
+
+    def setup(self, pin, mode, **kwargs):
+        pass
+
+    def output(self, pin, value):
+        self.calls += 1
+        t = self.clock()
+        if isinstance(pin, (list, tuple)):
+            if not isinstance(value, (list, tuple)):
+                value = [value] * len(pin)
+            for p, v in zip(pin, value):
+                self.events.append((t, p, v))
+        else:
+            self.events.append((t, pin, value))
+
+
+def _steps_within(seconds, period, ramp):
+    # steps played in the first seconds of a run (for runs that were cut short)
+    if ramp is None or seconds <= ramp.duration:
+        return bisect.bisect_right(ramp.elapsed, seconds) if ramp is not None else int(seconds / period)
+    return len(ramp.up) + int((seconds - ramp.duration) / period)
+
+
+def make_backend(gpio):
+    """Use pigpio waves when the daemon is reachable, otherwise drive gpio directly."""
+    if hasattr(gpio, "stepper_backend"):   # simulated rig (Sim_rig.SimulatedGPIO)
+        return gpio.stepper_backend()
+    if pigpio is not None:
+        pi = pigpio.pi()
+        if pi.connected:
+            return PigpioBackend(pi)
+    return PythonBackend(gpio)
+
+
+# -------------------------------------------------------------------
+# STEPPER DRIVER
+# -------------------------------------------------------------------
+class StepperDriver:
+    """
+    One L298N-driven pump: enable pins (ENA/ENB) plus four coil pins.
+    The phase waveform is precomputed once; speed is set in steps/sec.
+    An optional ramp (set_rate with start_rate/accel) starts each run at a
+    rate the motor can pull in from standstill and accelerates to a faster
+    cruise rate, and a counted run decelerates again before it ends.
+    steps_per_ml (the pump's volumetric calibration) lets doses be given in mL.
+    """
+    def __init__(self, backend, enable_pins, coil_pins, step_rate=DEFAULT_STEP_RATE,
+                 sequence=FULL_STEP_SEQUENCE):
+        self.backend = backend
+        self.enable_pins = list(enable_pins)
+        self.coil_pins = list(coil_pins)
+        self.phases = tuple(tuple(phase) for phase in sequence)
+        self.steps_per_ml = None   # set from the rig's calibration
+        self.set_rate(step_rate)
+        backend.setup_outputs(self.enable_pins + self.coil_pins)
+
+    def set_rate(self, step_rate, start_rate=None, accel=None, shape="trapezoid"):
+        """Cruise at step_rate; with start_rate < step_rate and accel, ramp from start_rate."""
+        if step_rate <= 0:
+            raise ValueError("step_rate must be positive")
+        self.step_rate = step_rate
+        self.period = 1.0 / step_rate
+        self.ramp = None
+        if start_rate and accel and start_rate < step_rate:
+            self.ramp = RampProfile(start_rate, step_rate, accel, shape)
+
+    def intervals(self, steps=None):
+        """Delay after each step of a run of steps (None: unending), ramps included."""
+        return step_intervals(self.period, self.ramp, steps)
+
+    def duration_of(self, steps):
+        """How long a counted run of steps takes, ramps included."""
+        ramp = self.ramp
+        if ramp is None:
+            return steps * self.period
+        k = min(len(ramp.up), steps // 2)
+        ramp_time = ramp.elapsed[k - 1] if k else 0.0
+        peak = self.period if k == len(ramp.up) else ramp.up[k]
+        return 2 * ramp_time + (steps - 2 * k) * peak
+
+    def steps_in(self, seconds):
+        """The longest counted run (steps) that fits in seconds, ramps included."""
+        ramp = self.ramp
+        seconds += 1e-9   # duration_of(n) must map back to n despite float rounding
+        if ramp is None:
+            return int(seconds * self.step_rate)
+        if seconds >= 2 * ramp.duration:
+            return 2 * len(ramp.up) + int((seconds - 2 * ramp.duration) * self.step_rate)
+        k = bisect.bisect_right(ramp.elapsed, seconds / 2)
+        # an odd middle step fits if the spare time covers the next ramp interval
+        spare = seconds - 2 * (ramp.elapsed[k - 1] if k else 0.0)
+        return 2 * k + (1 if k < len(ramp.up) and spare >= ramp.up[k] else 0)
+
+    def steps_for(self, ml):
+        """Exact step count that delivers ml millilitres."""
+        if not self.steps_per_ml:
+            raise ValueError("pump has no steps_per_ml calibration")
+        return int(round(ml * self.steps_per_ml))
+
+    def dose_time(self, ml):
+        """How long dose(ml) takes, ramps included."""
+        return self.duration_of(self.steps_for(ml))
+
+    def energize(self):
+        self.backend.write(self.enable_pins, [1] * len(self.enable_pins))
+
+    def step(self, index):
+        """Apply phase index of the sequence; the caller owns step timing (see Station)."""
+        self.backend.write(self.coil_pins, self.phases[index % len(self.phases)])
+
+    def _play(self, steps, keep_running, cancel):
+        self.energize()
+        try:
+            return self.backend.play(self.coil_pins, self.phases, self.period, steps, keep_running,
+                                     cancel, self.ramp)
+        finally:
+            self.release()
+
+    def run_steps(self, steps, keep_running=None, cancel=None):
+        """Run an exact number of steps. Returns the steps actually played."""
+        return self._play(int(steps), keep_running, cancel)
+
+    def dose(self, ml, keep_running=None, cancel=None):
+        """Pump ml millilitres as fast as the ramp allows. Returns the steps actually played."""
+        return self.run_steps(self.steps_for(ml), keep_running, cancel)
+
+    def run_for(self, seconds, keep_running=None, cancel=None):
+        """Run for seconds at the current step rate (ramping up and down within them)."""
+        if self.ramp is None:
+            return self._play(int(round(seconds * self.step_rate)), keep_running, cancel)
+        return self._play(self.steps_in(seconds), keep_running, cancel)
+
+    def run_continuous(self, keep_running=None, cancel=None):
+        """Run until keep_running() returns False or cancel fires."""
+        return self._play(None, keep_running, cancel)
+
+    def release(self):
+        """De-energize the coils and drop the enables."""
+        self.backend.halt(self.coil_pins)
+        self.backend.write(self.coil_pins, [0] * len(self.coil_pins))
+        self.backend.write(self.enable_pins, [0] * len(self.enable_pins))
+
+
+# -------------------------------------------------------------------
+# BENCHMARK (old sleep loop vs StepperDriver, on the recording mock)
+# -------------------------------------------------------------------
+def _step_intervals(events, pin):
+    times = [t for t, p, _ in events if p == pin]
+    return [b - a for a, b in zip(times, times[1:])]
+
+
+def _summarize(name, intervals, calls_per_step):
+    intervals = sorted(intervals)
+    n = len(intervals)
+    mean = sum(intervals) / n
+    print(f"{name:>14}: {1 / mean:8.1f} steps/s  p50 {intervals[n // 2] * 1e3:.3f} ms  "
+          f"p99 {intervals[int(n * 0.99)] * 1e3:.3f} ms  max {intervals[-1] * 1e3:.3f} ms  "
+          f"{calls_per_step:.0f} GPIO calls/step")
+
+
+def benchmark(seconds=2.0, step_rate=DEFAULT_STEP_RATE):
+    pins = [17, 27, 22, 23]
+
+    gpio = RecordingGPIO()
+    end = time.time() + seconds
+    step_index = 0
+    while time.time() < end:
+        step = FULL_STEP_SEQUENCE[step_index]
+        gpio.output(pins[0], step[0])
+        gpio.output(pins[1], step[1])
+        gpio.output(pins[2], step[2])
+        gpio.output(pins[3], step[3])
+        step_index = (step_index + 1) % len(FULL_STEP_SEQUENCE)
+        time.sleep(1.0 / step_rate)
+    intervals = _step_intervals(gpio.events, pins[0])
+    _summarize("sleep loop", intervals, gpio.calls / (len(intervals) + 1))
+
+    gpio = RecordingGPIO()
+    driver = StepperDriver(PythonBackend(gpio), [18, 15], pins, step_rate)
+    gpio.events.clear()
+    gpio.calls = 0
+    steps = driver.run_for(seconds)
+    # the first write is the enable, the trailing ones are release(); keep only the steps
+    _summarize("StepperDriver", _step_intervals(gpio.events, pins[0])[:steps - 1],
+               (gpio.calls - 3) / steps)
+
+    # same dose (steps) from standstill: fixed rate vs ramped to twice the rate
+    dose = int(seconds * step_rate)
+    for shape in RAMP_SHAPES:
+        driver.set_rate(2 * step_rate, start_rate=step_rate, accel=4 * step_rate, shape=shape)
+        started = time.perf_counter()
+        driver.run_steps(dose)
+        print(f"{dose} steps ramped ({shape}): {time.perf_counter() - started:.3f} s "
+              f"(planned {driver.duration_of(dose):.3f} s, fixed rate {dose / step_rate:.3f} s)")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,50 @@
+#Typed events posted by worker threads and applied on the Tk main loop
+import queue
+from collections import namedtuple
+
+# Worker threads never touch Tk widgets or variables; they post one of these
+StateChanged = namedtuple("StateChanged", "state")
+ToggleChanged = namedtuple("ToggleChanged", "name value")
+MotorChanged = namedtuple("MotorChanged", "active")
+ProgressChanged = namedtuple("ProgressChanged", "elapsed cycle_count")
+HardwareChanged = namedtuple("HardwareChanged", "ready error")
+
+
+class UiEventQueue:
+    """
+    queue.SimpleQueue of UI events, drained on the Tk thread via root.after.
+    post() is safe from any thread; handlers (keyed by event type) always
+    run on the Tk thread, so they are the only code that touches widgets.
+    """
+    DRAIN_MS = 20
+
+    def __init__(self, root, handlers):
+        self.root = root
+        self.handlers = handlers
+        self._queue = queue.SimpleQueue()
+        self._after_id = None
+
+    def post(self, event):
+        if self.root is None:
+            return  # headless: nothing to render
+        self._queue.put(event)
+
+    def start(self):
+        if self._after_id is None:
+            self._after_id = self.root.after(self.DRAIN_MS, self._drain)
+
+    def _drain(self):
+        while True:
+            try:
+                event = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            handler = self.handlers.get(type(event))
+            if handler is not None:
+                handler(event)
+        self._after_id = self.root.after(self.DRAIN_MS, self._drain)
+
+    def stop(self):
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
@@ -0,0 +1,33 @@
+#Dirty-checking layer between DeviceUI state and the Tk widgets
+_MISSING = object()
+
+
+class ViewModel:
+    """
+    Remembers the options last applied to each widget and only calls
+    widget.config() with the ones that changed. Every widget update that
+    goes through here is counted as applied or skipped, so the savings of
+    the periodic refresh can be checked.
+    """
+    def __init__(self):
+        self._rendered = {}   # widget path -> {option: value}
+        self.applied = 0
+        self.skipped = 0
+
+    def render(self, widget, **options):
+        last = self._rendered.setdefault(str(widget), {})
+        changed = {k: v for k, v in options.items() if last.get(k, _MISSING) != v}
+        if not changed:
+            self.skipped += 1
+            return False
+        widget.config(**changed)
+        last.update(changed)
+        self.applied += 1
+        return True
+
+    def forget(self, widget):
+        """Drop the cache for a widget that was reconfigured outside the view model."""
+        self._rendered.pop(str(widget), None)
+
+    def stats(self):
+        return {"applied": self.applied, "skipped": self.skipped}